@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'MailOps.middleware.SessionSizeMiddleware',
+    'MailOps.middleware.GmailMetricsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -90,6 +92,27 @@ DATABASES = {
 }
 
 
+# Caches
+# "default" is per process (listings, prefetched pages). "mailops_shared" is seen by every worker
+# process and holds OAuth tokens with their refresh locks and the label lists and counts that push
+# notifications invalidate: a database table (created by migrate) unless MAILOPS_REDIS_URL points
+# at a Redis server (needs the redis package).
+MAILOPS_REDIS_URL = os.getenv('MAILOPS_REDIS_URL', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'mailops_shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': MAILOPS_REDIS_URL,
+    } if MAILOPS_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mailops_shared_cache',
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -144,4 +167,82 @@ GOOGLE_OAUTH_SCOPES = [
 ]
 
 
-    
\ No newline at end of file
+    
+# MailOps caching
+# Seconds to keep per-account label unread counts before refetching them from Gmail
+MAILOPS_LABEL_COUNTS_TTL = int(os.getenv('MAILOPS_LABEL_COUNTS_TTL', '120'))
+# Label counts of accounts with a Gmail push watch (pushes invalidate them, so they can live longer)
+MAILOPS_WATCHED_COUNTS_TTL = int(os.getenv('MAILOPS_WATCHED_COUNTS_TTL', '3600'))
+# Upper bound on unread messages mirrored into the local MailOps store when an account is first seeded
+MAILOPS_SYNC_SEED_LIMIT = int(os.getenv('MAILOPS_SYNC_SEED_LIMIT', '2000'))
+
+# MailOps background jobs
+# Seconds without progress after which a running bulk job (e.g. "Delete all") counts as lost and can be restarted
+MAILOPS_JOB_STALE_SECONDS = int(os.getenv('MAILOPS_JOB_STALE_SECONDS', '300'))
+
+# MailOps Gmail push notifications
+# Pub/Sub topic ("projects/<project>/topics/<topic>") for users.watch; empty keeps polling on every view
+MAILOPS_PUBSUB_TOPIC = os.getenv('MAILOPS_PUBSUB_TOPIC', '')
+# Shared secret expected as ?token= on the push subscription URL; empty disables the endpoint
+MAILOPS_PUSH_TOKEN = os.getenv('MAILOPS_PUSH_TOKEN', '')
+
+# Bearer token required to scrape /metrics; empty leaves the endpoint open
+MAILOPS_METRICS_TOKEN = os.getenv('MAILOPS_METRICS_TOKEN', '')
+
+# MailOps Gmail client pool
+# Override the Gmail API base URL (e.g. a local fake server for benchmarks); empty means Google
+MAILOPS_GMAIL_API_ENDPOINT = os.getenv('MAILOPS_GMAIL_API_ENDPOINT', '')
+MAILOPS_GMAIL_HTTP_TIMEOUT = int(os.getenv('MAILOPS_GMAIL_HTTP_TIMEOUT', '30'))
+# Accounts kept in the pool (least recently used are evicted)
+MAILOPS_GMAIL_POOL_MAX_ACCOUNTS = int(os.getenv('MAILOPS_GMAIL_POOL_MAX_ACCOUNTS', '64'))
+# Idle clients (each with its own keep-alive connection) kept per account
+MAILOPS_GMAIL_POOL_MAX_IDLE = int(os.getenv('MAILOPS_GMAIL_POOL_MAX_IDLE', '4'))
+# Seconds an idle client may sit in the pool before it is closed
+MAILOPS_GMAIL_POOL_IDLE_TIMEOUT = int(os.getenv('MAILOPS_GMAIL_POOL_IDLE_TIMEOUT', '300'))
+
+# OAuth tokens are refreshed in the background this many seconds before they expire
+MAILOPS_TOKEN_REFRESH_BEFORE = int(os.getenv('MAILOPS_TOKEN_REFRESH_BEFORE', '600'))
+MAILOPS_TOKEN_REFRESH_WORKERS = int(os.getenv('MAILOPS_TOKEN_REFRESH_WORKERS', '2'))
+# Seconds a request waits for another worker's refresh of the same account
+MAILOPS_TOKEN_REFRESH_WAIT = int(os.getenv('MAILOPS_TOKEN_REFRESH_WAIT', '10'))
+
+# MailOps batch engine
+# Retry rounds for failed batch sub-requests (429s, rate-limit 403s, 5xx)
+MAILOPS_BATCH_MAX_RETRIES = int(os.getenv('MAILOPS_BATCH_MAX_RETRIES', '4'))
+# Base delay in seconds for exponential backoff between retry rounds
+MAILOPS_BATCH_BACKOFF = float(os.getenv('MAILOPS_BATCH_BACKOFF', '0.5'))
+# Batches run concurrently (each on its own pooled client) for large id lists
+MAILOPS_BATCH_CONCURRENCY = int(os.getenv('MAILOPS_BATCH_CONCURRENCY', '4'))
+
+# Accounts synced in parallel when building the unified inbox
+MAILOPS_UNIFIED_CONCURRENCY = int(os.getenv('MAILOPS_UNIFIED_CONCURRENCY', '8'))
+# Serve dashboard_by_label and message_detail from async views (run under ASGI to benefit)
+MAILOPS_ASYNC_VIEWS = os.getenv('MAILOPS_ASYNC_VIEWS', 'False').lower() in ('1', 'true', 'yes')
+
+# Stream label pages: sidebar first, then rows as their metadata batches complete
+MAILOPS_STREAM_LIST = os.getenv('MAILOPS_STREAM_LIST', 'False').lower() in ('1', 'true', 'yes')
+# Messages per metadata batch while streaming (smaller batches show the first rows sooner)
+MAILOPS_STREAM_CHUNK = int(os.getenv('MAILOPS_STREAM_CHUNK', '5'))
+
+# Message pages loaded so far per listing (label or search), kept server-side per account
+MAILOPS_INBOX_CACHE_TTL = int(os.getenv('MAILOPS_INBOX_CACHE_TTL', '1800'))
+# Listings kept per account (least recently used are dropped)
+MAILOPS_INBOX_CACHE_LISTINGS = int(os.getenv('MAILOPS_INBOX_CACHE_LISTINGS', '8'))
+# Latest messages kept per listing
+MAILOPS_INBOX_CACHE_MESSAGES = int(os.getenv('MAILOPS_INBOX_CACHE_MESSAGES', '500'))
+
+# Total size in bytes of extracted message bodies kept in memory for message_detail
+MAILOPS_BODY_CACHE_BYTES = int(os.getenv('MAILOPS_BODY_CACHE_BYTES', str(32 * 1024 * 1024)))
+
+# Decoded attachments kept on disk for downloads (least recently used are evicted past the size)
+MAILOPS_ATTACHMENT_CACHE_DIR = os.getenv('MAILOPS_ATTACHMENT_CACHE_DIR', str(BASE_DIR / 'attachment_cache'))
+MAILOPS_ATTACHMENT_CACHE_BYTES = int(os.getenv('MAILOPS_ATTACHMENT_CACHE_BYTES', str(512 * 1024 * 1024)))
+
+# MailOps speculative prefetch (next page metadata and top unread bodies after a listing renders)
+# Gmail quota units per account per minute prefetching may spend; 0 disables it
+MAILOPS_PREFETCH_QUOTA = int(os.getenv('MAILOPS_PREFETCH_QUOTA', '500'))
+# Unread messages at the top of a page whose bodies are prefetched
+MAILOPS_PREFETCH_BODIES = int(os.getenv('MAILOPS_PREFETCH_BODIES', '5'))
+MAILOPS_PREFETCH_WORKERS = int(os.getenv('MAILOPS_PREFETCH_WORKERS', '2'))
+# Seconds a prefetched page waits to be used
+MAILOPS_PREFETCH_TTL = int(os.getenv('MAILOPS_PREFETCH_TTL', '120'))
@@ -1,3 +1,16 @@
 from django.contrib import admin
+from .models import MailAccount, MailMessage
 
-# Register your models here.
+
+@admin.register(MailAccount)
+class MailAccountAdmin(admin.ModelAdmin):
+    list_display = ['email', 'account_id', 'history_id', 'notified_history_id', 'watch_expires_at', 'synced_at']
+    search_fields = ['email', 'account_id']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+@admin.register(MailMessage)
+class MailMessageAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'sender', 'account', 'date']
+    list_filter = ['account']
+    search_fields = ['subject', 'sender', 'message_id']
@@ -0,0 +1,198 @@
+"""ASGI variants of the MailOps views that spend most of their time waiting on Gmail.
+
+``googleapiclient`` is synchronous, so each Gmail call runs in a worker thread
+with its own pooled client and independent calls are awaited together with
+:func:`asyncio.gather`. Session access, the local store, the shared cache (a
+database table by default) and template rendering stay on Django's
+thread-sensitive executor. Enabled with ``MAILOPS_ASYNC_VIEWS``.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.urls import reverse
+
+from .caches import invalidate_label_counts, message_bodies, message_size
+from .gmail import gmail_pool
+from .prefetch import prefetcher
+from .views import (
+    _cached_label_counts,
+    _cached_labels,
+    _fetch_label_counts,
+    _fetch_labels,
+    _fetch_message,
+    _get_session_creds,
+    _gmail_page,
+    _label_page_context,
+    _local_page,
+    _remember_page,
+    _split_labels,
+    _store_label_counts,
+    _store_labels,
+    _stream_label_page,
+    _take_prefetched_page,
+    _unread_total,
+)
+
+
+def _call_with_client(account_id, creds, func, *args):
+    with gmail_pool.service(account_id, creds) as gmail:
+        return func(gmail, *args)
+
+
+async def _gmail_call(account_id, creds, func, *args):
+    """Run ``func(gmail, *args)`` in a worker thread on a client checked out for that call alone."""
+    return await sync_to_async(_call_with_client, thread_sensitive=False)(account_id, creds, func, *args)
+
+
+async def _list_labels(account_id, creds) -> list[dict]:
+    """views._list_labels with the cache read and written off the Gmail worker thread."""
+    labels = await sync_to_async(_cached_labels)(account_id)
+    if labels is None:
+        labels = await _gmail_call(account_id, creds, _fetch_labels)
+        await sync_to_async(_store_labels)(account_id, labels)
+    return [dict(lb) for lb in labels]
+
+
+async def _enrich_labels_with_counts(account_id, creds, labels: list[dict]) -> tuple[list[dict], list[dict]]:
+    """views._enrich_labels_with_counts with only the labels.get batch on a Gmail worker thread."""
+    label_ids = [lb.get("id") for lb in labels if lb.get("id")]
+    counts = await sync_to_async(_cached_label_counts)(account_id, label_ids)
+    if counts is None:
+        counts = await _gmail_call(account_id, creds, _fetch_label_counts, label_ids)
+        await sync_to_async(_store_label_counts)(account_id, counts)
+    return _split_labels(labels, counts)
+
+
+def _session_state(request: HttpRequest):
+    accounts = request.session.get("accounts", {})
+    current_account_id = request.session.get("current_account")
+    return _get_session_creds(request), accounts, current_account_id, accounts.get(current_account_id, {})
+
+
+async def _aiter(iterator):
+    """Drive a synchronous (ORM-using) generator from the thread-sensitive executor."""
+    done = object()
+    while (chunk := await sync_to_async(next)(iterator, done)) is not done:
+        yield chunk
+
+
+def _mark_read(gmail, message_id: str) -> None:
+    gmail.users().messages().modify(userId="me", id=message_id, body={"removeLabelIds": ["UNREAD"]}).execute()
+
+
+async def dashboard_by_label(request: HttpRequest, label_id: str) -> HttpResponse:
+    creds, accounts, current_account_id, current_account = await sync_to_async(_session_state)(request)
+    if not creds:
+        return redirect(reverse("mailops:dashboard"))
+    page_token = request.GET.get("pageToken")
+    append_mode = request.GET.get("append") == "1"
+    query = (request.GET.get("q") or "").strip()
+
+    labels = await _list_labels(current_account_id, creds)
+    cache_key = f"unread_label__{label_id}__{query}" if query else f"unread_label__{label_id}"
+
+    if settings.MAILOPS_STREAM_LIST:
+        user_labels, system_labels = await _enrich_labels_with_counts(current_account_id, creds, labels)
+
+        def start():
+            context = {
+                "connected": True,
+                "current_account": current_account,
+                "accounts": accounts,
+                "labels_user": user_labels,
+                "labels_system": system_labels,
+                "all_messages_total": _unread_total(labels),
+                "query": query,
+                **_label_page_context(current_account_id, label_id, user_labels + system_labels),
+            }
+            return _stream_label_page(request, creds, context, label_id, query, page_token, append_mode, cache_key)
+
+        return StreamingHttpResponse(_aiter(await sync_to_async(start)()))
+
+    async def sidebar():
+        # Counts annotate their own copy; the page branch only reads ids and names
+        return await _enrich_labels_with_counts(current_account_id, creds, [dict(lb) for lb in labels])
+
+    async def page():
+        # The local store goes through the ORM, so keep it on the thread-sensitive executor
+        result = await sync_to_async(_call_with_client)(
+            current_account_id, creds, _local_page, current_account_id, current_account, labels, label_id, query, page_token
+        )
+        if result is None:
+            result = await sync_to_async(_take_prefetched_page)(current_account_id, label_id, query, page_token)
+        if result is None:
+            # No account id: the prefetched copy was looked up above, off the Gmail worker threads
+            result = await _gmail_call(current_account_id, creds, _gmail_page, label_id, query, page_token)
+        return result
+
+    (user_labels, system_labels), (messages, next_token) = await asyncio.gather(sidebar(), page())
+    all_messages_total = _unread_total(user_labels + system_labels)
+    prefetcher.schedule(current_account_id, creds, label_id, query, messages, next_token)
+
+    def finish():
+        shown = _remember_page(request, cache_key, messages, next_token, append_mode)
+        context = _label_page_context(current_account_id, label_id, user_labels + system_labels)
+        return render(
+            request,
+            "mailops/dashboard.html",
+            {
+                "connected": True,
+                "current_account": current_account,
+                "accounts": accounts,
+                "labels_user": user_labels,
+                "labels_system": system_labels,
+                "messages": shown,
+                "nextPageToken": next_token,
+                "all_messages_total": all_messages_total,
+                "query": query,
+                **context,
+            },
+        )
+
+    return await sync_to_async(finish)()
+
+
+async def message_detail(request: HttpRequest, message_id: str) -> HttpResponse:
+    creds, accounts, current_account_id, current_account = await sync_to_async(_session_state)(request)
+    if not creds:
+        return redirect(reverse("mailops:dashboard"))
+
+    cache_key = (current_account_id, message_id)
+    message = message_bodies.get(cache_key)
+    fetch = _gmail_call(current_account_id, creds, _fetch_message, message_id) if message is None else None
+    # Removing UNREAD is idempotent, so on a cold cache it is sent alongside the fetch
+    mark = None
+    if message is None or "UNREAD" in message["labelIds"]:
+        mark = _gmail_call(current_account_id, creds, _mark_read, message_id)
+    labels_call = _list_labels(current_account_id, creds)
+
+    results = await asyncio.gather(
+        fetch or asyncio.sleep(0, message), mark or asyncio.sleep(0), labels_call, return_exceptions=True
+    )
+    message, marked, all_labels = results
+    for result in (message, all_labels):
+        if isinstance(result, BaseException):
+            raise result
+    # Continue even if marking as read fails
+    if mark is not None and not isinstance(marked, BaseException) and "UNREAD" in message["labelIds"]:
+        message["labelIds"] = [lid for lid in message["labelIds"] if lid != "UNREAD"]
+        await sync_to_async(invalidate_label_counts)(current_account_id)
+    if fetch is not None:
+        message_bodies.set(cache_key, message, message_size(message))
+
+    user_labels = [l for l in all_labels if l.get("type") == "user"]
+
+    return await sync_to_async(render)(
+        request,
+        "mailops/message_detail.html",
+        {
+            "current_account": current_account,
+            "accounts": accounts,
+            "message": message,
+            "user_labels": user_labels,
+        },
+    )
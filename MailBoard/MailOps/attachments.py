@@ -0,0 +1,188 @@
+"""Attachment downloads served from a size-bounded on-disk cache.
+
+An attachment is fetched from Gmail once (``users.messages.attachments.get``,
+or the inline ``body.data`` of small parts), base64url-decoded in chunks
+straight into a file under ``MAILOPS_ATTACHMENT_CACHE_DIR`` and served from
+there with ``ETag`` and single-range ``Range`` support. Message parts never
+change, so the cached file stays valid until it is evicted: the least recently
+used files go once the cache holds more than ``MAILOPS_ATTACHMENT_CACHE_BYTES``.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .gmail import extract_attachments, find_part
+
+# Base64 characters decoded per step (a multiple of 4, about 192 KiB decoded)
+DECODE_CHUNK = 256 * 1024
+READ_CHUNK = 64 * 1024
+
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def attachment_key(account_id: str, message_id: str, part_id: str) -> str:
+    # Gmail hands out a new attachmentId on every fetch, so key by the stable part id
+    return hashlib.sha256(f"{account_id}\0{message_id}\0{part_id}".encode()).hexdigest()
+
+
+def decode_to_file(data: str, out) -> int:
+    """Write base64url ``data`` to ``out`` a chunk at a time; returns the decoded size."""
+    size = 0
+    for i in range(0, len(data), DECODE_CHUNK):
+        chunk = data[i:i + DECODE_CHUNK]
+        decoded = base64.urlsafe_b64decode(chunk + "=" * (-len(chunk) % 4))
+        out.write(decoded)
+        size += len(decoded)
+    return size
+
+
+class AttachmentCache:
+    """Decoded attachments on disk, each as ``<key>`` plus a ``<key>.json`` with its metadata."""
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        base = self.directory / key[:2] / key
+        return base, base.with_suffix(".json")
+
+    def get(self, key: str) -> tuple[Path, dict] | None:
+        path, meta_path = self._paths(key)
+        try:
+            meta = json.loads(meta_path.read_text())
+            # The modification time is the recency used for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return path, meta
+
+    def put(self, key: str, meta: dict, write) -> tuple[Path, dict]:
+        """Store what ``write(file)`` writes (it returns the byte count) under ``key``."""
+        path, meta_path = self._paths(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".part-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                meta = dict(meta, size=write(out))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        # Written last: get() treats an entry without metadata as missing
+        meta_path.write_text(json.dumps(meta))
+        self._evict(keep=path)
+        return path, meta
+
+    def _evict(self, keep: Path) -> None:
+        with self._lock:
+            files = []
+            for path in self.directory.glob("*/*"):
+                if path.suffix or path.name.startswith(".") or path == keep:
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            try:
+                total += keep.stat().st_size
+            except OSError:
+                pass
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                for victim in (path.with_suffix(".json"), path):
+                    try:
+                        victim.unlink()
+                    except OSError:
+                        pass
+                total -= size
+
+
+attachment_cache = AttachmentCache(settings.MAILOPS_ATTACHMENT_CACHE_DIR, settings.MAILOPS_ATTACHMENT_CACHE_BYTES)
+
+
+def fetch_attachment(gmail, account_id: str, message_id: str, part_id: str, message: dict | None = None) -> tuple[Path, dict]:
+    """Download one attachment into the cache; Http404 if the message has no such part.
+
+    ``message`` is the parsed message when message_detail has it cached, which
+    saves the messages.get call needed to find the part.
+    """
+    known = {a["partId"]: a for a in (message or {}).get("attachments") or []}
+    attachment = known.get(part_id)
+    data = None
+    if attachment is None or not attachment.get("attachmentId"):
+        payload = gmail.users().messages().get(userId="me", id=message_id, format="full").execute().get("payload")
+        part = find_part(payload, part_id)
+        attachment = next((a for a in extract_attachments(part) if a["partId"] == part_id), None) if part else None
+        if attachment is None:
+            raise Http404("Attachment not found")
+        data = None if attachment["attachmentId"] else part["body"]["data"]
+    if data is None:
+        data = gmail.users().messages().attachments().get(
+            userId="me", messageId=message_id, id=attachment["attachmentId"]
+        ).execute()["data"]
+    meta = {"filename": attachment["filename"], "mimeType": attachment["mimeType"]}
+    return attachment_cache.put(attachment_key(account_id, message_id, part_id), meta, lambda out: decode_to_file(data, out))
+
+
+def _read_range(f, start: int, length: int):
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(READ_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def attachment_response(request: HttpRequest, path: Path, meta: dict, etag: str) -> HttpResponse:
+    """Serve a cached attachment, answering If-None-Match with 304 and a single byte Range with 206.
+
+    The file is opened before returning, so FileNotFoundError reaches the caller when the entry
+    was evicted after :meth:`AttachmentCache.get` found it.
+    """
+    etag = f'"{etag}"'
+    size = meta["size"]
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponse(status=304)
+    else:
+        match = _RANGE_RE.fullmatch(request.headers.get("Range", "").strip())
+        # If-Range with another validator means the client's partial copy is stale: send it all
+        if match and request.headers.get("If-Range", etag) != etag:
+            match = None
+        if match and match.group(1) + match.group(2):
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), size - 1) if last else size - 1
+            else:
+                start, end = max(size - int(last), 0), size - 1
+            if start >= size or start > end:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+            response = StreamingHttpResponse(_read_range(open(path, "rb"), start, end - start + 1), status=206,
+                                             content_type=meta["mimeType"])
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+        else:
+            response = FileResponse(open(path, "rb"), content_type=meta["mimeType"])
+        response["Content-Disposition"] = content_disposition_header(True, meta["filename"])
+    response["ETag"] = etag
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
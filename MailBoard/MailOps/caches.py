@@ -0,0 +1,191 @@
+"""Server-side caches used by the MailOps views."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
+
+from .models import MailAccount
+
+# Seen by every worker process (see CACHES in settings), unlike ``cache``: OAuth tokens
+# and the label lists and counts that push notifications and label changes invalidate
+shared_cache = ConnectionProxy(caches, "mailops_shared")
+
+
+def label_counts_cache_key(account_id: str) -> str:
+    return f"mailops:label_counts:{account_id}"
+
+
+def labels_cache_key(account_id: str) -> str:
+    return f"mailops:labels:{account_id}"
+
+
+def inbox_pages_cache_key(account_id: str) -> str:
+    return f"mailops:inbox_pages:{account_id}"
+
+
+def prefetched_page_cache_key(account_id: str, label_id: str, query: str, page_token: str) -> str:
+    digest = hashlib.sha1(f"{label_id}\0{query}\0{page_token}".encode()).hexdigest()
+    return f"mailops:prefetched_page:{account_id}:{digest}"
+
+
+def token_cache_key(account_id: str) -> str:
+    return f"mailops:token:{account_id}"
+
+
+def token_lock_cache_key(account_id: str) -> str:
+    return f"mailops:token_lock:{account_id}"
+
+
+def label_counts_ttl(account_id: str | None) -> int:
+    """Seconds to cache labels and counts; push notifications invalidate watched accounts, so keep theirs longer."""
+    if account_id and MailAccount.objects.filter(account_id=account_id, watch_expires_at__gt=timezone.now()).exists():
+        return settings.MAILOPS_WATCHED_COUNTS_TTL
+    return settings.MAILOPS_LABEL_COUNTS_TTL
+
+
+def invalidate_label_counts(account_id: str | None) -> None:
+    """Drop the cached label list and counts so the next render refetches them.
+
+    They live in the shared cache, so this reaches every worker process, not
+    just the one that received the push or made the label change.
+    """
+    if account_id:
+        shared_cache.delete_many([label_counts_cache_key(account_id), labels_cache_key(account_id)])
+
+
+def adjust_label_counts(account_id: str | None, unread: dict[str, int], total: dict[str, int]) -> None:
+    """Apply known per-label count changes to the cached counts instead of refetching them."""
+    key = label_counts_cache_key(account_id) if account_id else None
+    counts = shared_cache.get(key) if key else None
+    if counts is None:
+        return
+    for label_id in set(unread) | set(total):
+        detail = counts.get(label_id)
+        if detail is None:
+            continue
+        detail["messagesUnread"] = max(detail.get("messagesUnread", 0) + unread.get(label_id, 0), 0)
+        detail["messagesTotal"] = max(detail.get("messagesTotal", 0) + total.get(label_id, 0), 0)
+    shared_cache.set(key, counts, label_counts_ttl(account_id))
+
+
+class ByteLRUCache:
+    """Thread-safe in-process LRU cache bounded by the total size of its values in bytes.
+
+    Callers pass the size of each value; the least recently used entries are
+    dropped until the total fits ``max_bytes``. Values larger than the whole
+    budget are not cached.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size: int) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def delete(self, key) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Extracted message bodies keyed by (account_id, message_id)
+message_bodies = ByteLRUCache(settings.MAILOPS_BODY_CACHE_BYTES)
+
+
+def message_size(message: dict) -> int:
+    """Approximate memory footprint of a cached message entry in bytes."""
+    return sum(len(value.encode("utf-8")) for value in message.values() if isinstance(value, str))
+
+
+# Field order of the compact message rows kept by remember_listing()
+MESSAGE_FIELDS = (
+    "id", "threadId", "internalDate", "snippet", "subject", "from", "to", "date", "labelIds",
+    # Set on unified inbox rows only
+    "account_id", "account_email",
+)
+
+
+def pack_message(message: dict) -> tuple:
+    return tuple(
+        tuple(message.get(field) or ()) if field == "labelIds" else message.get(field)
+        for field in MESSAGE_FIELDS
+    )
+
+
+def unpack_message(row: tuple) -> dict:
+    message = dict(zip(MESSAGE_FIELDS, row))
+    message["labelIds"] = list(message["labelIds"])
+    return message
+
+
+def cached_listing(account_id: str | None, listing: str) -> list[dict]:
+    """The messages :func:`remember_listing` holds for a listing, oldest page first."""
+    if not account_id:
+        return []
+    _, rows = (cache.get(inbox_pages_cache_key(account_id)) or {}).get(listing, (None, ()))
+    return [unpack_message(row) for row in rows]
+
+
+def remember_listing(account_id: str | None, listing: str, messages: list[dict], next_token: str | None, append: bool) -> list[dict]:
+    """Keep the pages loaded so far for one listing (label or search) of an account.
+
+    Each account has a single cache entry holding its most recently used
+    ``MAILOPS_INBOX_CACHE_LISTINGS`` listings, each capped at the latest
+    ``MAILOPS_INBOX_CACHE_MESSAGES`` messages stored as tuples. In append mode
+    the earlier pages are returned joined with ``messages``.
+    """
+    if not account_id:
+        return messages
+    key = inbox_pages_cache_key(account_id)
+    listings: OrderedDict = cache.get(key) or OrderedDict()
+    rows = tuple(pack_message(m) for m in messages)
+    if append:
+        _, earlier = listings.get(listing, (None, ()))
+        rows = (earlier + rows)[-settings.MAILOPS_INBOX_CACHE_MESSAGES:]
+        messages = [unpack_message(row) for row in rows]
+    listings.pop(listing, None)
+    listings[listing] = (next_token, rows)
+    while len(listings) > settings.MAILOPS_INBOX_CACHE_LISTINGS:
+        listings.popitem(last=False)
+    cache.set(key, listings, settings.MAILOPS_INBOX_CACHE_TTL)
+    return messages
@@ -0,0 +1,478 @@
+"""Local stand-in for the Gmail REST API, used by the MailOps benchmarks.
+
+:class:`FakeGmailServer` serves a :class:`FakeMailbox` over HTTP/1.1 with
+keep-alive, including the multipart ``/batch/gmail/v1`` endpoint, so the real
+``googleapiclient`` code paths can be driven without a Google account. Point
+MailOps at it with ``MAILOPS_GMAIL_API_ENDPOINT = server.url``.
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeMailbox:
+    """In-memory mailbox holding labels and messages in Gmail API shape."""
+
+    def __init__(self, labels: list[dict], messages: list[dict], history_id: int = 1000):
+        self.labels = {lb["id"]: lb for lb in labels}
+        # Newest first, like messages.list
+        self.messages = {m["id"]: m for m in sorted(messages, key=lambda m: -int(m["internalDate"]))}
+        self.history_id = history_id
+        # (historyId, history record) in order, for history.list
+        self.history: list[tuple[int, dict]] = []
+        self.watch_topic: str | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def synthetic(cls, messages: int = 500, user_labels: int = 20, seed: int = 0) -> "FakeMailbox":
+        rng = random.Random(seed)
+        # Separate stream, so adding attachments left the rest of the mailbox unchanged
+        attachment_rng = random.Random(seed + 1)
+        labels = [
+            {"id": lid, "name": lid, "type": "system"}
+            for lid in ("INBOX", "UNREAD", "SENT", "TRASH", "SPAM", "STARRED", "IMPORTANT")
+        ]
+        labels += [{"id": f"Label_{i}", "name": f"Label {i}", "type": "user"} for i in range(user_labels)]
+        user_label_ids = [lb["id"] for lb in labels if lb["type"] == "user"]
+        now_ms = 1_700_000_000_000
+        rows = []
+        for i in range(messages):
+            label_ids = ["INBOX"] + rng.sample(user_label_ids, k=min(2, len(user_label_ids)))
+            if rng.random() < 0.6:
+                label_ids.append("UNREAD")
+            text = f"Message {i} body. " * rng.randint(5, 50)
+            rows.append({
+                "id": f"{0x18a000000000 + i:x}",
+                "threadId": f"{0x18a000000000 + i // 3:x}",
+                "labelIds": label_ids,
+                "snippet": text[:100],
+                "internalDate": str(now_ms - i * 60_000),
+                "headers": {
+                    "Subject": f"Subject {i}",
+                    "From": f"Sender {i % 37} <sender{i % 37}@example.com>",
+                    "To": "me@example.com",
+                    "Date": "Tue, 14 Nov 2023 22:13:20 +0000",
+                },
+                "body": {"text/plain": text, "text/html": f"<p>{text}</p>"},
+            })
+            if i % 10 == 0:
+                rows[-1]["attachments"] = [{
+                    "filename": f"report-{i}.bin",
+                    "mimeType": "application/octet-stream",
+                    "data": attachment_rng.randbytes(attachment_rng.randint(1_000, 200_000)),
+                }]
+        return cls(labels, rows)
+
+    @classmethod
+    def record(cls, gmail, messages: int = 200) -> "FakeMailbox":
+        """Capture labels and the latest ``messages`` messages of a real account (via a Gmail client).
+
+        Attachment contents are not downloaded; they are replaced by zero bytes of the recorded size.
+        """
+        from .gmail import batch_get, extract_attachments, extract_bodies
+
+        labels = gmail.users().labels().list(userId="me").execute().get("labels", [])
+        ids: list[str] = []
+        page_token = None
+        while len(ids) < messages:
+            kwargs = {"userId": "me", "maxResults": min(500, messages - len(ids))}
+            if page_token:
+                kwargs["pageToken"] = page_token
+            resp = gmail.users().messages().list(**kwargs).execute()
+            ids.extend(m["id"] for m in resp.get("messages") or [])
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                break
+        responses = batch_get(
+            gmail, ids, lambda client, mid: client.users().messages().get(userId="me", id=mid, format="full")
+        )
+        rows = []
+        for mid in ids:
+            response = responses.get(mid)
+            if response is None:
+                continue
+            payload = response.get("payload") or {}
+            text, html = extract_bodies(payload)
+            rows.append({
+                "id": response["id"],
+                "threadId": response.get("threadId") or response["id"],
+                "labelIds": response.get("labelIds", []),
+                "snippet": response.get("snippet", ""),
+                "internalDate": response.get("internalDate", "0"),
+                "headers": {h["name"]: h["value"] for h in payload.get("headers", [])},
+                "body": {mime: body for mime, body in (("text/plain", text), ("text/html", html)) if body},
+                "attachments": [
+                    {"filename": a["filename"], "mimeType": a["mimeType"], "data": bytes(a["size"])}
+                    for a in extract_attachments(payload)
+                ],
+            })
+        return cls(labels, rows)
+
+    @classmethod
+    def from_fixture(cls, path) -> "FakeMailbox":
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        for message in fixture["messages"]:
+            for attachment in message.get("attachments", []):
+                attachment["data"] = base64.b64decode(attachment["data"])
+        return cls(fixture["labels"], fixture["messages"], fixture.get("history_id", 1000))
+
+    def to_fixture(self, path) -> None:
+        """Save the mailbox as JSON for :meth:`from_fixture`, so benchmark runs replay identical data."""
+        messages = []
+        for message in self.messages.values():
+            message = {k: v for k, v in message.items() if k != "historyId"}
+            message["attachments"] = [
+                dict(a, data=base64.b64encode(a["data"]).decode()) for a in message.get("attachments", [])
+            ]
+            messages.append(message)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"history_id": self.history_id, "labels": list(self.labels.values()), "messages": messages}, f)
+
+    # -- Gmail resources -------------------------------------------------
+
+    def label_resource(self, label_id: str) -> dict | None:
+        label = self.labels.get(label_id)
+        if label is None:
+            return None
+        with_label = [m for m in self.messages.values() if label_id in m["labelIds"]]
+        return dict(
+            label,
+            messagesTotal=len(with_label),
+            messagesUnread=sum(1 for m in with_label if "UNREAD" in m["labelIds"]),
+        )
+
+    def message_resource(self, message: dict, fmt: str, metadata_headers: list[str]) -> dict:
+        resource = {
+            "id": message["id"],
+            "threadId": message["threadId"],
+            "labelIds": list(message["labelIds"]),
+            "snippet": message["snippet"],
+            "internalDate": message["internalDate"],
+            "historyId": str(self.history_id),
+        }
+        if fmt == "minimal":
+            return resource
+        headers = [
+            {"name": name, "value": value} for name, value in message["headers"].items()
+            if fmt != "metadata" or not metadata_headers or name in metadata_headers
+        ]
+        payload = {"mimeType": "multipart/alternative", "headers": headers}
+        if fmt != "metadata":
+            payload["parts"] = [
+                {
+                    "partId": str(i),
+                    "mimeType": mime,
+                    "filename": "",
+                    "body": {"data": base64.urlsafe_b64encode(text.encode()).decode(), "size": len(text)},
+                }
+                for i, (mime, text) in enumerate(message["body"].items())
+            ]
+            # Attachment data is only served by attachments.get
+            payload["parts"] += [
+                {
+                    "partId": str(len(payload["parts"]) + i),
+                    "mimeType": attachment["mimeType"],
+                    "filename": attachment["filename"],
+                    "body": {"attachmentId": f"{message['id']}-{i}", "size": len(attachment["data"])},
+                }
+                for i, attachment in enumerate(message.get("attachments", []))
+            ]
+        resource["payload"] = payload
+        return resource
+
+    def list_messages(self, params: dict) -> dict:
+        label_ids = params.get("labelIds", [])
+        query = (params.get("q") or [""])[0]
+        hide = {"TRASH", "SPAM"} - set(label_ids)
+        before = re.search(r"\bbefore:(\d+)", query)
+        rows = [
+            m for m in self.messages.values()
+            if all(lid in m["labelIds"] for lid in label_ids) and not hide.intersection(m["labelIds"])
+            and ("is:unread" not in query or "UNREAD" in m["labelIds"])
+            and (before is None or int(m["internalDate"]) // 1000 < int(before.group(1)))
+        ]
+        offset = int((params.get("pageToken") or ["0"])[0])
+        size = int((params.get("maxResults") or ["100"])[0])
+        page = rows[offset:offset + size]
+        resp = {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page], "resultSizeEstimate": len(rows)}
+        if offset + size < len(rows):
+            resp["nextPageToken"] = str(offset + size)
+        return resp
+
+    def list_threads(self, params: dict) -> dict:
+        """threads.list: threads with a message matching the filters, ordered by their newest match."""
+        matching = self.list_messages(dict(params, pageToken=["0"], maxResults=[str(len(self.messages))]))
+        thread_ids = list(dict.fromkeys(m["threadId"] for m in matching["messages"]))
+        offset = int((params.get("pageToken") or ["0"])[0])
+        size = int((params.get("maxResults") or ["100"])[0])
+        page = [self.thread_resource(tid, "minimal", []) for tid in thread_ids[offset:offset + size]]
+        resp = {
+            "threads": [{"id": t["id"], "historyId": t["historyId"], "snippet": t["messages"][-1]["snippet"]} for t in page],
+            "resultSizeEstimate": len(thread_ids),
+        }
+        if offset + size < len(thread_ids):
+            resp["nextPageToken"] = str(offset + size)
+        return resp
+
+    def thread_resource(self, thread_id: str, fmt: str, metadata_headers: list[str]) -> dict | None:
+        # Oldest first, like threads.get
+        messages = [m for m in reversed(list(self.messages.values())) if m["threadId"] == thread_id]
+        if not messages:
+            return None
+        return {
+            "id": thread_id,
+            "historyId": str(max(m.get("historyId", 0) for m in messages)),
+            "messages": [self.message_resource(m, fmt, metadata_headers) for m in messages],
+        }
+
+    def _record(self, key: str, message: dict, label_ids: list[str] | None = None) -> None:
+        self.history_id += 1
+        message["historyId"] = self.history_id
+        item = {"message": {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}}
+        if label_ids is not None:
+            item["labelIds"] = label_ids
+        self.history.append((self.history_id, {"id": str(self.history_id), key: [item]}))
+
+    def modify(self, message_ids: list[str], add: list[str], remove: list[str]) -> None:
+        with self._lock:
+            for mid in message_ids:
+                message = self.messages.get(mid)
+                if message is None:
+                    continue
+                added = [lid for lid in add if lid not in message["labelIds"]]
+                removed = [lid for lid in message["labelIds"] if lid in remove]
+                message["labelIds"] = [lid for lid in message["labelIds"] if lid not in remove] + added
+                if added:
+                    self._record("labelsAdded", message, added)
+                if removed:
+                    self._record("labelsRemoved", message, removed)
+
+    def add_message(self, message: dict) -> int:
+        """Deliver a new message (same shape as :meth:`synthetic` rows); returns the new historyId."""
+        with self._lock:
+            self.messages = {message["id"]: message, **self.messages}
+            self._record("messagesAdded", message)
+            return self.history_id
+
+    def list_history(self, params: dict) -> tuple[int, dict]:
+        start = int((params.get("startHistoryId") or ["0"])[0])
+        with self._lock:
+            if self.history and start < self.history[0][0] - 1:
+                return 404, _error(404, "Requested entity was not found.")
+            records = [record for hid, record in self.history if hid > start]
+            return 200, {"history": records, "historyId": str(self.history_id)}
+
+    def handle(self, method: str, path: str, params: dict, body: dict | None) -> tuple[int, dict]:
+        """Route one Gmail REST call; returns (status, json body)."""
+        prefix = "/gmail/v1/users/me/"
+        if not path.startswith(prefix):
+            return 404, _error(404, "Not Found")
+        route = path[len(prefix):]
+        if method == "GET" and route == "profile":
+            return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id),
+                         "messagesTotal": len(self.messages)}
+        if method == "GET" and route == "labels":
+            return 200, {"labels": list(self.labels.values())}
+        if method == "GET" and route.startswith("labels/"):
+            label = self.label_resource(route[len("labels/"):])
+            return (200, label) if label else (404, _error(404, "Not Found"))
+        if method == "GET" and route == "history":
+            return self.list_history(params)
+        if method == "POST" and route == "watch":
+            self.watch_topic = (body or {}).get("topicName")
+            expiration = int(time.time() * 1000) + 7 * 24 * 3600 * 1000
+            return 200, {"historyId": str(self.history_id), "expiration": str(expiration)}
+        if method == "GET" and route == "messages":
+            return 200, self.list_messages(params)
+        if method == "POST" and route == "messages/batchModify":
+            body = body or {}
+            self.modify(body.get("ids", []), body.get("addLabelIds", []), body.get("removeLabelIds", []))
+            return 204, {}
+        if method == "GET" and route == "threads":
+            return 200, self.list_threads(params)
+        if method == "GET" and route.startswith("threads/"):
+            fmt = (params.get("format") or ["full"])[0]
+            thread = self.thread_resource(route[len("threads/"):], fmt, params.get("metadataHeaders", []))
+            return (200, thread) if thread else (404, _error(404, "Requested entity was not found."))
+        match = re.fullmatch(r"messages/([^/]+)/attachments/([^/]+)", route)
+        if method == "GET" and match:
+            message = self.messages.get(match.group(1)) or {}
+            for i, attachment in enumerate(message.get("attachments", [])):
+                if f"{message['id']}-{i}" == match.group(2):
+                    data = base64.urlsafe_b64encode(attachment["data"]).decode().rstrip("=")
+                    return 200, {"size": len(attachment["data"]), "data": data}
+            return 404, _error(404, "Requested entity was not found.")
+        match = re.fullmatch(r"messages/([^/]+)(/modify|/trash)?", route)
+        if match:
+            message = self.messages.get(match.group(1))
+            if message is None:
+                return 404, _error(404, "Requested entity was not found.")
+            action = match.group(2)
+            if method == "POST" and action == "/modify":
+                body = body or {}
+                self.modify([message["id"]], body.get("addLabelIds", []), body.get("removeLabelIds", []))
+            elif method == "POST" and action == "/trash":
+                self.modify([message["id"]], ["TRASH"], [])
+            elif method != "GET" or action:
+                return 404, _error(404, "Not Found")
+            fmt = (params.get("format") or ["full"])[0]
+            return 200, self.message_resource(message, fmt, params.get("metadataHeaders", []))
+        return 404, _error(404, "Not Found")
+
+
+def _error(status: int, message: str) -> dict:
+    return {"error": {"code": status, "message": message, "errors": [{"message": message, "reason": "notFound"}]}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "FakeGmailServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Count before writing so the client never sees a response missing from the stats
+        self.server.record(self.path, len(body))
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str) -> None:
+        raw = self._read_body()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        if method == "POST" and url.path == "/batch/gmail/v1":
+            body, content_type = self.server.handle_batch(raw, self.headers.get("Content-Type", ""))
+            self._send(200, body, content_type)
+            return
+        status, payload = self.server.answer(
+            method, url.path, parse_qs(url.query), json.loads(raw) if raw else None
+        )
+        self._send(status, json.dumps(payload).encode() if status != 204 else b"")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+class FakeGmailServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering Gmail API calls from a :class:`FakeMailbox`.
+
+    ``latency`` (seconds) is added to every HTTP request, batch or not, to
+    mimic the round trip to Google. ``rate_limit`` is the fraction of API
+    calls (batch sub-requests included) answered with a 429
+    ``rateLimitExceeded`` error instead.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, mailbox: FakeMailbox, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 rate_limit: float = 0.0, seed: int = 0):
+        super().__init__((host, port), _Handler)
+        self.mailbox = mailbox
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self._rng = random.Random(seed)
+        self.http_requests = 0
+        # API calls, counting every sub-request of a batch
+        self.api_calls = 0
+        self.rate_limited = 0
+        self.bytes_sent = 0
+        self._stats_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def record(self, path: str, size: int) -> None:
+        with self._stats_lock:
+            self.http_requests += 1
+            self.bytes_sent += size
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.http_requests = 0
+            self.api_calls = 0
+            self.rate_limited = 0
+            self.bytes_sent = 0
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "http_requests": self.http_requests,
+                "api_calls": self.api_calls,
+                "rate_limited": self.rate_limited,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def answer(self, method: str, path: str, params: dict, body: dict | None) -> tuple[int, dict]:
+        """Answer one API call, or reject it with a 429 at the configured rate."""
+        with self._stats_lock:
+            self.api_calls += 1
+            limited = self.rate_limit > 0 and self._rng.random() < self.rate_limit
+            if limited:
+                self.rate_limited += 1
+        if limited:
+            message = "Too many concurrent requests for user"
+            return 429, {"error": {"code": 429, "message": message,
+                                   "errors": [{"message": message, "reason": "rateLimitExceeded"}]}}
+        return self.mailbox.handle(method, path, params, body)
+
+    def handle_batch(self, raw: bytes, content_type: str) -> tuple[bytes, str]:
+        """Answer a multipart/mixed batch request the way Gmail's per-API batch endpoint does."""
+        envelope = Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n" + raw.decode("utf-8"))
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in envelope.get_payload():
+            request_line, _, rest = part.get_payload().partition("\n")
+            method, target, _ = request_line.strip().split(" ", 2)
+            _, _, sub_body = rest.replace("\r\n", "\n").partition("\n\n")
+            url = urlsplit(target)
+            status, payload = self.answer(
+                method, url.path, parse_qs(url.query), json.loads(sub_body) if sub_body.strip() else None
+            )
+            content_id = part["Content-ID"].strip("<>")
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        body = "".join(parts) + f"--{boundary}--\r\n"
+        return body.encode("utf-8"), f"multipart/mixed; boundary={boundary}"
+
+    def start(self) -> "FakeGmailServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeGmailServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,536 @@
+"""Gmail API helpers shared by the MailOps views and the local sync store."""
+
+import base64
+import contextvars
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urljoin
+
+import google_auth_httplib2
+import httplib2
+from django.conf import settings
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+
+from .metrics import (
+    InstrumentedHttp,
+    account_hash,
+    batch_method,
+    current_account,
+    record_batch,
+    record_batch_call,
+    record_retries,
+)
+
+
+GMAIL_API_ENDPOINT = "https://gmail.googleapis.com/"
+
+METADATA_HEADERS = ["Subject", "From", "Date", "To"]
+
+
+# Gmail batch prefers up to 100 calls per batch
+MAX_BATCH_SIZE = 100
+MIN_BATCH_SIZE = 10
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+# users.messages.batchModify accepts at most 1000 ids per call
+BATCH_MODIFY_LIMIT = 1000
+
+
+def _is_rate_limited(exc: Exception) -> bool:
+    if not isinstance(exc, HttpError):
+        return False
+    if exc.resp.status == 429:
+        return True
+    return exc.resp.status == 403 and any(
+        (detail or {}).get("reason") in RATE_LIMIT_REASONS for detail in (exc.error_details or [])
+        if isinstance(detail, dict)
+    )
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, HttpError):
+        return exc.resp.status in RETRYABLE_STATUSES or _is_rate_limited(exc)
+    # Transport failures (timeouts, resets, malformed batch responses)
+    return True
+
+
+class _BatchSizer:
+    """Process-wide batch size: halved when Gmail rate-limits us, grown back slowly otherwise."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.size = MAX_BATCH_SIZE
+
+    def on_rate_limited(self) -> None:
+        with self._lock:
+            self.size = max(MIN_BATCH_SIZE, self.size // 2)
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.size = min(MAX_BATCH_SIZE, self.size + MIN_BATCH_SIZE)
+
+
+batch_sizer = _BatchSizer()
+
+
+def gmail_batch_uri() -> str:
+    # Per-API batch endpoint (global batch is deprecated and returns 404)
+    return urljoin(settings.MAILOPS_GMAIL_API_ENDPOINT or GMAIL_API_ENDPOINT, "batch/gmail/v1")
+
+
+def _execute_chunk(gmail, keys: list[str], make_request) -> tuple[dict, list[str], bool]:
+    """Run one batch; returns (responses by key, keys worth retrying, whether we were rate limited)."""
+    responses: dict[str, dict] = {}
+    retry: list[str] = []
+    rate_limited = False
+
+    methods: dict[str, str] = {}
+
+    def _callback(request_id, response, exception):
+        nonlocal rate_limited
+        limited = exception is not None and _is_rate_limited(exception)
+        if exception is None:
+            record_batch_call(methods[request_id], 200)
+            if response is not None:
+                responses[request_id] = response
+        else:
+            status = exception.resp.status if isinstance(exception, HttpError) else "error"
+            record_batch_call(methods[request_id], status, limited)
+            if _is_retryable(exception):
+                retry.append(request_id)
+                rate_limited = rate_limited or limited
+        # Anything else (e.g. 404 for a message deleted meanwhile) is dropped
+
+    batch = BatchHttpRequest(callback=_callback, batch_uri=gmail_batch_uri())
+    for key in keys:
+        request = make_request(gmail, key)
+        methods[key] = batch_method(request)
+        batch.add(request, request_id=key)
+    if keys:
+        record_batch(methods[keys[0]], len(keys))
+    try:
+        batch.execute()
+    except Exception:
+        return responses, [k for k in keys if k not in responses], False
+    return responses, retry, rate_limited
+
+
+def batch_get(gmail, keys: list[str], make_request, chunk_size: int | None = None, on_chunk=None) -> dict[str, dict]:
+    """Execute ``make_request(gmail, key)`` for every key through batched calls.
+
+    Failed sub-requests that are worth retrying (429, rate-limit 403s, 5xx,
+    transport errors) are retried on their own with exponential backoff, and
+    the batch size shrinks while Gmail is rate limiting. When ``gmail`` comes
+    from :data:`gmail_pool` and there are several chunks, up to
+    ``MAILOPS_BATCH_CONCURRENCY`` batches run at once, each on its own client.
+    ``chunk_size`` caps the batch size, and ``on_chunk(responses)`` is called
+    with the responses of each batch as soon as it completes.
+    """
+    results: dict[str, dict] = {}
+    pending = list(dict.fromkeys(k for k in keys if k))
+    owner = gmail_pool.owner(gmail)
+    for attempt in range(settings.MAILOPS_BATCH_MAX_RETRIES + 1):
+        if not pending:
+            break
+        if attempt:
+            record_retries(len(pending))
+            delay = settings.MAILOPS_BATCH_BACKOFF * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay / 2))
+        size = min(batch_sizer.size, chunk_size or MAX_BATCH_SIZE)
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        workers = min(settings.MAILOPS_BATCH_CONCURRENCY, len(chunks)) if owner else 1
+        pending = []
+        rate_limited = False
+
+        def _collect(outcome):
+            nonlocal rate_limited
+            responses, retry, limited = outcome
+            results.update(responses)
+            pending.extend(retry)
+            rate_limited = rate_limited or limited
+            if on_chunk is not None and responses:
+                on_chunk(responses)
+
+        # Retry rounds stay sequential to give a throttled account some room
+        if workers <= 1 or attempt:
+            for chunk in chunks:
+                _collect(_execute_chunk(gmail, chunk, make_request))
+        else:
+            def _run(chunk):
+                with gmail_pool.service(*owner) as client:
+                    return _execute_chunk(client, chunk, make_request)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # Each thread runs in a copy of the caller's context, so its calls keep the view label
+                futures = [executor.submit(contextvars.copy_context().run, _run, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    _collect(future.result())
+        if rate_limited:
+            batch_sizer.on_rate_limited()
+        elif not pending:
+            batch_sizer.on_success()
+    return results
+
+
+def execute_with_retries(request):
+    """``request.execute()``, retrying 429s, rate-limit 403s, 5xx and transport errors with backoff.
+
+    Uses the batch engine's ``MAILOPS_BATCH_MAX_RETRIES`` and
+    ``MAILOPS_BATCH_BACKOFF``; the last error is raised once they run out.
+    """
+    for attempt in range(settings.MAILOPS_BATCH_MAX_RETRIES + 1):
+        if attempt:
+            record_retries(1)
+            delay = settings.MAILOPS_BATCH_BACKOFF * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay / 2))
+        try:
+            return request.execute()
+        except (HttpError, httplib2.HttpLib2Error, OSError) as exc:
+            if attempt == settings.MAILOPS_BATCH_MAX_RETRIES or not _is_retryable(exc):
+                raise
+
+
+def _get_metadata(gmail, message_id: str):
+    return gmail.users().messages().get(
+        userId="me",
+        id=message_id,
+        format="metadata",
+        metadataHeaders=METADATA_HEADERS,
+    )
+
+
+def parse_metadata(response: dict) -> dict:
+    headers = {h["name"]: h["value"] for h in response.get("payload", {}).get("headers", [])}
+    return {
+        "id": response.get("id"),
+        "threadId": response.get("threadId"),
+        "internalDate": response.get("internalDate"),
+        "snippet": response.get("snippet"),
+        "subject": headers.get("Subject"),
+        "from": headers.get("From"),
+        "to": headers.get("To"),
+        "date": headers.get("Date"),
+        "labelIds": response.get("labelIds", []),
+    }
+
+
+def batch_fetch_metadata(gmail, message_ids: list[str], chunk_size: int | None = None, on_rows=None) -> list[dict]:
+    """Fetch metadata for many messages via batched messages.get calls, keeping the given order.
+
+    ``on_rows(metas)`` receives each batch's parsed rows as they arrive (in no particular order).
+    """
+    on_chunk = None
+    if on_rows is not None:
+        def on_chunk(chunk):
+            on_rows([parse_metadata(response) for response in chunk.values()])
+    responses = batch_get(gmail, message_ids, _get_metadata, chunk_size=chunk_size, on_chunk=on_chunk)
+    return [parse_metadata(responses[mid]) for mid in dict.fromkeys(message_ids) if mid in responses]
+
+
+def extract_bodies(payload: dict) -> tuple[str, str]:
+    """Decode the first text/plain and text/html parts of a format="full" payload."""
+
+    def _decode(data: str) -> str:
+        try:
+            return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+        except Exception:
+            return ''
+
+    plain_text = ''
+    html_text = ''
+
+    def walk(part: dict):
+        nonlocal plain_text, html_text
+        # Stop as soon as the first text/plain and text/html parts are found
+        if not part or (plain_text and html_text):
+            return
+        data = part.get('body', {}).get('data')
+        mime = part.get('mimeType', '')
+        # Only decode the parts we keep (attachments and other types are skipped)
+        if data:
+            if mime == 'text/html' and not html_text:
+                html_text = _decode(data)
+            elif mime == 'text/plain' and not plain_text:
+                plain_text = _decode(data)
+        for child in part.get('parts', []) or []:
+            walk(child)
+
+    walk(payload)
+    # Fallbacks: if only one exists, copy into the other to avoid empty render
+    if html_text and not plain_text:
+        plain_text = ''
+    if plain_text and not html_text:
+        html_text = ''
+    return plain_text, html_text
+
+
+def extract_attachments(payload: dict) -> list[dict]:
+    """Parts of a format="full" payload that carry a filename (attachment or inline data)."""
+    attachments = []
+
+    def walk(part: dict):
+        if not part:
+            return
+        body = part.get("body") or {}
+        if part.get("filename") and (body.get("attachmentId") or body.get("data")):
+            attachments.append({
+                "partId": part.get("partId"),
+                "filename": part["filename"],
+                "mimeType": part.get("mimeType") or "application/octet-stream",
+                "size": body.get("size") or 0,
+                "attachmentId": body.get("attachmentId"),
+            })
+        for child in part.get("parts", []) or []:
+            walk(child)
+
+    walk(payload)
+    return attachments
+
+
+def find_part(payload: dict, part_id: str) -> dict | None:
+    """The part of a format="full" payload with the given partId."""
+    if not payload:
+        return None
+    if payload.get("partId") == part_id:
+        return payload
+    for child in payload.get("parts", []) or []:
+        found = find_part(child, part_id)
+        if found is not None:
+            return found
+    return None
+
+
+def parse_message(response: dict) -> dict:
+    """Shape a messages.get(format="full") response for message_detail."""
+    headers = {h["name"]: h["value"] for h in response.get("payload", {}).get("headers", [])}
+    body_plain, body_html = extract_bodies(response.get('payload'))
+    return {
+        "id": response.get("id"),
+        "subject": headers.get("Subject"),
+        "from": headers.get("From"),
+        "to": headers.get("To"),
+        "date": headers.get("Date"),
+        "snippet": response.get("snippet"),
+        "labelIds": response.get("labelIds", []),
+        "body_text": body_plain,
+        "body_html": body_html,
+        "attachments": extract_attachments(response.get("payload")),
+    }
+
+
+def _unread_list_kwargs(label_id: str, query: str, page_token: str | None, page_size: int) -> dict:
+    list_kwargs = {"userId": "me", "labelIds": list(dict.fromkeys([label_id, "UNREAD"])), "maxResults": page_size}
+    if page_token:
+        list_kwargs["pageToken"] = page_token
+    list_kwargs["q"] = f"is:unread {query}" if query else "is:unread"
+    return list_kwargs
+
+
+def list_unread_ids(gmail, label_id: str, query: str, page_token: str | None, page_size: int = 25) -> tuple[list[str], str | None]:
+    """messages.list one page of unread message ids in a label; returns (ids, next page token)."""
+    msgs_resp = gmail.users().messages().list(**_unread_list_kwargs(label_id, query, page_token, page_size)).execute()
+    return [m["id"] for m in (msgs_resp.get("messages") or [])], msgs_resp.get("nextPageToken")
+
+
+def list_unread_threads(gmail, label_id: str, query: str, page_token: str | None, page_size: int = 25) -> tuple[list[dict], str | None]:
+    """threads.list one page of threads with unread mail in a label; returns ([{id, historyId, snippet}], next page token)."""
+    resp = gmail.users().threads().list(**_unread_list_kwargs(label_id, query, page_token, page_size)).execute()
+    return resp.get("threads") or [], resp.get("nextPageToken")
+
+
+def _get_thread_metadata(gmail, thread_id: str):
+    return gmail.users().threads().get(
+        userId="me",
+        id=thread_id,
+        format="metadata",
+        metadataHeaders=METADATA_HEADERS,
+    )
+
+
+def parse_thread(response: dict) -> dict:
+    return {
+        "id": response.get("id"),
+        "historyId": response.get("historyId"),
+        "messages": [parse_metadata(m) for m in response.get("messages") or []],
+    }
+
+
+def batch_fetch_threads(gmail, thread_ids: list[str]) -> list[dict]:
+    """Fetch the message metadata of many threads via batched threads.get calls, keeping the given order."""
+    responses = batch_get(gmail, thread_ids, _get_thread_metadata)
+    return [parse_thread(responses[tid]) for tid in dict.fromkeys(thread_ids) if tid in responses]
+
+
+def modify_labels(gmail, message_ids: list[str], add: list[str], remove: list[str]) -> None:
+    """Add and remove labels in one call per message set.
+
+    A single message uses messages.modify (5 quota units), more use
+    batchModify (50 units) in chunks of ``BATCH_MODIFY_LIMIT`` ids.
+    """
+    if not message_ids or not (add or remove):
+        return
+    body = {"addLabelIds": list(add), "removeLabelIds": list(remove)}
+    if len(message_ids) == 1:
+        gmail.users().messages().modify(userId="me", id=message_ids[0], body=body).execute()
+        return
+    for i in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+        gmail.users().messages().batchModify(
+            userId="me", body=dict(body, ids=message_ids[i:i + BATCH_MODIFY_LIMIT])
+        ).execute()
+
+
+@lru_cache(maxsize=1)
+def _discovery_document() -> dict:
+    """Parsed Gmail v1 discovery document, loaded once per process."""
+    return json.loads(get_static_doc("gmail", "v1"))
+
+
+def build_service(creds, http: httplib2.Http | None = None, api_endpoint: str | None = None):
+    """Build a Gmail client from the cached discovery document.
+
+    The client talks through ``http`` (a fresh keep-alive ``httplib2.Http`` if
+    not given, counted in the MailOps metrics) wrapped in an ``AuthorizedHttp`` for ``creds``, against
+    ``MAILOPS_GMAIL_API_ENDPOINT`` when one is configured.
+    """
+    authed_http = google_auth_httplib2.AuthorizedHttp(
+        creds, http=http or InstrumentedHttp(timeout=settings.MAILOPS_GMAIL_HTTP_TIMEOUT)
+    )
+    api_endpoint = api_endpoint or settings.MAILOPS_GMAIL_API_ENDPOINT
+    client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    return build_from_document(_discovery_document(), http=authed_http, client_options=client_options)
+
+
+class _PooledClient:
+    __slots__ = ("service", "last_used")
+
+    def __init__(self, service):
+        self.service = service
+        self.last_used = time.monotonic()
+
+
+class GmailServicePool:
+    """Process-wide pool of Gmail clients, keyed by account id.
+
+    httplib2 connections are not thread-safe, so a client is checked out by one
+    thread at a time through :meth:`service`. Idle clients keep their HTTP
+    connection open for reuse. Accounts are evicted least-recently-used beyond
+    ``max_accounts``, and clients idle for longer than ``idle_timeout`` seconds
+    are dropped.
+    """
+
+    def __init__(self, max_accounts: int, max_idle_per_account: int, idle_timeout: float, api_endpoint: str | None = None):
+        self.max_accounts = max_accounts
+        self.max_idle_per_account = max_idle_per_account
+        self.idle_timeout = idle_timeout
+        self.api_endpoint = api_endpoint
+        self._lock = threading.Lock()
+        self._idle: OrderedDict[str, list[_PooledClient]] = OrderedDict()
+        # id(service) -> (account_id, creds) for clients currently checked out
+        self._owners: dict[int, tuple[str, object]] = {}
+
+    def _evict_expired(self, now: float) -> None:
+        for account_id in list(self._idle):
+            alive = [c for c in self._idle[account_id] if now - c.last_used < self.idle_timeout]
+            for client in self._idle[account_id]:
+                if client not in alive:
+                    _close(client)
+            if alive:
+                self._idle[account_id] = alive
+            else:
+                del self._idle[account_id]
+
+    def acquire(self, account_id: str, creds):
+        client = None
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            clients = self._idle.get(account_id)
+            if clients:
+                client = clients.pop()
+                self._idle.move_to_end(account_id)
+        if client is None:
+            client = _PooledClient(build_service(creds, api_endpoint=self.api_endpoint))
+        else:
+            # Tokens are refreshed per request, so always talk with the caller's credentials
+            client.service._http.credentials = creds
+        with self._lock:
+            self._owners[id(client.service)] = (account_id, creds)
+        return client
+
+    def release(self, account_id: str, client: _PooledClient) -> None:
+        client.last_used = time.monotonic()
+        with self._lock:
+            self._owners.pop(id(client.service), None)
+            clients = self._idle.setdefault(account_id, [])
+            self._idle.move_to_end(account_id)
+            if len(clients) < self.max_idle_per_account:
+                clients.append(client)
+                client = None
+            while len(self._idle) > self.max_accounts:
+                _, evicted = self._idle.popitem(last=False)
+                for c in evicted:
+                    _close(c)
+        if client is not None:
+            _close(client)
+
+    @contextmanager
+    def service(self, account_id: str | None, creds):
+        """Check out a Gmail client for ``account_id`` for the duration of the block."""
+        client = self.acquire(account_id or "", creds)
+        token = current_account.set(account_hash(account_id))
+        try:
+            yield client.service
+        finally:
+            current_account.reset(token)
+            self.release(account_id or "", client)
+
+    def owner(self, service) -> tuple[str, object] | None:
+        """(account_id, creds) of a checked-out client, so helpers can check out siblings."""
+        with self._lock:
+            return self._owners.get(id(service))
+
+    def idle_credentials(self, account_id: str):
+        """Credentials of an idle client of the account, for background work outside a request."""
+        with self._lock:
+            clients = self._idle.get(account_id) or []
+            return clients[-1].service._http.credentials if clients else None
+
+    def discard(self, account_id: str | None) -> None:
+        """Drop all idle clients of an account (e.g. when it is removed)."""
+        with self._lock:
+            clients = self._idle.pop(account_id or "", [])
+        for client in clients:
+            _close(client)
+
+    def clear(self) -> None:
+        with self._lock:
+            clients = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for client in clients:
+            _close(client)
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+
+def _close(client: _PooledClient) -> None:
+    try:
+        client.service.close()
+    except Exception:
+        pass
+
+
+gmail_pool = GmailServicePool(
+    max_accounts=settings.MAILOPS_GMAIL_POOL_MAX_ACCOUNTS,
+    max_idle_per_account=settings.MAILOPS_GMAIL_POOL_MAX_IDLE,
+    idle_timeout=settings.MAILOPS_GMAIL_POOL_IDLE_TIMEOUT,
+)
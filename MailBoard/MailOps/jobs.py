@@ -0,0 +1,88 @@
+"""Background bulk jobs for MailOps.
+
+Jobs run on a daemon thread of the worker that started them and record their
+progress on a :class:`~MailOps.models.MailJob` row, so any worker can answer
+the progress endpoint. A job whose row has not been touched for
+``MAILOPS_JOB_STALE_SECONDS`` lost its thread (the worker restarted or died)
+and is failed, so the label can be emptied again.
+"""
+
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .caches import invalidate_label_counts
+from .gmail import BATCH_MODIFY_LIMIT, execute_with_retries, gmail_pool
+from .models import MailJob
+from .sync import get_account
+
+
+TRASH_LABEL = "trash_label"
+ACTIVE_STATUSES = ("pending", "running")
+
+
+def fail_stale_jobs(jobs) -> int:
+    """Fail the active jobs of ``jobs`` that stopped reporting progress; returns how many."""
+    now = timezone.now()
+    return jobs.filter(
+        status__in=ACTIVE_STATUSES, updated_at__lt=now - timedelta(seconds=settings.MAILOPS_JOB_STALE_SECONDS)
+    ).update(status="failed", error="The job stopped making progress (its worker restarted?)", updated_at=now)
+
+
+def start_trash_label(account_id: str, email: str, creds, label_id: str) -> MailJob:
+    """Trash every message carrying ``label_id`` in the background, reusing a job already in flight."""
+    account = get_account(account_id, email)
+    fail_stale_jobs(account.jobs.filter(kind=TRASH_LABEL, label_id=label_id))
+    job = account.jobs.filter(kind=TRASH_LABEL, label_id=label_id, status__in=ACTIVE_STATUSES).first()
+    if job is not None:
+        return job
+    job = MailJob.objects.create(account=account, kind=TRASH_LABEL, label_id=label_id)
+    threading.Thread(
+        target=_run_trash_label, args=(job.pk, account_id, creds, label_id), daemon=True
+    ).start()
+    return job
+
+
+def _list_label_ids(gmail, label_id: str, on_page=None) -> list[str]:
+    ids: list[str] = []
+    next_token = None
+    while True:
+        kwargs = {"userId": "me", "labelIds": [label_id], "maxResults": 500, "fields": "messages/id,nextPageToken"}
+        if next_token:
+            kwargs["pageToken"] = next_token
+        resp = execute_with_retries(gmail.users().messages().list(**kwargs))
+        ids.extend(m["id"] for m in (resp.get("messages") or []))
+        if on_page is not None:
+            on_page()
+        next_token = resp.get("nextPageToken")
+        if not next_token:
+            return ids
+
+
+def _run_trash_label(job_id: int, account_id: str, creds, label_id: str) -> None:
+    # Updates only match while the job is active: once failed as stale, this thread stops
+    jobs = MailJob.objects.filter(pk=job_id, status__in=ACTIVE_STATUSES)
+    try:
+        if not jobs.update(status="running", updated_at=timezone.now()):
+            return
+        with gmail_pool.service(account_id, creds) as gmail:
+            # List everything first: trashed messages drop out of the label listing as we go
+            ids = _list_label_ids(gmail, label_id, on_page=lambda: jobs.update(updated_at=timezone.now()))
+            if not jobs.update(total=len(ids), updated_at=timezone.now()):
+                return
+            for i in range(0, len(ids), BATCH_MODIFY_LIMIT):
+                chunk = ids[i:i + BATCH_MODIFY_LIMIT]
+                execute_with_retries(gmail.users().messages().batchModify(
+                    userId="me", body={"ids": chunk, "addLabelIds": ["TRASH"]}
+                ))
+                if not jobs.update(done=i + len(chunk), updated_at=timezone.now()):
+                    return
+        jobs.update(status="completed", updated_at=timezone.now())
+    except Exception as exc:
+        jobs.update(status="failed", error=str(exc)[:1000], updated_at=timezone.now())
+    finally:
+        invalidate_label_counts(account_id)
+        connection.close()
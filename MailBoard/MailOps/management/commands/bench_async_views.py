@@ -0,0 +1,101 @@
+"""Benchmark: sync views against their async variants on a local fake Gmail server.
+
+Every Gmail HTTP request gets ``--latency`` seconds of simulated round trip,
+and the label-count and body caches are cleared before each request so both
+variants pay for the same Gmail calls::
+
+    python manage.py bench_async_views --requests 20 --latency 0.05
+"""
+
+import asyncio
+import json
+import statistics
+import time
+
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from MailOps import async_views, views
+from MailOps.caches import invalidate_label_counts, message_bodies
+from MailOps.fakegmail import FakeGmailServer, FakeMailbox
+from MailOps.gmail import gmail_pool
+from MailOps.prefetch import prefetcher
+
+ACCOUNT_ID = "bench"
+
+
+def _summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(samples) * 1000, 1),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+        "p95_ms": round(samples[max(int(len(samples) * 0.95) - 1, 0)] * 1000, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare latency of the sync and async MailOps views against a fake Gmail API"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20, help="Requests per view and variant")
+        parser.add_argument("--latency", type=float, default=0.05, help="Simulated Gmail round trip in seconds")
+        parser.add_argument("--labels", type=int, default=20, help="User labels in the fake mailbox")
+
+    def _request(self, path: str, **params):
+        request = RequestFactory().get(path, params)
+        request.session = SessionStore()
+        request.session["current_account"] = ACCOUNT_ID
+        request.session["accounts"] = {
+            ACCOUNT_ID: {"email": "me@example.com", "credentials": {"token": "bench-token", "scopes": []}},
+        }
+        return request
+
+    def _run(self, view, path: str, args: tuple, params: dict, server: FakeGmailServer) -> tuple[float, int]:
+        cache.clear()
+        # Labels and counts live in the shared cache, which cache.clear() leaves alone
+        invalidate_label_counts(ACCOUNT_ID)
+        message_bodies.clear()
+        request = self._request(path, **params)
+        server.reset_stats()
+        started = time.perf_counter()
+        if asyncio.iscoroutinefunction(view):
+            response = asyncio.run(view(request, *args))
+        else:
+            response = view(request, *args)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"{view.__module__}.{view.__name__} returned {response.status_code}")
+        return elapsed, server.http_requests
+
+    def handle(self, *args, **options):
+        n = options["requests"]
+        mailbox = FakeMailbox.synthetic(messages=max(n * 4, 200), user_labels=options["labels"])
+        unread_ids = [m["id"] for m in mailbox.messages.values() if "UNREAD" in m["labelIds"]]
+        results = {}
+        with FakeGmailServer(mailbox, latency=options["latency"]) as server, \
+                override_settings(MAILOPS_GMAIL_API_ENDPOINT=server.url):
+            gmail_pool.clear()
+            # Background prefetch would add requests of its own to the counts
+            quota_units, prefetcher.quota_units = prefetcher.quota_units, 0
+            try:
+                for i, (variant, module) in enumerate((("sync", views), ("async", async_views))):
+                    # Gmail operators skip the local store, so every page is listed from Gmail
+                    label = [
+                        self._run(module.dashboard_by_label, "/label/INBOX/", ("INBOX",), {"q": "from:sender1"}, server)
+                        for _ in range(n)
+                    ]
+                    # Opening a message marks it read, so each variant gets its own unread messages
+                    detail = [
+                        self._run(module.message_detail, f"/message/{mid}/", (mid,), {}, server)
+                        for mid in unread_ids[i * n:(i + 1) * n]
+                    ]
+                    results[variant] = {
+                        "dashboard_by_label": dict(_summary([s for s, _ in label]), http_requests=label[0][1]),
+                        "message_detail": dict(_summary([s for s, _ in detail]), http_requests=detail[0][1]),
+                    }
+            finally:
+                prefetcher.quota_units = quota_units
+                gmail_pool.clear()
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,98 @@
+"""Microbenchmark: per-request Gmail client setup with build() versus the service pool.
+
+Runs against a local keep-alive HTTP server that answers labels.list, so no
+Google account or network access is needed::
+
+    python manage.py bench_gmail_service --requests 200
+"""
+
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from MailOps.gmail import GmailServicePool
+
+
+class _LabelsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_GET(self):
+        body = json.dumps({"labels": [{"id": "INBOX", "name": "INBOX", "type": "system"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _summary(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare per-request Gmail client overhead of build() against the pooled service"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Requests to simulate per strategy")
+
+    def handle(self, *args, **options):
+        n = options["requests"]
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _LabelsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{server.server_address[1]}/"
+        creds = Credentials(token="bench-token")
+        try:
+            results = {}
+
+            _LabelsHandler.connections = 0
+            setup, total = [], []
+            for _ in range(n):
+                started = time.perf_counter()
+                gmail = build("gmail", "v1", credentials=creds, client_options={"api_endpoint": endpoint})
+                built = time.perf_counter()
+                gmail.users().labels().list(userId="me").execute()
+                setup.append(built - started)
+                total.append(time.perf_counter() - started)
+            results["build_per_request"] = {
+                "setup": _summary(setup), "request": _summary(total), "connections": _LabelsHandler.connections,
+            }
+
+            _LabelsHandler.connections = 0
+            pool = GmailServicePool(max_accounts=8, max_idle_per_account=2, idle_timeout=300, api_endpoint=endpoint)
+            setup, total = [], []
+            for _ in range(n):
+                started = time.perf_counter()
+                with pool.service("bench", creds) as gmail:
+                    built = time.perf_counter()
+                    gmail.users().labels().list(userId="me").execute()
+                setup.append(built - started)
+                total.append(time.perf_counter() - started)
+            pool.clear()
+            results["pooled"] = {
+                "setup": _summary(setup), "request": _summary(total), "connections": _LabelsHandler.connections,
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,183 @@
+"""Benchmark suite: the main MailOps views against a local fake Gmail API.
+
+The fake server replays a recorded fixture (see ``record_gmail_fixture``) or a
+seeded synthetic mailbox, adds ``--latency`` seconds to every HTTP request and
+answers a ``--rate-limit`` fraction of API calls with 429s. Each view runs
+``--requests`` times from ``--concurrency`` threads, starting from cold caches
+and an empty local store, and the results are written as JSON to diff between
+commits::
+
+    python manage.py bench_mailops --latency 0.05 --rate-limit 0.02 --concurrency 4 --output bench.json
+
+``dashboard`` itself redirects to the Inbox, so it only measures that hop.
+``label_delete_all`` runs one job at a time (jobs on a label are single-flight);
+its latency is measured until the background job finishes.
+"""
+
+import json
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from MailOps import views
+from MailOps.caches import invalidate_label_counts, message_bodies
+from MailOps.fakegmail import FakeGmailServer, FakeMailbox
+from MailOps.gmail import gmail_pool
+from MailOps.models import MailAccount, MailJob
+from MailOps.prefetch import prefetcher
+
+ACCOUNT_ID = "bench"
+SCRAPE_LABEL = {"id": "Label_bench_scrape", "name": "scrape", "type": "user"}
+VIEWS = ("dashboard", "dashboard_by_label", "message_detail", "label_delete_all")
+JOB_POLL = 0.01
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted ``samples``, in milliseconds."""
+    return round(samples[max(math.ceil(pct / 100 * len(samples)) - 1, 0)] * 1000, 1)
+
+
+class Command(BaseCommand):
+    help = "Benchmark MailOps views against a fake Gmail API with latency and 429 injection"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fixture", help="Mailbox fixture to replay (default: a synthetic mailbox)")
+        parser.add_argument("--save-fixture", help="Write the mailbox used to this file before the run")
+        parser.add_argument("--messages", type=int, default=500, help="Messages in the synthetic mailbox")
+        parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic mailbox and 429 injection")
+        parser.add_argument("--latency", type=float, default=0.05, help="Simulated Gmail round trip in seconds")
+        parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of API calls answered with 429")
+        parser.add_argument("--requests", type=int, default=20, help="Requests per view")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests per view")
+        parser.add_argument("--delete-batch", type=int, default=50, help="Messages in the label label_delete_all trashes")
+        parser.add_argument("--views", nargs="+", choices=VIEWS, default=list(VIEWS), help="Views to run")
+        parser.add_argument("--output", help="Write the JSON results to this file")
+
+    def _request(self, method: str, path: str, **extra):
+        request = getattr(RequestFactory(), method)(path, **extra)
+        request.session = SessionStore()
+        request.session["current_account"] = ACCOUNT_ID
+        request.session["accounts"] = {
+            ACCOUNT_ID: {"email": "me@example.com", "credentials": {"token": "bench-token", "scopes": []}},
+        }
+        return request
+
+    def _reset(self) -> None:
+        cache.clear()
+        # Labels and counts live in the shared cache, which cache.clear() leaves alone
+        invalidate_label_counts(ACCOUNT_ID)
+        message_bodies.clear()
+        gmail_pool.clear()
+        MailAccount.objects.filter(account_id=ACCOUNT_ID).delete()
+
+    def _call(self, name: str, arg: str | None) -> bool:
+        try:
+            if name == "dashboard":
+                response = views.dashboard(self._request("get", "/"))
+            elif name == "dashboard_by_label":
+                response = views.dashboard_by_label(self._request("get", f"/label/{arg}/"), arg)
+            elif name == "message_detail":
+                response = views.message_detail(self._request("get", f"/message/{arg}/"), arg)
+            else:
+                request = self._request("post", f"/label/{arg}/delete_all/", HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+                response = views.label_delete_all(request, arg)
+                job_id = json.loads(response.content)["id"]
+                while (status := MailJob.objects.get(pk=job_id).status) in ("pending", "running"):
+                    time.sleep(JOB_POLL)
+                return response.status_code == 202 and status == "completed"
+            return response.status_code < 400
+        except Exception:
+            return False
+        finally:
+            connection.close()
+
+    def _label_scrape(self, mailbox: FakeMailbox, count: int) -> None:
+        with mailbox._lock:
+            candidates = [m for m in mailbox.messages.values() if "TRASH" not in m["labelIds"]]
+            for message in candidates[:count]:
+                if SCRAPE_LABEL["id"] not in message["labelIds"]:
+                    message["labelIds"].append(SCRAPE_LABEL["id"])
+
+    def _run_view(self, name: str, mailbox: FakeMailbox, server: FakeGmailServer, options: dict) -> dict:
+        n = options["requests"]
+        concurrency = options["concurrency"]
+        if name == "message_detail":
+            # Opening a message marks it read, so every request gets its own unread message when there are enough
+            unread = [m["id"] for m in mailbox.messages.values() if "UNREAD" in m["labelIds"]] or list(mailbox.messages)
+            args = [unread[i % len(unread)] for i in range(n)]
+        elif name == "label_delete_all":
+            args = [SCRAPE_LABEL["id"]] * n
+            concurrency = 1
+        else:
+            args = ["INBOX"] * n
+
+        def timed(arg):
+            if name == "label_delete_all":
+                self._label_scrape(mailbox, options["delete_batch"])
+            started = time.perf_counter()
+            ok = self._call(name, arg)
+            return time.perf_counter() - started, ok
+
+        self._reset()
+        server.reset_stats()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed, args))
+        wall = time.perf_counter() - started
+        stats = server.stats()
+
+        samples = sorted(elapsed for elapsed, _ in outcomes)
+        return {
+            "requests": n,
+            "concurrency": concurrency,
+            "errors": sum(1 for _, ok in outcomes if not ok),
+            "mean_ms": round(statistics.fmean(samples) * 1000, 1),
+            "p50_ms": _percentile(samples, 50),
+            "p95_ms": _percentile(samples, 95),
+            "p99_ms": _percentile(samples, 99),
+            "throughput_rps": round(n / wall, 2),
+            "gmail_http_requests_per_view": round(stats["http_requests"] / n, 2),
+            "gmail_api_calls_per_view": round(stats["api_calls"] / n, 2),
+            "rate_limited_calls": stats["rate_limited"],
+            "bytes_per_view": round(stats["bytes_sent"] / n),
+        }
+
+    def handle(self, *args, **options):
+        if options["fixture"]:
+            mailbox = FakeMailbox.from_fixture(options["fixture"])
+        else:
+            mailbox = FakeMailbox.synthetic(messages=options["messages"], seed=options["seed"])
+        if options["save_fixture"]:
+            mailbox.to_fixture(options["save_fixture"])
+        mailbox.labels.setdefault(SCRAPE_LABEL["id"], dict(SCRAPE_LABEL))
+
+        results = {
+            "config": {
+                key: options[key] for key in
+                ("fixture", "messages", "seed", "latency", "rate_limit", "requests", "concurrency", "delete_batch")
+            },
+            "views": {},
+        }
+        server = FakeGmailServer(mailbox, latency=options["latency"], rate_limit=options["rate_limit"], seed=options["seed"])
+        with server, override_settings(MAILOPS_GMAIL_API_ENDPOINT=server.url):
+            # Background prefetch would add requests of its own to the counts
+            quota_units, prefetcher.quota_units = prefetcher.quota_units, 0
+            try:
+                # label_delete_all trashes messages, so it runs after the views that read them
+                for name in sorted(options["views"], key=VIEWS.index):
+                    results["views"][name] = self._run_view(name, mailbox, server, options)
+            finally:
+                prefetcher.quota_units = quota_units
+                self._reset()
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,39 @@
+"""Stand-in for Pub/Sub: post a Gmail push notification to the MailOps push endpoint.
+
+    python manage.py publish_fake_push me@example.com 123456 \\
+        --url http://localhost:8000/gmail/push/ --token "$MAILOPS_PUSH_TOKEN"
+"""
+
+import json
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from MailOps.push import push_body
+
+
+class Command(BaseCommand):
+    help = "Post a fake Gmail users.watch notification in Pub/Sub push format"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="emailAddress of the changed mailbox")
+        parser.add_argument("history_id", type=int, help="historyId carried by the notification")
+        parser.add_argument("--url", default="http://localhost:8000/gmail/push/", help="Push endpoint URL")
+        parser.add_argument("--token", default=None, help="Push token (defaults to MAILOPS_PUSH_TOKEN)")
+
+    def handle(self, *args, **options):
+        token = options["token"] if options["token"] is not None else settings.MAILOPS_PUSH_TOKEN
+        url = f"{options['url']}?{urlencode({'token': token})}"
+        body = json.dumps(push_body(options["email"], options["history_id"])).encode()
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            raise CommandError(f"push endpoint answered {exc.code}") from exc
+        except urllib.error.URLError as exc:
+            raise CommandError(f"could not reach {options['url']}: {exc.reason}") from exc
+        self.stdout.write(f"delivered (HTTP {status})")
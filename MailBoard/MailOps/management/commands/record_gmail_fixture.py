@@ -0,0 +1,28 @@
+"""Record a Gmail account into a fixture that ``bench_mailops --fixture`` replays.
+
+Needs an authorized-user credentials file (``token``, ``refresh_token``,
+``client_id``, ``client_secret``) with Gmail read access::
+
+    python manage.py record_gmail_fixture --credentials authorized_user.json --messages 300 mailbox.json
+"""
+
+from django.core.management.base import BaseCommand
+from google.oauth2.credentials import Credentials
+
+from MailOps.fakegmail import FakeMailbox
+from MailOps.gmail import build_service
+
+
+class Command(BaseCommand):
+    help = "Save labels and recent messages of a Gmail account as a fake Gmail fixture"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Fixture file to write")
+        parser.add_argument("--credentials", required=True, help="Authorized-user credentials JSON file")
+        parser.add_argument("--messages", type=int, default=200, help="Most recent messages to record")
+
+    def handle(self, *args, **options):
+        creds = Credentials.from_authorized_user_file(options["credentials"])
+        mailbox = FakeMailbox.record(build_service(creds), messages=options["messages"])
+        mailbox.to_fixture(options["output"])
+        self.stdout.write(f"Recorded {len(mailbox.messages)} messages and {len(mailbox.labels)} labels to {options['output']}")
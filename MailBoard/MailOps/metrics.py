@@ -0,0 +1,199 @@
+"""Gmail API call metrics, exposed in the Prometheus text format at ``/metrics``.
+
+Every Gmail client talks through :class:`InstrumentedHttp`, which counts and
+times each HTTP request. Calls are labelled with the view that made them
+(:data:`current_view`, set by :class:`~MailOps.middleware.GmailMetricsMiddleware`;
+``background`` for jobs, prefetch and push refreshes), the API method derived
+from the URL and a short hash of the account id (:data:`current_account`,
+set while a pooled client is checked out). The batch engine adds batch sizes,
+the outcome of each sub-request and retries. Recording is a dict update under
+one lock, so it costs microseconds next to a Gmail round trip.
+"""
+
+import bisect
+import contextvars
+import hashlib
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httplib2
+
+current_view: contextvars.ContextVar[str] = contextvars.ContextVar("mailops_view", default="background")
+current_account: contextvars.ContextVar[str] = contextvars.ContextVar("mailops_account", default="")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100)
+
+# Path segments that name a Gmail resource rather than an id
+RESOURCES = {"labels", "messages", "threads", "drafts", "history", "attachments", "settings"}
+ACTIONS = {"modify", "trash", "untrash", "batchModify", "batchDelete", "import", "send", "watch", "stop", "profile"}
+HTTP_VERBS = {"GET": "get", "POST": "create", "PUT": "update", "PATCH": "patch", "DELETE": "delete"}
+
+
+def account_hash(account_id: str | None) -> str:
+    return hashlib.sha256((account_id or "").encode()).hexdigest()[:12] if account_id else ""
+
+
+def api_method(http_method: str, uri: str) -> str:
+    """Gmail API method for a request URL, e.g. ``messages.get`` or ``batch``."""
+    path = urlsplit(uri).path
+    if path.rstrip("/").endswith("/batch/gmail/v1"):
+        return "batch"
+    segments = [s for s in path.split("/users/", 1)[-1].split("/")[1:] if s]
+    if not segments:
+        return "unknown"
+    names = [s for s in segments if s in RESOURCES]
+    if segments[-1] in ACTIONS:
+        action = segments[-1] if segments[-1] != "profile" else "getProfile"
+    elif segments[-1] in RESOURCES:
+        action = "list" if http_method == "GET" else HTTP_VERBS.get(http_method, http_method.lower())
+    else:
+        action = HTTP_VERBS.get(http_method, http_method.lower())
+    return ".".join(names + [action]) if names else action
+
+
+def batch_method(request) -> str:
+    """API method of a googleapiclient HttpRequest queued in a batch (``gmail.users.messages.get`` -> ``messages.get``)."""
+    method_id = getattr(request, "methodId", None) or ""
+    return method_id.removeprefix("gmail.users.") or "unknown"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms keyed by metric name and label values."""
+
+    # name -> (type, help, label names, histogram buckets)
+    DEFINITIONS = {
+        "mailops_gmail_requests_total": (
+            "counter", "Gmail HTTP requests by status (error for transport failures).",
+            ("view", "method", "account", "status"), None),
+        "mailops_gmail_request_duration_seconds": (
+            "histogram", "Gmail HTTP request latency.", ("view", "method"), LATENCY_BUCKETS),
+        "mailops_gmail_batch_calls_total": (
+            "counter", "Sub-requests of Gmail batch requests by outcome.",
+            ("view", "method", "account", "status"), None),
+        "mailops_gmail_batch_size": (
+            "histogram", "Sub-requests per Gmail batch request.", ("view", "method"), BATCH_SIZE_BUCKETS),
+        "mailops_gmail_rate_limited_total": (
+            "counter", "Gmail calls rejected with 429 or a rate-limit 403.", ("view", "method", "account"), None),
+        "mailops_gmail_retries_total": (
+            "counter", "Batch sub-requests sent again after a retryable failure.", ("view",), None),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, dict[tuple, object]] = {name: {} for name in self.DEFINITIONS}
+
+    def inc(self, name: str, labels: tuple, amount: int = 1) -> None:
+        series = self._values[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        series = self._values[name]
+        with self._lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = _Histogram(self.DEFINITIONS[name][3])
+            histogram.observe(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            for series in self._values.values():
+                series.clear()
+
+    def render(self) -> str:
+        """All series in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            snapshot = {
+                name: [
+                    (labels, (list(v.counts), v.sum, v.count) if isinstance(v, _Histogram) else v)
+                    for labels, v in sorted(series.items())
+                ]
+                for name, series in self._values.items()
+            }
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in self.DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in snapshot[name]:
+                pairs = [_pair(key, val) for key, val in zip(label_names, labels)]
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(pairs)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(pairs + [_pair('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(pairs + [_pair('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_labels(pairs)} {total}")
+                lines.append(f"{name}_count{_labels(pairs)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _pair(key: str, value) -> str:
+    escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return f'{key}="{escaped}"'
+
+
+def _labels(pairs: list[str]) -> str:
+    return "{" + ",".join(pairs) + "}"
+
+
+metrics = Metrics()
+
+
+def record_request(http_method: str, uri: str, status, seconds: float) -> None:
+    view, account, method = current_view.get(), current_account.get(), api_method(http_method, uri)
+    metrics.inc("mailops_gmail_requests_total", (view, method, account, str(status)))
+    metrics.observe("mailops_gmail_request_duration_seconds", (view, method), seconds)
+    if status == 429:
+        metrics.inc("mailops_gmail_rate_limited_total", (view, method, account))
+
+
+def record_batch(method: str, size: int) -> None:
+    metrics.observe("mailops_gmail_batch_size", (current_view.get(), method), size)
+
+
+def record_batch_call(method: str, status, rate_limited: bool = False) -> None:
+    view, account = current_view.get(), current_account.get()
+    metrics.inc("mailops_gmail_batch_calls_total", (view, method, account, str(status)))
+    if rate_limited:
+        metrics.inc("mailops_gmail_rate_limited_total", (view, method, account))
+
+
+def record_retries(count: int) -> None:
+    if count:
+        metrics.inc("mailops_gmail_retries_total", (current_view.get(),), count)
+
+
+class InstrumentedHttp(httplib2.Http):
+    """``httplib2.Http`` that records every request it sends in :data:`metrics`."""
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            response, content = super().request(uri, method, *args, **kwargs)
+        except Exception:
+            record_request(method, uri, "error", time.perf_counter() - started)
+            raise
+        record_request(method, uri, response.status, time.perf_counter() - started)
+        return response, content
@@ -0,0 +1,88 @@
+"""Request instrumentation for MailOps."""
+
+import logging
+
+from django.http import FileResponse
+
+from .metrics import current_view
+
+logger = logging.getLogger(__name__)
+
+SESSION_SIZE_HEADER = "X-Session-Size"
+
+
+class SessionSizeMiddleware:
+    """Report the encoded size of the session on every response that read or wrote it.
+
+    The size (bytes of ``session.encode()``, what the session backend stores) is
+    sent in the ``X-Session-Size`` header and logged at DEBUG level on
+    ``MailOps.middleware``. Place it after ``SessionMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        session = getattr(request, "session", None)
+        # Sessions are loaded lazily; measuring an untouched one would load it just for this
+        if session is not None and session.accessed:
+            size = len(session.encode(dict(session.items())))
+            response[SESSION_SIZE_HEADER] = str(size)
+            logger.debug("session %s bytes for %s %s", size, request.method, request.path)
+        return response
+
+
+def _labelled(view_name: str, content):
+    """Iterate a streamed body with ``current_view`` set while each chunk is produced."""
+    chunks = iter(content)
+    while True:
+        token = current_view.set(view_name)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            current_view.reset(token)
+        yield chunk
+
+
+async def _alabelled(view_name: str, content):
+    chunks = aiter(content)
+    while True:
+        token = current_view.set(view_name)
+        try:
+            chunk = await anext(chunks)
+        except StopAsyncIteration:
+            return
+        finally:
+            current_view.reset(token)
+        yield chunk
+
+
+class GmailMetricsMiddleware:
+    """Label the Gmail calls a request makes with its view name (``mailops:dashboard_by_label``).
+
+    The label is reset when the response is returned. Streamed bodies, which
+    call Gmail while they are sent, set it again around every chunk.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_view.set("unresolved")
+        try:
+            response = self.get_response(request)
+            # Files are streamed as is, so the server can still use sendfile for them
+            if response.streaming and not isinstance(response, FileResponse):
+                label = _alabelled if response.is_async else _labelled
+                response.streaming_content = label(current_view.get(), response.streaming_content)
+            return response
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        # Undone by the reset in __call__
+        current_view.set(match.view_name if match else "unresolved")
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.CharField(max_length=255, unique=True)),
+                ('email', models.CharField(blank=True, max_length=255)),
+                ('history_id', models.CharField(blank=True, max_length=32)),
+                ('seeded_at', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MailLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label_id', models.CharField(max_length=255)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('type', models.CharField(blank=True, max_length=20)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='labels', to='MailOps.mailaccount')),
+            ],
+            options={
+                'unique_together': {('account', 'label_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MailMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_id', models.CharField(max_length=64)),
+                ('thread_id', models.CharField(blank=True, max_length=64)),
+                ('subject', models.TextField(blank=True)),
+                ('sender', models.TextField(blank=True)),
+                ('recipients', models.TextField(blank=True)),
+                ('date', models.CharField(blank=True, max_length=255)),
+                ('snippet', models.TextField(blank=True)),
+                ('internal_date', models.BigIntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='MailOps.mailaccount')),
+                ('labels', models.ManyToManyField(blank=True, related_name='messages', to='MailOps.maillabel')),
+            ],
+            options={
+                'ordering': ['-internal_date'],
+                'indexes': [models.Index(fields=['account', '-internal_date'], name='MailOps_mai_account_5874d7_idx')],
+                'unique_together': {('account', 'message_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'mailops_message_fts'
+COLUMNS = 'subject, sender, recipients, snippet'
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    table = apps.get_model('MailOps', 'MailMessage')._meta.db_table
+    old_values = ', '.join(f'old.{c.strip()}' for c in COLUMNS.split(','))
+    new_values = ', '.join(f'new.{c.strip()}' for c in COLUMNS.split(','))
+    statements = [
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({COLUMNS}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f'CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {new_values}); END',
+        f'CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON "{table}" BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {old_values}); END",
+        f'CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON "{table}" BEGIN '
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {old_values}); "
+        f'INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {new_values}); END',
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MailOps', '0002_mailjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
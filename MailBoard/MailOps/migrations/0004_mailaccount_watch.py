@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MailOps', '0003_message_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailaccount',
+            name='notified_history_id',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='mailaccount',
+            name='watch_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MailOps', '0004_mailaccount_watch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MailThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('thread_id', models.CharField(max_length=64)),
+                ('history_id', models.CharField(blank=True, max_length=32)),
+                ('messages', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='MailOps.mailaccount')),
+            ],
+            options={
+                'unique_together': {('account', 'thread_id')},
+            },
+        ),
+    ]
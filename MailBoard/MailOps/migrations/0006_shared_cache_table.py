@@ -0,0 +1,18 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_shared_cache_table(apps, schema_editor):
+    # Table of the "mailops_shared" DatabaseCache (see CACHES in settings); a no-op when it exists
+    call_command('createcachetable', 'mailops_shared_cache', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MailOps', '0005_mailthread'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shared_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+def reseed_accounts(apps, schema_editor):
+    # Earlier seeds did not record whether they were cut at MAILOPS_SYNC_SEED_LIMIT: seed again on the next view
+    apps.get_model('MailOps', 'MailAccount').objects.update(history_id='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MailOps', '0006_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailaccount',
+            name='seed_floor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(reseed_accounts, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,133 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class MailAccount(models.Model):
+    """Locally mirrored Gmail account, keyed by the session account id."""
+    account_id = models.CharField(max_length=255, unique=True)
+    email = models.CharField(max_length=255, blank=True)
+    # Gmail historyId the local store is current up to (empty until seeded)
+    history_id = models.CharField(max_length=32, blank=True)
+    seeded_at = models.DateTimeField(null=True, blank=True)
+    # internalDate (ms) of the oldest seeded message when the seed stopped at MAILOPS_SYNC_SEED_LIMIT;
+    # 0 when the store holds every unread message
+    seed_floor = models.BigIntegerField(default=0)
+    synced_at = models.DateTimeField(null=True, blank=True)
+    # Latest historyId announced by a Gmail push notification
+    notified_history_id = models.CharField(max_length=32, blank=True)
+    # While a users.watch registration is live, syncs skip Gmail unless a push arrived
+    watch_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.email or self.account_id
+
+    @property
+    def is_watched(self) -> bool:
+        return self.watch_expires_at is not None and self.watch_expires_at > timezone.now()
+
+    @property
+    def seed_complete(self) -> bool:
+        return not self.seed_floor
+
+    @property
+    def has_pending_changes(self) -> bool:
+        """Whether a push announced changes newer than the local store."""
+        try:
+            return int(self.notified_history_id or 0) > int(self.history_id or 0)
+        except ValueError:
+            return True
+
+
+class MailLabel(models.Model):
+    """Gmail label of a mirrored account."""
+    account = models.ForeignKey(MailAccount, on_delete=models.CASCADE, related_name='labels')
+    label_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, blank=True)
+    type = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        unique_together = [('account', 'label_id')]
+
+    def __str__(self):
+        return self.name or self.label_id
+
+
+class MailMessage(models.Model):
+    """Message metadata row, as returned by messages.get(format="metadata")."""
+    account = models.ForeignKey(MailAccount, on_delete=models.CASCADE, related_name='messages')
+    message_id = models.CharField(max_length=64)
+    thread_id = models.CharField(max_length=64, blank=True)
+    subject = models.TextField(blank=True)
+    sender = models.TextField(blank=True)
+    recipients = models.TextField(blank=True)
+    date = models.CharField(max_length=255, blank=True)
+    snippet = models.TextField(blank=True)
+    # Milliseconds since epoch, as reported by Gmail
+    internal_date = models.BigIntegerField(default=0)
+    labels = models.ManyToManyField(MailLabel, related_name='messages', blank=True)
+
+    class Meta:
+        ordering = ['-internal_date']
+        unique_together = [('account', 'message_id')]
+        indexes = [models.Index(fields=['account', '-internal_date'])]
+
+    def __str__(self):
+        return self.subject or self.message_id
+
+
+class MailThread(models.Model):
+    """Thread index entry: the thread's message metadata as of its Gmail historyId."""
+    account = models.ForeignKey(MailAccount, on_delete=models.CASCADE, related_name='threads')
+    thread_id = models.CharField(max_length=64)
+    # threads.list reports the current historyId of every thread, so a changed one is refetched
+    history_id = models.CharField(max_length=32, blank=True)
+    # Oldest first, in batch_fetch_metadata() shape
+    messages = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('account', 'thread_id')]
+
+    def __str__(self):
+        return self.thread_id
+
+
+class MailJob(models.Model):
+    """Background bulk operation on an account; the dashboard polls it for progress."""
+    account = models.ForeignKey(MailAccount, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=32)
+    label_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('running', 'Running'),
+            ('completed', 'Completed'),
+            ('failed', 'Failed'),
+        ],
+        default='pending'
+    )
+    total = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind} {self.label_id} ({self.status})"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.pk,
+            "kind": self.kind,
+            "label_id": self.label_id,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "error": self.error,
+        }
@@ -0,0 +1,117 @@
+"""Speculative prefetch of what the user is likely to open next.
+
+After a listing page renders, :data:`prefetcher` warms, in the background,
+the metadata of the next page (when it comes from Gmail rather than the local
+store) and the bodies of the top ``MAILOPS_PREFETCH_BODIES`` unread messages.
+Every account has a quota budget per minute that prefetching may spend, and
+each new listing bumps the account's generation so work for a page the user
+has left stops before its next Gmail call.
+
+Prefetched pages go to the shared cache, so whichever worker process serves
+the next request can use them. Generations and the quota budget stay in the
+process that scheduled the work; with several workers each one spends up to
+``MAILOPS_PREFETCH_QUOTA`` per minute.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .caches import message_bodies, message_size, prefetched_page_cache_key, shared_cache
+from .gmail import batch_fetch_metadata, batch_get, gmail_pool, list_unread_ids, parse_message
+from .sync import LOCAL_PAGE_PREFIX, OLDER_PAGE_PREFIX
+
+# Gmail quota units charged per call
+LIST_UNITS = 5
+GET_UNITS = 5
+QUOTA_WINDOW = 60
+
+
+class Prefetcher:
+    def __init__(self, max_workers: int, quota_units: int, bodies: int):
+        self.quota_units = quota_units
+        self.bodies = bodies
+        self._lock = threading.Lock()
+        self._generations: dict[str, int] = {}
+        # account_id -> (window start, units spent in that window)
+        self._spent: dict[str, tuple[float, int]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mailops-prefetch")
+
+    def cancel(self, account_id: str) -> int:
+        """Abandon prefetch work queued for the account; returns the new generation."""
+        with self._lock:
+            generation = self._generations.get(account_id, 0) + 1
+            self._generations[account_id] = generation
+            return generation
+
+    def is_current(self, account_id: str, generation: int) -> bool:
+        with self._lock:
+            return self._generations.get(account_id) == generation
+
+    def spend(self, account_id: str, units: int) -> bool:
+        """Take ``units`` from the account's budget for the current window, if they fit."""
+        now = time.monotonic()
+        with self._lock:
+            started, spent = self._spent.get(account_id, (now, 0))
+            if now - started >= QUOTA_WINDOW:
+                started, spent = now, 0
+            if spent + units > self.quota_units:
+                return False
+            self._spent[account_id] = (started, spent + units)
+            return True
+
+    def schedule(self, account_id: str | None, creds, label_id: str, query: str, messages: list[dict], next_token: str | None) -> None:
+        """Start prefetching for a page that was just rendered, cancelling older work for the account."""
+        if not account_id or self.quota_units <= 0:
+            return
+        generation = self.cancel(account_id)
+        self._executor.submit(self._run, account_id, creds, generation, label_id, query, messages, next_token)
+
+    def _run(self, account_id, creds, generation, label_id, query, messages, next_token) -> None:
+        try:
+            with gmail_pool.service(account_id, creds) as gmail:
+                unread = [
+                    m["id"] for m in messages
+                    if "UNREAD" in (m.get("labelIds") or []) and (account_id, m["id"]) not in message_bodies
+                ][:self.bodies]
+                self._prefetch_bodies(gmail, account_id, generation, unread)
+                # Local pages are served from the store already, older-mail cursors are not Gmail page tokens
+                if next_token and not next_token.startswith((LOCAL_PAGE_PREFIX, OLDER_PAGE_PREFIX)):
+                    self._prefetch_page(gmail, account_id, generation, label_id, query, next_token)
+        except Exception:
+            # Speculative work: the view fetches for real if anything here fails
+            pass
+
+    def _prefetch_bodies(self, gmail, account_id, generation, message_ids: list[str]) -> None:
+        if not message_ids or not self.is_current(account_id, generation):
+            return
+        if not self.spend(account_id, GET_UNITS * len(message_ids)):
+            return
+        responses = batch_get(
+            gmail, message_ids,
+            lambda client, mid: client.users().messages().get(userId="me", id=mid, format="full"),
+        )
+        for mid, response in responses.items():
+            message = parse_message(response)
+            message_bodies.set((account_id, mid), message, message_size(message))
+
+    def _prefetch_page(self, gmail, account_id, generation, label_id, query, page_token) -> None:
+        if not self.is_current(account_id, generation) or not self.spend(account_id, LIST_UNITS):
+            return
+        ids, next_token = list_unread_ids(gmail, label_id, query, page_token)
+        if not self.is_current(account_id, generation) or not self.spend(account_id, GET_UNITS * len(ids)):
+            return
+        page = (batch_fetch_metadata(gmail, ids), next_token)
+        if self.is_current(account_id, generation):
+            shared_cache.set(
+                prefetched_page_cache_key(account_id, label_id, query, page_token), page, settings.MAILOPS_PREFETCH_TTL
+            )
+
+
+prefetcher = Prefetcher(
+    max_workers=settings.MAILOPS_PREFETCH_WORKERS,
+    quota_units=settings.MAILOPS_PREFETCH_QUOTA,
+    bodies=settings.MAILOPS_PREFETCH_BODIES,
+)
@@ -0,0 +1,91 @@
+"""Gmail push notifications (users.watch delivered through a Pub/Sub push subscription).
+
+A notification only says "the mailbox of <email> changed up to <historyId>".
+It is recorded on the account, which makes the next :func:`~MailOps.sync.sync_account`
+pull the history delta; accounts without notifications are not polled at all.
+When a pooled client of the account is idle, the delta is pulled right away in
+the background so the next page view finds the store already current.
+"""
+
+import base64
+import json
+import threading
+
+from django.db import connection
+
+from .caches import invalidate_label_counts
+from .gmail import gmail_pool
+from .models import MailAccount
+from .sync import sync_account
+
+
+# Sync rounds one background refresh may run while notifications keep arriving
+MAX_REFRESH_ROUNDS = 3
+
+_refreshing: set[str] = set()
+_refreshing_lock = threading.Lock()
+
+
+def parse_push(payload: dict) -> tuple[str, int]:
+    """Return (emailAddress, historyId) from a Pub/Sub push request body; ValueError if malformed."""
+    try:
+        data = json.loads(base64.b64decode(payload["message"]["data"]))
+        return str(data["emailAddress"]), int(data["historyId"])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f"not a Gmail push notification: {exc}") from exc
+
+
+def push_body(email: str, history_id: int, message_id: str = "1") -> dict:
+    """Build a Pub/Sub push request body the way Google delivers Gmail notifications."""
+    data = json.dumps({"emailAddress": email, "historyId": history_id}).encode()
+    return {
+        "message": {"data": base64.b64encode(data).decode(), "messageId": message_id},
+        "subscription": "projects/mailops/subscriptions/gmail-push",
+    }
+
+
+def record_notification(email: str, history_id: int) -> list[MailAccount]:
+    """Mark the accounts of ``email`` as having changes up to ``history_id``; returns those now behind."""
+    changed = []
+    for account in MailAccount.objects.filter(email__iexact=email):
+        if int(account.notified_history_id or 0) < history_id:
+            # Compare-and-set; whichever delivery wins, the next history sync reads to the end anyway
+            MailAccount.objects.filter(pk=account.pk, notified_history_id=account.notified_history_id).update(
+                notified_history_id=str(history_id)
+            )
+            account.notified_history_id = str(history_id)
+        if account.has_pending_changes:
+            invalidate_label_counts(account.account_id)
+            changed.append(account)
+    return changed
+
+
+def refresh_in_background(account: MailAccount) -> bool:
+    """Pull the announced changes now if an idle client of the account can be borrowed."""
+    creds = gmail_pool.idle_credentials(account.account_id)
+    if creds is None:
+        return False
+    with _refreshing_lock:
+        if account.account_id in _refreshing:
+            # The running refresh re-checks for newer notifications before it stops
+            return True
+        _refreshing.add(account.account_id)
+    threading.Thread(target=_refresh, args=(account.account_id, creds), daemon=True).start()
+    return True
+
+
+def _refresh(account_id: str, creds) -> None:
+    try:
+        for _ in range(MAX_REFRESH_ROUNDS):
+            with gmail_pool.service(account_id, creds) as gmail:
+                account = sync_account(gmail, account_id)
+            invalidate_label_counts(account_id)
+            if account is None:
+                return
+            account.refresh_from_db(fields=["history_id", "notified_history_id"])
+            if not account.has_pending_changes:
+                return
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(account_id)
+        connection.close()
@@ -0,0 +1,77 @@
+"""Local full-text search over the synced message store (SQLite FTS5).
+
+The ``mailops_message_fts`` index mirrors subject/from/to/snippet of
+``MailMessage`` rows through triggers (see migration 0003), so anything the
+sync code writes is searchable immediately. Queries using Gmail operators the
+index cannot answer (``from:``, ``-term``, ``OR``, ...) return ``None`` from
+:func:`to_fts_query` and go to Gmail instead.
+"""
+
+import re
+from functools import lru_cache
+
+from django.db import DatabaseError, connection
+
+from .models import MailAccount
+from .sync import LOCAL_PAGE_PREFIX, page_offset, message_to_dict, unread_in_label
+
+
+FTS_TABLE = "mailops_message_fts"
+# Ranked unread matches of the label considered per query before paging
+SEARCH_LIMIT = 500
+# bm25 column weights: subject, sender, recipients, snippet
+BM25_WEIGHTS = (4.0, 2.0, 1.0, 1.0)
+
+_GMAIL_OPERATOR_RE = re.compile(r"(?:^|\s)(?:-|\w+:|[(){}])|\b(?:OR|AND|AROUND)\b")
+_TERM_RE = re.compile(r'"([^"]*)"|(\S+)')
+_WORD_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def fts_enabled() -> bool:
+    """True when the database carries the FTS5 index (SQLite only)."""
+    if connection.vendor != "sqlite":
+        return False
+    try:
+        return FTS_TABLE in connection.introspection.table_names()
+    except DatabaseError:
+        return False
+
+
+def to_fts_query(query: str) -> str | None:
+    """Translate a plain search box query into an FTS5 expression with prefix matching."""
+    if not query or _GMAIL_OPERATOR_RE.search(query):
+        return None
+    parts: list[str] = []
+    for phrase, word in _TERM_RE.findall(query):
+        if phrase:
+            tokens = _WORD_RE.findall(phrase)
+            if tokens:
+                parts.append('"' + " ".join(tokens) + '"')
+        else:
+            parts.extend(f'"{token}"*' for token in _WORD_RE.findall(word))
+    return " ".join(parts) or None
+
+
+def search_messages(account: MailAccount, label_id: str, fts_query: str, page_token: str | None = None, page_size: int = 25) -> tuple[list[dict], str | None] | None:
+    """Rank stored unread messages of a label against ``fts_query``; None if the index cannot be used."""
+    offset = page_offset(page_token)
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    # The label/unread filter runs in SQL ahead of the LIMIT, so matches outside the label cannot use it up
+    in_label, in_label_params = unread_in_label(account, label_id).order_by().values("pk").query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({in_label}) "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+                [fts_query, *in_label_params, SEARCH_LIMIT],
+            )
+            ranked = [row[0] for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
+    rank = {pk: i for i, pk in enumerate(ranked)}
+    rows = list(account.messages.filter(pk__in=ranked).prefetch_related("labels"))
+    rows.sort(key=lambda row: rank[row.pk])
+    page = rows[offset:offset + page_size]
+    next_token = f"{LOCAL_PAGE_PREFIX}{offset + page_size}" if len(rows) > offset + page_size else None
+    return [message_to_dict(row) for row in page], next_token
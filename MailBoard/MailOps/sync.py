@@ -0,0 +1,380 @@
+"""Local message-metadata store kept current through Gmail history deltas.
+
+Each account is seeded once with the metadata of its unread messages and the
+mailbox ``historyId`` at that time. Later views call :func:`sync_account`,
+which only asks Gmail for ``users.history.list`` changes since the stored id.
+
+The seed stops at ``MAILOPS_SYNC_SEED_LIMIT`` messages. The store then covers
+unread mail from ``MailAccount.seed_floor`` on, and once its pages run out the
+listing continues with :data:`OLDER_PAGE_PREFIX` cursors that page through the
+older unread mail in Gmail.
+"""
+
+import datetime
+import logging
+import threading
+from collections import Counter
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from .caches import adjust_label_counts, invalidate_label_counts, message_bodies
+from .gmail import batch_fetch_metadata, list_unread_ids, modify_labels
+from .models import MailAccount, MailLabel, MailMessage
+
+logger = logging.getLogger(__name__)
+
+# MailOps only shows unread mail, so that is all the store mirrors
+SEED_QUERY = "is:unread"
+LOCAL_PAGE_PREFIX = "local-"
+# "older-<seed floor>[.<Gmail page token>]": unread mail older than a truncated seed, listed by Gmail
+OLDER_PAGE_PREFIX = "older-"
+HIDDEN_LABEL_IDS = ("TRASH", "SPAM")
+# Gmail watches expire after 7 days; renew them once less than this is left
+WATCH_RENEW_BEFORE = datetime.timedelta(days=1)
+
+# SQLite allows one writer, and a transaction that read before writing fails with
+# "database is locked" instead of waiting, so accounts synced in parallel take turns
+_sqlite_write_lock = threading.RLock()
+
+
+def writing():
+    """Context manager held around write transactions on the message store (serializes SQLite writers)."""
+    return _sqlite_write_lock if connection.vendor == "sqlite" else nullcontext()
+
+
+def get_account(account_id: str, email: str = "") -> MailAccount:
+    account, _ = MailAccount.objects.get_or_create(account_id=account_id, defaults={"email": email or ""})
+    return account
+
+
+def _ensure_labels(account: MailAccount, label_ids) -> dict[str, MailLabel]:
+    """Return label_id -> MailLabel for the account, creating placeholders for unknown ids."""
+    label_map = {lb.label_id: lb for lb in account.labels.all()}
+    missing = [lid for lid in set(label_ids) if lid and lid not in label_map]
+    if missing:
+        MailLabel.objects.bulk_create(
+            [MailLabel(account=account, label_id=lid, name=lid) for lid in missing],
+            ignore_conflicts=True,
+        )
+        label_map = {lb.label_id: lb for lb in account.labels.all()}
+    return label_map
+
+
+def sync_labels(account: MailAccount, labels: list[dict]) -> None:
+    """Upsert the account labels from a labels.list response."""
+    label_map = _ensure_labels(account, [lb.get("id") for lb in labels or []])
+    changed = []
+    for lb in labels or []:
+        row = label_map.get(lb.get("id"))
+        if row is None:
+            continue
+        name, type_ = lb.get("name") or "", lb.get("type") or ""
+        if row.name != name or row.type != type_:
+            row.name, row.type = name, type_
+            changed.append(row)
+    if changed:
+        MailLabel.objects.bulk_update(changed, ["name", "type"])
+
+
+def _set_labels(account: MailAccount, labels_by_message: dict[str, list[str]]) -> None:
+    """Replace the label set of already stored messages."""
+    if not labels_by_message:
+        return
+    label_map = _ensure_labels(account, {lid for ids in labels_by_message.values() for lid in ids})
+    pks = dict(account.messages.filter(message_id__in=list(labels_by_message)).values_list("message_id", "pk"))
+    through = MailMessage.labels.through
+    through.objects.filter(mailmessage_id__in=pks.values()).delete()
+    through.objects.bulk_create(
+        [
+            through(mailmessage_id=pks[mid], maillabel_id=label_map[lid].pk)
+            for mid, label_ids in labels_by_message.items() if mid in pks
+            for lid in set(label_ids) if lid in label_map
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def store_messages(account: MailAccount, metas: list[dict]) -> None:
+    """Insert or update message rows from batch_fetch_metadata() results."""
+    metas = [m for m in metas or [] if m.get("id")]
+    if not metas:
+        return
+    with writing(), transaction.atomic():
+        existing = {m.message_id: m for m in account.messages.filter(message_id__in=[m["id"] for m in metas])}
+        new_rows, updated_rows = [], []
+        for meta in metas:
+            row = existing.get(meta["id"]) or MailMessage(account=account, message_id=meta["id"])
+            row.thread_id = meta.get("threadId") or ""
+            row.subject = meta.get("subject") or ""
+            row.sender = meta.get("from") or ""
+            row.recipients = meta.get("to") or ""
+            row.date = meta.get("date") or ""
+            row.snippet = meta.get("snippet") or ""
+            row.internal_date = int(meta.get("internalDate") or 0)
+            (updated_rows if row.pk else new_rows).append(row)
+        MailMessage.objects.bulk_create(new_rows)
+        MailMessage.objects.bulk_update(
+            updated_rows, ["thread_id", "subject", "sender", "recipients", "date", "snippet", "internal_date"]
+        )
+        _set_labels(account, {m["id"]: m.get("labelIds") or [] for m in metas})
+
+
+def seed_account(gmail, account: MailAccount) -> None:
+    """(Re)build the local store from scratch: unread message metadata plus the current historyId."""
+    # Read the historyId first so changes made while listing are replayed by the next sync
+    profile = gmail.users().getProfile(userId="me").execute()
+    history_id = str(profile.get("historyId") or "")
+
+    ids: list[str] = []
+    next_token = None
+    while len(ids) < settings.MAILOPS_SYNC_SEED_LIMIT:
+        kwargs = {"userId": "me", "q": SEED_QUERY, "maxResults": 500}
+        if next_token:
+            kwargs["pageToken"] = next_token
+        resp = gmail.users().messages().list(**kwargs).execute()
+        ids.extend(m["id"] for m in (resp.get("messages") or []))
+        next_token = resp.get("nextPageToken")
+        if not next_token:
+            break
+    truncated = len(ids) > settings.MAILOPS_SYNC_SEED_LIMIT or bool(next_token)
+    ids = ids[:settings.MAILOPS_SYNC_SEED_LIMIT]
+
+    metas = batch_fetch_metadata(gmail, ids)
+    with writing(), transaction.atomic():
+        account.messages.all().delete()
+        store_messages(account, metas)
+        account.history_id = history_id
+        # Unread mail older than the newest LIMIT messages is left in Gmail (see older_messages)
+        account.seed_floor = 0
+        if truncated:
+            account.seed_floor = min((int(m.get("internalDate") or 0) for m in metas), default=0) or 1
+        account.seeded_at = account.synced_at = timezone.now()
+        account.save(update_fields=["history_id", "seed_floor", "seeded_at", "synced_at", "updated_at"])
+
+
+def apply_history(gmail, account: MailAccount) -> None:
+    """Replay users.history.list changes since account.history_id onto the local store."""
+    records: list[dict] = []
+    history_id = account.history_id
+    next_token = None
+    try:
+        while True:
+            kwargs = {"userId": "me", "startHistoryId": account.history_id, "maxResults": 500}
+            if next_token:
+                kwargs["pageToken"] = next_token
+            resp = gmail.users().history().list(**kwargs).execute()
+            records.extend(resp.get("history") or [])
+            history_id = str(resp.get("historyId") or history_id)
+            next_token = resp.get("nextPageToken")
+            if not next_token:
+                break
+    except HttpError as exc:
+        # 404 means the stored historyId is too old to replay; start over
+        if exc.resp.status == 404:
+            seed_account(gmail, account)
+            return
+        raise
+
+    # Collapse the records into the final label set of every touched message
+    latest: dict[str, list[str]] = {}
+    deleted: set[str] = set()
+    for record in records:
+        for item in record.get("messagesDeleted") or []:
+            mid = (item.get("message") or {}).get("id")
+            if mid:
+                deleted.add(mid)
+                latest.pop(mid, None)
+        for key in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+            for item in record.get(key) or []:
+                msg = item.get("message") or {}
+                mid = msg.get("id")
+                if mid and mid not in deleted:
+                    latest[mid] = msg.get("labelIds") or []
+
+    # Bodies never change, but cached entries carry the labels message_detail shows
+    for mid in deleted:
+        message_bodies.delete((account.account_id, mid))
+    for mid, label_ids in latest.items():
+        cached = message_bodies.get((account.account_id, mid))
+        if cached is not None:
+            cached["labelIds"] = label_ids
+
+    known = set(account.messages.filter(message_id__in=list(latest)).values_list("message_id", flat=True))
+    # Messages we have never seen only matter once they are unread
+    to_fetch = [mid for mid, label_ids in latest.items() if mid not in known and "UNREAD" in label_ids]
+    metas = batch_fetch_metadata(gmail, to_fetch)
+    with writing(), transaction.atomic():
+        if deleted:
+            account.messages.filter(message_id__in=deleted).delete()
+        _set_labels(account, {mid: label_ids for mid, label_ids in latest.items() if mid in known})
+        store_messages(account, metas)
+        account.history_id = history_id
+        account.synced_at = timezone.now()
+        account.save(update_fields=["history_id", "synced_at", "updated_at"])
+
+
+def relabel_stored(account: MailAccount, message_ids: list[str], add: set[str], remove: set[str]) -> tuple[Counter, Counter] | None:
+    """Mirror a label change onto stored messages.
+
+    Returns the (unread, total) count change per label, or None when some of
+    the messages are not in the store and the change cannot be counted locally.
+    """
+    rows = list(account.messages.filter(message_id__in=message_ids).prefetch_related("labels"))
+    unread, total = Counter(), Counter()
+    new_labels: dict[str, list[str]] = {}
+    for row in rows:
+        old = {lb.label_id for lb in row.labels.all()}
+        new = (old - remove) | add
+        total.update(new - old)
+        total.subtract(old - new)
+        # Counts are unread counts, so an UNREAD change moves the message in every label it has
+        if "UNREAD" in old:
+            unread.subtract(old)
+        if "UNREAD" in new:
+            unread.update(new)
+        new_labels[row.message_id] = list(new)
+    with writing(), transaction.atomic():
+        _set_labels(account, new_labels)
+    if len(rows) < len(set(message_ids)):
+        return None
+    return unread, total
+
+
+def apply_label_change(gmail, account_id: str | None, message_ids: list[str], add: set[str], remove: set[str]) -> None:
+    """Add/remove labels on messages in Gmail, then update the store, cached bodies and counts without re-listing."""
+    remove = remove - add
+    modify_labels(gmail, message_ids, sorted(add), sorted(remove))
+    if not account_id:
+        return
+    for mid in message_ids:
+        cached = message_bodies.get((account_id, mid))
+        if cached is not None:
+            cached["labelIds"] = [lid for lid in cached["labelIds"] if lid not in remove] + [
+                lid for lid in sorted(add) if lid not in cached["labelIds"]
+            ]
+    account = MailAccount.objects.filter(account_id=account_id).first()
+    deltas = relabel_stored(account, message_ids, add, remove) if account else None
+    if deltas is None:
+        invalidate_label_counts(account_id)
+    else:
+        adjust_label_counts(account_id, *deltas)
+
+
+def ensure_watch(gmail, account: MailAccount) -> None:
+    """Register or renew the users.watch push subscription when MAILOPS_PUBSUB_TOPIC is set."""
+    topic = settings.MAILOPS_PUBSUB_TOPIC
+    if not topic:
+        return
+    if account.watch_expires_at and account.watch_expires_at - timezone.now() > WATCH_RENEW_BEFORE:
+        return
+    try:
+        resp = gmail.users().watch(userId="me", body={"topicName": topic}).execute()
+    except HttpError:
+        # Without a watch the account simply keeps being synced on every view
+        return
+    account.watch_expires_at = datetime.datetime.fromtimestamp(int(resp["expiration"]) / 1000, tz=datetime.timezone.utc)
+    # Changes between our last history read and the watch start are not pushed
+    account.notified_history_id = str(max(int(resp.get("historyId") or 0), int(account.notified_history_id or 0)))
+    account.save(update_fields=["watch_expires_at", "notified_history_id", "updated_at"])
+
+
+def sync_account(gmail, account_id: str, email: str = "", labels: list[dict] | None = None) -> MailAccount | None:
+    """Bring the local store of an account up to date; returns None if Gmail could not be synced.
+
+    Watched accounts only call Gmail after a push notification announced changes.
+    """
+    if not account_id:
+        return None
+    try:
+        account = get_account(account_id, email)
+        if labels is not None:
+            sync_labels(account, labels)
+        if account.history_id and account.is_watched and not account.has_pending_changes:
+            return account
+        if account.history_id:
+            apply_history(gmail, account)
+        else:
+            seed_account(gmail, account)
+        ensure_watch(gmail, account)
+        return account
+    except Exception:
+        # The store may now be behind Gmail, so callers list from Gmail instead
+        logger.exception("Could not sync the local store of account %s", account_id)
+        return None
+
+
+def message_to_dict(row: MailMessage) -> dict:
+    """Render a stored row in the same shape as batch_fetch_metadata() results."""
+    return {
+        "id": row.message_id,
+        "threadId": row.thread_id,
+        "internalDate": str(row.internal_date),
+        "snippet": row.snippet,
+        "subject": row.subject,
+        "from": row.sender,
+        "to": row.recipients,
+        "date": row.date,
+        "labelIds": [lb.label_id for lb in row.labels.all()],
+    }
+
+
+def page_offset(page_token: str | None) -> int:
+    if page_token and page_token.startswith(LOCAL_PAGE_PREFIX):
+        try:
+            return max(int(page_token[len(LOCAL_PAGE_PREFIX):]), 0)
+        except ValueError:
+            pass
+    return 0
+
+
+def unread_in_label(account: MailAccount, label_id: str):
+    """Queryset of stored unread messages carrying ``label_id`` (Trash/Spam hidden like messages.list does).
+
+    After a truncated seed only messages from ``seed_floor`` on are complete, so older rows are left out.
+    """
+    qs = account.messages.filter(labels__label_id="UNREAD")
+    if label_id != "UNREAD":
+        qs = qs.filter(labels__label_id=label_id)
+    if label_id not in HIDDEN_LABEL_IDS:
+        qs = qs.exclude(labels__label_id__in=HIDDEN_LABEL_IDS)
+    if account.seed_floor:
+        qs = qs.filter(internal_date__gte=account.seed_floor)
+    return qs
+
+
+def local_messages(account: MailAccount, label_id: str, page_token: str | None = None, page_size: int = 25) -> tuple[list[dict], str | None]:
+    """Return one page of unread messages for a label from the local store, plus the next page token.
+
+    After the last local page of a truncated seed the token moves on to :func:`older_messages`.
+    """
+    offset = page_offset(page_token)
+    rows = list(unread_in_label(account, label_id).prefetch_related("labels")[offset:offset + page_size + 1])
+    if len(rows) > page_size:
+        next_token = f"{LOCAL_PAGE_PREFIX}{offset + page_size}"
+    elif not account.seed_complete:
+        next_token = f"{OLDER_PAGE_PREFIX}{account.seed_floor}"
+    else:
+        next_token = None
+    return [message_to_dict(row) for row in rows[:page_size]], next_token
+
+
+def older_messages(gmail, account: MailAccount, label_id: str, page_token: str, page_size: int = 25) -> tuple[list[dict], str | None]:
+    """One page of unread messages older than the seeded window, listed by Gmail, plus the next page token."""
+    floor, _, gmail_token = page_token[len(OLDER_PAGE_PREFIX):].partition(".")
+    try:
+        floor = int(floor)
+    except ValueError:
+        return [], None
+    # before: takes whole seconds, so the page starts inside the floor's second
+    ids, next_gmail_token = list_unread_ids(gmail, label_id, f"before:{floor // 1000 + 1}", gmail_token or None, page_size)
+    # and skips what the local pages showed already
+    shown = set(
+        account.messages.filter(message_id__in=ids, internal_date__gte=floor).values_list("message_id", flat=True)
+    )
+    metas = batch_fetch_metadata(gmail, [mid for mid in ids if mid not in shown])
+    next_token = f"{OLDER_PAGE_PREFIX}{floor}.{next_gmail_token}" if next_gmail_token else None
+    return metas, next_token
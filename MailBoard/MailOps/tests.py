@@ -1,3 +1,158 @@
-from django.test import TestCase
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from google.auth import _helpers
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+
+from .caches import shared_cache
+from .fakegmail import FakeGmailServer, FakeMailbox
+from .gmail import MAX_BATCH_SIZE, batch_fetch_metadata, batch_sizer, build_service
+from .sync import get_account, store_messages
+from .tokens import TokenManager
+from .unified import decode_cursor, encode_cursor, merged_page
+
+
+class BatchGetTests(SimpleTestCase):
+    """batch_get() against the fake Gmail server, which rate-limits a share of the sub-requests."""
+
+    def setUp(self):
+        self.server = FakeGmailServer(FakeMailbox.synthetic(120), rate_limit=0.3, seed=3).start()
+        self.addCleanup(self.server.stop)
+        overrides = override_settings(
+            MAILOPS_GMAIL_API_ENDPOINT=self.server.url, MAILOPS_BATCH_BACKOFF=0, MAILOPS_BATCH_MAX_RETRIES=20
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(setattr, batch_sizer, 'size', MAX_BATCH_SIZE)
+        self.gmail = build_service(Credentials(token='test'))
+
+    def test_rate_limited_messages_are_retried_and_order_is_kept(self):
+        ids = list(self.server.mailbox.messages)
+        random.Random(0).shuffle(ids)
+        metas = batch_fetch_metadata(self.gmail, ids)
+        self.assertGreater(self.server.rate_limited, 0)
+        self.assertEqual([m['id'] for m in metas], ids)
+
+    def test_missing_messages_are_dropped_without_retries(self):
+        self.server.rate_limit = 0
+        ids = list(self.server.mailbox.messages)[:5]
+        metas = batch_fetch_metadata(self.gmail, [ids[0], 'missing', *ids[1:]])
+        self.assertEqual([m['id'] for m in metas], ids)
+        self.assertEqual(self.server.api_calls, 6)
+
+
+class MergedPageTests(TestCase):
+    """Unified Inbox paging with the composite cursor."""
+
+    def setUp(self):
+        # Interleaved dates: "a" has the even ones, "b" the odd ones, "c" only the two oldest
+        self.accounts = [get_account(account_id, f'{account_id}@example.com') for account_id in ('a', 'b', 'c')]
+        expected = []
+        for account, dates in zip(self.accounts, (range(10, 60, 2), range(11, 60, 2), (1, 2))):
+            metas = [
+                {'id': f'{account.account_id}{date}', 'internalDate': str(date), 'labelIds': ['INBOX', 'UNREAD']}
+                for date in dates
+            ]
+            expected += [(date, meta['id']) for date, meta in zip(dates, metas)]
+            # Neither read nor trashed mail is listed
+            metas.append({'id': f'{account.account_id}-read', 'internalDate': '100', 'labelIds': ['INBOX']})
+            metas.append({'id': f'{account.account_id}-trash', 'internalDate': '100', 'labelIds': ['INBOX', 'UNREAD', 'TRASH']})
+            store_messages(account, metas)
+        self.expected = [mid for _, mid in sorted(expected, reverse=True)]
+
+    def test_pages_cover_every_message_once_in_date_order(self):
+        seen, token = [], None
+        while True:
+            messages, token = merged_page(self.accounts, token, page_size=7)
+            self.assertLessEqual(len(messages), 7)
+            seen += [m['id'] for m in messages]
+            if token is None:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_cursor_drops_exhausted_accounts(self):
+        # Everything but the oldest message, which belongs to "c"
+        messages, token = merged_page(self.accounts, None, page_size=len(self.expected) - 1)
+        self.assertEqual(decode_cursor(token, ['a', 'b', 'c']), {'c': 1})
+        messages, token = merged_page(self.accounts, token, page_size=5)
+        self.assertEqual(([m['id'] for m in messages], token), (['c1'], None))
+        self.assertEqual(merged_page(self.accounts, encode_cursor({'a': 25, 'b': 25}), page_size=5), ([], None))
+
+    def test_unreadable_cursor_starts_over(self):
+        self.assertEqual(decode_cursor('not-a-cursor', ['a', 'b']), {'a': 0, 'b': 0})
+        messages, _ = merged_page(self.accounts, 'not-a-cursor', page_size=3)
+        self.assertEqual([m['id'] for m in messages], self.expected[:3])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'mailops_shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'mailops-tests'},
+})
+class TokenManagerTests(SimpleTestCase):
+    """Expired tokens are refreshed once, however many requests need them at the same time."""
+
+    def setUp(self):
+        shared_cache.clear()
+        self.data = {
+            'token': 'expired', 'refresh_token': 'refresh', 'token_uri': 'https://oauth2.example.com/token',
+            'client_id': 'client', 'client_secret': 'secret',
+            'expiry': (datetime.utcnow() - timedelta(minutes=1)).isoformat(),
+        }
+
+    @staticmethod
+    def _refresh(creds, request):
+        time.sleep(0.2)
+        creds.token = 'fresh'
+        creds.expiry = _helpers.utcnow() + timedelta(hours=1)
+
+    def test_concurrent_requests_share_one_refresh(self):
+        manager = TokenManager(refresh_before=300, max_workers=4)
+        tokens = []
+
+        def request():
+            tokens.append(manager.credentials('acct', self.data).token)
+
+        with mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=self._refresh) as refresh:
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Another worker process finds the refreshed token in the shared cache
+            other = TokenManager(refresh_before=300, max_workers=1).credentials('acct', self.data)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(tokens, ['fresh'] * 8)
+        self.assertEqual(other.token, 'fresh')
+
+    def test_refresh_finished_before_it_is_tracked_does_not_deadlock(self):
+        manager = TokenManager(refresh_before=300, max_workers=1)
+        errors = []
+
+        def run_now(fn, *args):
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+
+        def request():
+            try:
+                manager.credentials('acct', self.data)
+            except RefreshError as exc:
+                errors.append(exc)
+
+        with mock.patch.object(manager._executor, 'submit', run_now), \
+                mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=RefreshError('revoked')):
+            thread = threading.Thread(target=request, daemon=True)
+            thread.start()
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(manager._inflight, {})
@@ -0,0 +1,69 @@
+"""Conversation view: one row per thread with unread mail in a label.
+
+A page is one ``users.threads.list`` call, which reports the current
+``historyId`` of every thread. The local thread index (:class:`MailThread`)
+keeps each thread's message metadata as of that id, so only new or changed
+threads are fetched again, with batched ``threads.get(format="metadata")``
+calls. Expanding a thread renders the indexed messages without asking Gmail.
+"""
+
+from email.utils import parseaddr
+
+from django.db import transaction
+
+from .gmail import batch_fetch_threads, list_unread_threads
+from .models import MailAccount, MailThread
+from .sync import writing
+
+
+def store_threads(account: MailAccount, threads: list[dict]) -> dict[str, MailThread]:
+    """Insert or update index entries from batch_fetch_threads() results."""
+    threads = [t for t in threads if t.get("id")]
+    if not threads:
+        return {}
+    with writing(), transaction.atomic():
+        existing = {t.thread_id: t for t in account.threads.filter(thread_id__in=[t["id"] for t in threads])}
+        new_rows, updated_rows = [], []
+        for thread in threads:
+            row = existing.get(thread["id"]) or MailThread(account=account, thread_id=thread["id"])
+            row.history_id = str(thread.get("historyId") or "")
+            row.messages = thread["messages"]
+            (updated_rows if row.pk else new_rows).append(row)
+        MailThread.objects.bulk_create(new_rows)
+        MailThread.objects.bulk_update(updated_rows, ["history_id", "messages", "updated_at"])
+    return {row.thread_id: row for row in new_rows + updated_rows}
+
+
+def _display_name(address: str | None) -> str:
+    name, email = parseaddr(address or "")
+    return name or email or (address or "")
+
+
+def thread_summary(row: MailThread) -> dict:
+    """Row data for a thread: first subject, participants, latest date and snippet, unread count."""
+    messages = row.messages or []
+    latest = messages[-1] if messages else {}
+    return {
+        "id": row.thread_id,
+        "subject": next((m.get("subject") for m in messages if m.get("subject")), ""),
+        "participants": list(dict.fromkeys(_display_name(m.get("from")) for m in messages if m.get("from"))),
+        "count": len(messages),
+        "unread": sum(1 for m in messages if "UNREAD" in (m.get("labelIds") or [])),
+        "date": latest.get("date"),
+        "snippet": latest.get("snippet"),
+        "messages": messages,
+    }
+
+
+def thread_page(gmail, account: MailAccount, label_id: str, query: str, page_token: str | None, page_size: int = 25) -> tuple[list[dict], str | None]:
+    """One page of thread summaries for a label plus the next page token."""
+    listed, next_token = list_unread_threads(gmail, label_id, query, page_token, page_size)
+    thread_ids = [t["id"] for t in listed if t.get("id")]
+    index = {row.thread_id: row for row in account.threads.filter(thread_id__in=thread_ids)}
+    stale = [
+        t["id"] for t in listed
+        if t.get("id") and (t["id"] not in index or index[t["id"]].history_id != str(t.get("historyId") or ""))
+    ]
+    if stale:
+        index.update(store_threads(account, batch_fetch_threads(gmail, stale)))
+    return [thread_summary(index[tid]) for tid in thread_ids if tid in index], next_token
@@ -0,0 +1,149 @@
+"""OAuth access tokens shared by every request, session and worker of an account.
+
+The session keeps what the OAuth callback stored; a refreshed token is kept in
+the Django cache under the account instead, so one refresh serves every
+session and every worker process (the ``mailops_shared`` cache). Tokens about
+to expire within ``MAILOPS_TOKEN_REFRESH_BEFORE`` seconds are refreshed in the
+background; only a token that is already expired makes a request wait.
+Concurrent refreshes of an account collapse into a single call: threads of a
+process share one in-flight future and processes take a lock in the cache.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from google.auth import _helpers
+from google.oauth2.credentials import Credentials
+import google.auth.transport.requests
+
+from .caches import shared_cache, token_cache_key, token_lock_cache_key
+
+# Poll interval while another worker holds the refresh lock
+LOCK_POLL = 0.1
+
+
+def parse_expiry(value) -> datetime | None:
+    """Stored expiry (ISO string) as the naive UTC datetime google-auth compares against."""
+    if not value:
+        return None
+    try:
+        expiry = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if expiry.tzinfo is not None:
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+    return expiry
+
+
+class TokenManager:
+    def __init__(self, refresh_before: int, max_workers: int):
+        self.refresh_before = refresh_before
+        self._lock = threading.Lock()
+        # account_id -> refresh in flight in this process
+        self._inflight: dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mailops-token")
+
+    def credentials(self, account_id: str, data: dict) -> Credentials:
+        """Credentials for the account, preferring the newest token known to any session or worker.
+
+        An expired token is refreshed before returning (RefreshError propagates);
+        one close to expiry is refreshed in the background.
+        """
+        creds = Credentials(
+            token=data.get("token"),
+            refresh_token=data.get("refresh_token"),
+            token_uri=data.get("token_uri"),
+            client_id=data.get("client_id"),
+            client_secret=data.get("client_secret"),
+            scopes=data.get("scopes") or [],
+            expiry=parse_expiry(data.get("expiry")),
+        )
+        self._apply_shared(account_id, creds)
+        if not creds.refresh_token:
+            return creds
+        if creds.expired:
+            self._apply(creds, self._refresh_once(account_id, creds).result())
+        elif self._expiring_soon(creds):
+            self._refresh_once(account_id, creds)
+        return creds
+
+    def _expiring_soon(self, creds: Credentials) -> bool:
+        return creds.expiry is not None and creds.expiry - timedelta(seconds=self.refresh_before) <= _helpers.utcnow()
+
+    @staticmethod
+    def _apply(creds: Credentials, entry: dict) -> None:
+        creds.token = entry["token"]
+        creds.expiry = parse_expiry(entry.get("expiry"))
+
+    def _apply_shared(self, account_id: str, creds: Credentials) -> None:
+        entry = shared_cache.get(token_cache_key(account_id))
+        if entry is None:
+            return
+        expiry = parse_expiry(entry.get("expiry"))
+        # A token without a known expiry is only replaced, never preferred over a dated one
+        if creds.expiry is None or (expiry is not None and expiry > creds.expiry):
+            self._apply(creds, entry)
+
+    def _refresh_once(self, account_id: str, creds: Credentials) -> Future:
+        """Start a refresh for the account unless one is running already; both callers share its future."""
+        with self._lock:
+            future = self._inflight.get(account_id)
+            if future is not None:
+                return future
+            # Refresh a copy so requests holding ``creds`` keep a consistent token until it is applied
+            future = self._executor.submit(self._refresh, account_id, Credentials(
+                token=creds.token,
+                refresh_token=creds.refresh_token,
+                token_uri=creds.token_uri,
+                client_id=creds.client_id,
+                client_secret=creds.client_secret,
+                scopes=creds.scopes,
+                expiry=creds.expiry,
+            ))
+            self._inflight[account_id] = future
+        # Outside the lock: the callback runs right here if the refresh has finished already
+        future.add_done_callback(lambda _: self._forget(account_id, future))
+        return future
+
+    def _forget(self, account_id: str, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(account_id) is future:
+                del self._inflight[account_id]
+
+    def _refresh(self, account_id: str, creds: Credentials) -> dict:
+        lock_key = token_lock_cache_key(account_id)
+        wait = settings.MAILOPS_TOKEN_REFRESH_WAIT
+        deadline = time.monotonic() + wait
+        locked = True
+        # Another worker may be refreshing the same account: wait for its token rather than refreshing twice
+        while not shared_cache.add(lock_key, True, wait):
+            self._apply_shared(account_id, creds)
+            if not self._expiring_soon(creds):
+                return {"token": creds.token, "expiry": creds.expiry.isoformat() if creds.expiry else None}
+            if time.monotonic() >= deadline:
+                # That refresh is stuck or its worker died: refresh here rather than hand back an expired token
+                locked = False
+                break
+            time.sleep(LOCK_POLL)
+        try:
+            self._apply_shared(account_id, creds)
+            if creds.expiry is None or self._expiring_soon(creds):
+                creds.refresh(google.auth.transport.requests.Request())
+            entry = {"token": creds.token, "expiry": creds.expiry.isoformat() if creds.expiry else None}
+            timeout = None
+            if creds.expiry is not None:
+                timeout = max(int((creds.expiry - _helpers.utcnow()).total_seconds()), 1)
+            shared_cache.set(token_cache_key(account_id), entry, timeout)
+            return entry
+        finally:
+            if locked:
+                shared_cache.delete(lock_key)
+
+
+token_manager = TokenManager(
+    refresh_before=settings.MAILOPS_TOKEN_REFRESH_BEFORE,
+    max_workers=settings.MAILOPS_TOKEN_REFRESH_WORKERS,
+)
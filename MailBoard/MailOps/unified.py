@@ -0,0 +1,114 @@
+"""Unified inbox: unread Inbox mail of every connected account, newest first.
+
+Each account is brought up to date with its history delta (concurrently), then
+the per-account local stores are merged by ``internalDate`` with a heap-based
+k-way merge. Every stream is read in small, growing chunks, so a page costs
+about ``page_size + accounts`` rows rather than ``accounts * page_size``.
+The page token is a composite cursor holding the offset reached in each
+account; accounts missing from it are exhausted.
+"""
+
+import base64
+import heapq
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+
+from .gmail import gmail_pool
+from .models import MailAccount
+from .sync import message_to_dict, sync_account, unread_in_label
+
+
+UNIFIED_LABEL = "INBOX"
+
+
+def encode_cursor(offsets: dict[str, int]) -> str:
+    raw = json.dumps(offsets, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str | None, account_ids: list[str]) -> dict[str, int]:
+    """Offsets per account for a page token; no token starts every account at 0."""
+    if not token:
+        return {account_id: 0 for account_id in account_ids}
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        offsets = json.loads(raw)
+        return {aid: max(int(offsets[aid]), 0) for aid in account_ids if aid in offsets}
+    except (ValueError, TypeError, AttributeError):
+        return {account_id: 0 for account_id in account_ids}
+
+
+def _sync_one(account_id: str, email: str, creds) -> MailAccount | None:
+    try:
+        with gmail_pool.service(account_id, creds) as gmail:
+            # None when the sync failed: a store that may be behind Gmail is not shown
+            return sync_account(gmail, account_id, email)
+    finally:
+        connection.close()
+
+
+def sync_accounts(accounts: list[tuple[str, str, object]]) -> dict[str, MailAccount | None]:
+    """Sync ``(account_id, email, creds)`` accounts concurrently; None for accounts with no usable store."""
+    if not accounts:
+        return {}
+    workers = min(len(accounts), settings.MAILOPS_UNIFIED_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {aid: executor.submit(_sync_one, aid, email, creds) for aid, email, creds in accounts}
+        return {aid: future.result() for aid, future in futures.items()}
+
+
+def _stream(index: int, account: MailAccount, start: int, chunk: int, max_chunk: int, exhausted: set[int]):
+    """Yield merge keys for the account's unread Inbox rows from ``start``, querying in doubling chunks.
+
+    ``index`` is added to ``exhausted`` once the last row has been handed out.
+    """
+    qs = unread_in_label(account, UNIFIED_LABEL).prefetch_related("labels")
+    offset = start
+    while True:
+        rows = list(qs[offset:offset + chunk])
+        for row in rows:
+            yield -row.internal_date, index, row.message_id, row
+        if len(rows) < chunk:
+            exhausted.add(index)
+            return
+        offset += chunk
+        chunk = min(chunk * 2, max_chunk)
+
+
+def merged_page(accounts: list[MailAccount], page_token: str | None = None, page_size: int = 25) -> tuple[list[dict], str | None]:
+    """Return one merged page of unread Inbox messages across ``accounts`` plus the next composite cursor."""
+    offsets = decode_cursor(page_token, [a.account_id for a in accounts])
+    active = [a for a in accounts if a.account_id in offsets]
+    if not active:
+        return [], None
+    # Enough for an even split of the page plus the look-ahead row; streams grow if one account dominates
+    chunk = page_size // len(active) + 2
+    exhausted: set[int] = set()
+    streams = [
+        _stream(i, account, offsets[account.account_id], chunk, page_size + 1, exhausted)
+        for i, account in enumerate(active)
+    ]
+    items = list(islice(heapq.merge(*streams), page_size + 1))
+
+    consumed = dict.fromkeys(range(len(active)), 0)
+    messages = []
+    for _, index, _, row in items[:page_size]:
+        consumed[index] += 1
+        message = message_to_dict(row)
+        message["account_id"] = active[index].account_id
+        message["account_email"] = active[index].email
+        messages.append(message)
+    if len(items) <= page_size:
+        return messages, None
+    # heapq.merge only finishes a stream after yielding its last row, so an exhausted
+    # account has nothing left unless that row is the look-ahead one
+    lookahead = items[page_size][1]
+    next_offsets = {
+        account.account_id: offsets[account.account_id] + consumed[i]
+        for i, account in enumerate(active) if i not in exhausted or i == lookahead
+    }
+    return messages, encode_cursor(next_offsets)
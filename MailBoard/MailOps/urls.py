@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'mailops'
 
+# Under ASGI the Gmail-heavy views can overlap their API calls
+if settings.MAILOPS_ASYNC_VIEWS:
+    label_view, detail_view = async_views.dashboard_by_label, async_views.message_detail
+else:
+    label_view, detail_view = views.dashboard_by_label, views.message_detail
+
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('oauth/start/', views.oauth_start, name='oauth_start'),
@@ -12,9 +19,18 @@ urlpatterns = [
     path('accounts/add/', views.add_account, name='add_account'),
     path('accounts/switch/<str:account_id>/', views.switch_account, name='switch_account'),
     path('accounts/remove/<str:account_id>/', views.remove_account, name='remove_account'),
-    path('label/<str:label_id>/', views.dashboard_by_label, name='dashboard_by_label'),
+    path('unified/', views.unified_inbox, name='unified_inbox'),
+    path('unified/more/', views.unified_more, name='unified_more'),
+    path('label/<str:label_id>/', label_view, name='dashboard_by_label'),
+    path('label/<str:label_id>/more/', views.label_more, name='label_more'),
+    path('label/<str:label_id>/threads/', views.label_threads, name='label_threads'),
     path('label/<str:label_id>/delete_all/', views.label_delete_all, name='label_delete_all'),
-    path('message/<str:message_id>/', views.message_detail, name='message_detail'),
+    path('gmail/push/', views.gmail_push, name='gmail_push'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('messages/labels/', views.bulk_label_messages, name='bulk_label_messages'),
+    path('message/<str:message_id>/', detail_view, name='message_detail'),
+    path('message/<str:message_id>/attachments/<str:part_id>/', views.message_attachment, name='message_attachment'),
     path('message/<str:message_id>/delete/', views.message_delete, name='message_delete'),
     path('message/<str:message_id>/add_labels/', views.add_labels_to_message, name='add_labels_to_message'),
     path('message/<str:message_id>/remove_labels/', views.remove_labels_from_message, name='remove_labels_from_message'),
@@ -1,33 +1,150 @@
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, redirect
 from django.urls import reverse
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.crypto import constant_time_compare
+from django.utils.http import url_has_allowed_host_and_scheme, urlencode
+from django.views.decorators.csrf import csrf_exempt
 
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-import google.auth.transport.requests
-from googleapiclient.http import BatchHttpRequest
+
+from .attachments import attachment_cache, attachment_key, attachment_response, fetch_attachment
+from .caches import (
+    cached_listing,
+    inbox_pages_cache_key,
+    invalidate_label_counts,
+    label_counts_cache_key,
+    label_counts_ttl,
+    labels_cache_key,
+    message_bodies,
+    message_size,
+    prefetched_page_cache_key,
+    remember_listing,
+    shared_cache,
+)
+from .gmail import batch_fetch_metadata, batch_get, build_service, gmail_pool, list_unread_ids, parse_message
+from .jobs import ACTIVE_STATUSES, fail_stale_jobs, start_trash_label
+from .metrics import metrics
+from .models import MailJob
+from .prefetch import prefetcher
+from .push import parse_push, record_notification, refresh_in_background
+from .search import fts_enabled, search_messages, to_fts_query
+from .sync import (
+    LOCAL_PAGE_PREFIX,
+    OLDER_PAGE_PREFIX,
+    apply_label_change,
+    get_account,
+    local_messages,
+    older_messages,
+    sync_account,
+)
+from .threads import thread_page
+from .tokens import token_manager
+from .unified import merged_page, sync_accounts
+
+
+def _current_account_id(request: HttpRequest) -> str | None:
+    return request.session.get("current_account")
+
+
+def _gmail_service(request: HttpRequest, creds: Credentials):
+    """Check out a pooled Gmail client for the current account (use as a context manager)."""
+    return gmail_pool.service(_current_account_id(request), creds)
+
+
+def _cached_labels(account_id: str | None) -> list[dict] | None:
+    return shared_cache.get(labels_cache_key(account_id)) if account_id else None
+
+
+def _fetch_labels(gmail) -> list[dict]:
+    return gmail.users().labels().list(userId="me").execute().get("labels", [])
+
+
+def _store_labels(account_id: str | None, labels: list[dict]) -> None:
+    if account_id:
+        shared_cache.set(labels_cache_key(account_id), labels, label_counts_ttl(account_id))
+
+
+def _list_labels(gmail, account_id: str | None) -> list[dict]:
+    """labels.list for the account, cached alongside the label counts."""
+    labels = _cached_labels(account_id)
+    if labels is None:
+        labels = _fetch_labels(gmail)
+        _store_labels(account_id, labels)
+    # Callers annotate the dicts with counts, so hand out copies
+    return [dict(lb) for lb in labels]
+
+
+def _fetch_label_counts(gmail, label_ids: list[str]) -> dict[str, dict]:
+    """Fetch messagesUnread/messagesTotal for many labels using batched labels.get calls."""
+    responses = batch_get(gmail, label_ids, lambda client, label_id: client.users().labels().get(userId="me", id=label_id))
+    return {
+        label_id: {
+            "messagesUnread": detail.get("messagesUnread", 0),
+            "messagesTotal": detail.get("messagesTotal", 0),
+        }
+        for label_id, detail in responses.items()
+    }
+
+
+def _cached_label_counts(account_id: str | None, label_ids: list[str]) -> dict[str, dict] | None:
+    """Cached counts of the account, or None unless they cover every label in ``label_ids``."""
+    counts = shared_cache.get(label_counts_cache_key(account_id)) if account_id else None
+    if counts is None or any(label_id not in counts for label_id in label_ids):
+        return None
+    return counts
 
 
-def _enrich_labels_with_counts(gmail, labels: list[dict]) -> tuple[list[dict], list[dict]]:
-    """Return (user_labels, system_labels) with unread message counts for each label."""
+def _store_label_counts(account_id: str | None, counts: dict[str, dict]) -> None:
+    if account_id and counts:
+        shared_cache.set(label_counts_cache_key(account_id), counts, label_counts_ttl(account_id))
+
+
+def _split_labels(labels: list[dict], counts: dict[str, dict]) -> tuple[list[dict], list[dict]]:
+    """Annotate ``labels`` with their counts and return them as (user_labels, system_labels)."""
     user_labels: list[dict] = []
     system_labels: list[dict] = []
     for lb in labels or []:
-        label_id = lb.get("id")
-        try:
-            # Use label metadata which includes messagesUnread/messagesTotal
-            detail = gmail.users().labels().get(userId="me", id=label_id).execute()
-            lb["messagesTotal"] = detail.get("messagesUnread", 0)
-        except Exception:
-            lb["messagesTotal"] = 0
+        detail = counts.get(lb.get("id")) or {}
+        # Use label metadata which includes messagesUnread/messagesTotal
+        lb["messagesUnread"] = detail.get("messagesUnread", 0)
+        lb["messagesTotal"] = detail.get("messagesUnread", 0)
         (user_labels if (lb.get("type") == "user") else system_labels).append(lb)
     # Sort alphabetically by name for stable UI
     user_labels.sort(key=lambda x: (x.get("name") or "").lower())
     system_labels.sort(key=lambda x: (x.get("name") or "").lower())
     return user_labels, system_labels
 
+
+def _enrich_labels_with_counts(gmail, labels: list[dict], account_id: str | None = None) -> tuple[list[dict], list[dict]]:
+    """Return (user_labels, system_labels) with unread message counts for each label.
+
+    Counts are fetched in batches and cached per account for
+    ``MAILOPS_LABEL_COUNTS_TTL`` seconds (``MAILOPS_WATCHED_COUNTS_TTL`` for accounts
+    with a Gmail push watch); label-changing views and push notifications invalidate them.
+    """
+    label_ids = [lb.get("id") for lb in labels or [] if lb.get("id")]
+    counts = _cached_label_counts(account_id, label_ids)
+    if counts is None:
+        counts = _fetch_label_counts(gmail, label_ids)
+        _store_label_counts(account_id, counts)
+    return _split_labels(labels, counts)
+
+
+def _unread_total(labels: list[dict]) -> int:
+    """Overall unread count taken from the (already enriched) UNREAD system label."""
+    for lb in labels or []:
+        if lb.get("id") == "UNREAD" or (lb.get("name") or "").upper() == "UNREAD":
+            return lb.get("messagesUnread", 0)
+    return 0
+
 def _client_config() -> dict:
     return {
         "web": {
@@ -58,7 +175,7 @@ def oauth_callback(request: HttpRequest) -> HttpResponse:
     creds = flow.credentials
     
     # Get user profile to identify account
-    gmail = build("gmail", "v1", credentials=creds)
+    gmail = build_service(creds)
     try:
         profile = gmail.users().getProfile(userId="me").execute()
         email = profile.get("emailAddress")
@@ -72,7 +189,7 @@ def oauth_callback(request: HttpRequest) -> HttpResponse:
     if "accounts" not in request.session:
         request.session["accounts"] = {}
     
-    # Store account credentials and profile
+    # Store account credentials; the session is loaded on every request, so keep it small
     request.session["accounts"][account_id] = {
         "email": email,
         "credentials": {
@@ -84,7 +201,6 @@ def oauth_callback(request: HttpRequest) -> HttpResponse:
             "scopes": list(creds.scopes or []),
             "expiry": creds.expiry.isoformat() if creds.expiry else None,
         },
-        "profile": profile
     }
     
     # Set as current account
@@ -97,90 +213,156 @@ def oauth_callback(request: HttpRequest) -> HttpResponse:
 
 
 def _get_session_creds(request: HttpRequest) -> Credentials | None:
+    return _account_creds(request, request.session.get("current_account"))
+
+
+def _account_creds(request: HttpRequest, account_id: str | None) -> Credentials | None:
     accounts = request.session.get("accounts", {})
-    current_account_id = request.session.get("current_account")
     
-    if not current_account_id or current_account_id not in accounts:
+    if not account_id or account_id not in accounts:
         return None
     
-    account_data = accounts[current_account_id]
+    account_data = accounts[account_id]
     data = account_data.get("credentials")
     if not data:
         return None
     
-    creds = Credentials(
-        token=data.get("token"),
-        refresh_token=data.get("refresh_token"),
-        token_uri=data.get("token_uri"),
-        client_id=data.get("client_id"),
-        client_secret=data.get("client_secret"),
-        scopes=data.get("scopes") or [],
-    )
-    if creds and creds.expired and creds.refresh_token:
-        request_adapter = google.auth.transport.requests.Request()
-        creds.refresh(request_adapter)
-        # update session
-        request.session["accounts"][current_account_id]["credentials"]["token"] = creds.token
-        request.session["accounts"][current_account_id]["credentials"]["expiry"] = (
-            creds.expiry.isoformat() if creds.expiry else None
-        )
-    return creds
-
-
-def _batch_fetch_metadata(gmail, message_ids: list[str]) -> list[dict]:
-    results: list[dict] = []
-
-    def _callback(request_id, response, exception):
-        if exception is None and response is not None:
-            headers = {h["name"]: h["value"] for h in response.get("payload", {}).get("headers", [])}
-            results.append(
-                {
-                    "id": response.get("id"),
-                    "snippet": response.get("snippet"),
-                    "subject": headers.get("Subject"),
-                    "from": headers.get("From"),
-                    "to": headers.get("To"),
-                    "date": headers.get("Date"),
-                    "labelIds": response.get("labelIds", []),
-                }
-            )
+    return token_manager.credentials(account_id, data)
 
-    if not message_ids:
-        return results
-
-    # Gmail batch prefers up to 100 calls per batch
-    for i in range(0, len(message_ids), 100):
-        chunk = message_ids[i:i+100]
-        # Use per-API batch endpoint (global batch is deprecated and returns 404)
-        batch = BatchHttpRequest(callback=_callback, batch_uri='https://gmail.googleapis.com/batch/gmail/v1')
-        for mid in chunk:
-            batch.add(
-                gmail.users().messages().get(
-                    userId="me",
-                    id=mid,
-                    format="metadata",
-                    metadataHeaders=["Subject", "From", "Date", "To"],
-                )
-            )
+
+def _local_page(gmail, current_account_id, current_account: dict, labels: list[dict], label_id: str, query: str, page_token: str | None) -> tuple[list[dict], str | None] | None:
+    """Serve a page of unread messages from the synced local store, or None to ask Gmail.
+
+    Only the history delta is pulled from Gmail. Plain searches are answered by
+    the local full-text index; queries with Gmail operators fall back to Gmail.
+    """
+    if page_token and not page_token.startswith((LOCAL_PAGE_PREFIX, OLDER_PAGE_PREFIX)):
+        return None
+    fts_query = None
+    if query:
+        fts_query = to_fts_query(query) if fts_enabled() else None
+        if fts_query is None:
+            return None
+    account = sync_account(gmail, current_account_id, current_account.get("email", ""), labels)
+    if account is None:
+        return None
+    if page_token and page_token.startswith(OLDER_PAGE_PREFIX):
+        return older_messages(gmail, account, label_id, page_token)
+    if fts_query:
+        # The index only holds the seeded window; Gmail searches everything
+        if not account.seed_complete:
+            return None
+        return search_messages(account, label_id, fts_query, page_token)
+    return local_messages(account, label_id, page_token)
+
+
+def _take_prefetched_page(account_id: str | None, label_id: str, query: str, page_token: str | None) -> tuple[list[dict], str | None] | None:
+    if not (account_id and page_token):
+        return None
+    key = prefetched_page_cache_key(account_id, label_id, query, page_token)
+    page = shared_cache.get(key)
+    if page is not None:
+        shared_cache.delete(key)
+    return page
+
+
+def _gmail_page(gmail, label_id: str, query: str, page_token: str | None, account_id: str | None = None) -> tuple[list[dict], str | None]:
+    """Fetch one page of unread messages for a label straight from Gmail (or take the prefetched copy)."""
+    page = _take_prefetched_page(account_id, label_id, query, page_token)
+    if page is not None:
+        return page
+    ids, next_token = list_unread_ids(gmail, label_id, query, page_token)
+    return batch_fetch_metadata(gmail, ids), next_token
+
+
+def _remember_page(request: HttpRequest, cache_key: str, messages: list[dict], next_token: str | None, append_mode: bool) -> list[dict]:
+    """Record the page in the account's server-side listing cache; in append mode return it joined to the earlier pages."""
+    # Pages used to be kept in the session itself; drop what older sessions still carry
+    request.session.pop("inbox_cache", None)
+    return remember_listing(_current_account_id(request), cache_key, messages, next_token, append_mode)
+
+
+def _label_page_context(current_account_id: str | None, label_id: str, labels: list[dict]) -> dict:
+    """Template flags for a label page: the scrape "Delete all" button and any running job."""
+    is_scrape = False
+    for lb in labels:
+        if lb.get("id") == label_id and (lb.get("name") or "").lower() == "scrape":
+            is_scrape = True
+            break
+    label_jobs = MailJob.objects.filter(account__account_id=current_account_id, label_id=label_id)
+    fail_stale_jobs(label_jobs)
+    active_job = label_jobs.filter(status__in=ACTIVE_STATUSES).first()
+    return {"active_label": label_id, "is_scrape_label": is_scrape, "active_job": active_job, "row_placeholder": ROW_PLACEHOLDER}
+
+
+# Message the row <template> is rendered with; the page script swaps in the ids of rows loaded as JSON
+ROW_PLACEHOLDER = {"id": "__ID__", "account_id": "__ACCOUNT__"}
+
+STREAM_ROWS_MARKER = "<!--mailops:rows-->"
+STREAM_PAGINATOR_MARKER = "<!--mailops:paginator-->"
+
+
+def _render_rows(request: HttpRequest, rows) -> str:
+    """Render ``(position, message)`` pairs with the row template; ``position`` is the row's CSS order."""
+    template = get_template("mailops/_message_row.html")
+    return "".join(template.render({"m": m, "position": position}, request) for position, m in rows)
+
+
+def _stream_label_page(request: HttpRequest, creds, context: dict, label_id: str, query: str, page_token: str | None, append_mode: bool, cache_key: str):
+    """Render a label page progressively (``MAILOPS_STREAM_LIST``).
+
+    The page shell with the sidebar is rendered up front, so the CSRF cookie is
+    set before the response starts. The generator then sends the shell, rows
+    from earlier pages in append mode, the new rows as each metadata batch
+    completes, and finally the paginator. Rows carry their position as CSS
+    ``order`` because batches finish in any order.
+    """
+    account_id = _current_account_id(request)
+    html = render_to_string("mailops/dashboard.html", {**context, "streaming": True}, request=request)
+    head, rest = html.split(STREAM_ROWS_MARKER, 1)
+    middle, tail = rest.split(STREAM_PAGINATOR_MARKER, 1)
+    # The listing cache is written once the page is complete; drop what older sessions still carry now
+    request.session.pop("inbox_cache", None)
+
+    def stream():
+        yield head
+        earlier = cached_listing(account_id, cache_key) if append_mode else []
+        if earlier:
+            yield _render_rows(request, enumerate(earlier))
+        offset = len(earlier)
+        messages, next_token = [], None
         try:
-            batch.execute()
+            with gmail_pool.service(account_id, creds) as gmail:
+                page = _local_page(gmail, account_id, context["current_account"], context["labels_user"] + context["labels_system"], label_id, query, page_token)
+                if page is None:
+                    page = _take_prefetched_page(account_id, label_id, query, page_token)
+                if page is None:
+                    ids, next_token = list_unread_ids(gmail, label_id, query, page_token)
+                    positions = {mid: offset + i for i, mid in enumerate(ids)}
+                    batches = queue.SimpleQueue()
+                    with ThreadPoolExecutor(max_workers=1) as executor:
+                        future = executor.submit(
+                            batch_fetch_metadata, gmail, ids, settings.MAILOPS_STREAM_CHUNK, batches.put
+                        )
+                        future.add_done_callback(lambda _: batches.put(None))
+                        while (batch := batches.get()) is not None:
+                            yield _render_rows(request, ((positions[m["id"]], m) for m in batch))
+                        messages = future.result()
+                else:
+                    messages, next_token = page
+                    yield _render_rows(request, enumerate(messages, offset))
         except Exception:
-            # Fallback: fetch sequentially if batch fails
-            for mid in chunk:
-                try:
-                    response = gmail.users().messages().get(
-                        userId="me",
-                        id=mid,
-                        format="metadata",
-                        metadataHeaders=["Subject", "From", "Date", "To"],
-                    ).execute()
-                    _callback(None, response, None)
-                except Exception:
-                    continue
-    # Keep original order (best-effort)
-    order = {mid: idx for idx, mid in enumerate(message_ids)}
-    results.sort(key=lambda m: order.get(m.get("id", ""), 0))
-    return results
+            # The status line has gone out already; say so in the list instead
+            yield '<p style="padding: 12px; color: var(--danger);">Could not load messages from Gmail</p>'
+        if not earlier and not messages:
+            yield '<p style="padding: 12px; color: var(--muted);">No unread messages</p>'
+        yield middle
+        yield render_to_string("mailops/_paginator.html", {**context, "nextPageToken": next_token})
+        yield tail
+        remember_listing(account_id, cache_key, messages, next_token, append_mode)
+        prefetcher.schedule(account_id, creds, label_id, query, messages, next_token)
+
+    return stream()
 
 
 def dashboard(request: HttpRequest) -> HttpResponse:
@@ -188,95 +370,72 @@ def dashboard(request: HttpRequest) -> HttpResponse:
     if not creds:
         return render(request, "mailops/dashboard.html", {"connected": False})
 
-    gmail = build("gmail", "v1", credentials=creds)
-    
-    # Get current account info
-    accounts = request.session.get("accounts", {})
-    current_account_id = request.session.get("current_account")
-    current_account = accounts.get(current_account_id, {})
-    
-    # Labels
-    labels_resp = gmail.users().labels().list(userId="me").execute()
-    labels = labels_resp.get("labels", [])
-    user_labels, system_labels = _enrich_labels_with_counts(gmail, labels)
-    
-    # Find Primary label (INBOX) and redirect to it by default
-    primary_label_id = None
-    for label in labels:
-        if label.get("name", "").lower() == "inbox":
-            primary_label_id = label.get("id")
-            break
-    
-    # If Primary label exists, redirect to it
-    if primary_label_id:
-        return redirect(reverse("mailops:dashboard_by_label", args=[primary_label_id]))
-    
-    try:
-        # Compute overall unread count from UNREAD system label metadata
-        unread_label_id = None
-        for lb in labels:
-            if lb.get("id") == "UNREAD" or (lb.get("name") or "").upper() == "UNREAD":
-                unread_label_id = lb.get("id")
+    with _gmail_service(request, creds) as gmail:
+        # Get current account info
+        accounts = request.session.get("accounts", {})
+        current_account_id = request.session.get("current_account")
+        current_account = accounts.get(current_account_id, {})
+        
+        # Labels
+        labels = _list_labels(gmail, current_account_id)
+        
+        # Find Primary label (INBOX) and redirect to it by default
+        primary_label_id = None
+        for label in labels:
+            if label.get("name", "").lower() == "inbox":
+                primary_label_id = label.get("id")
                 break
-        if unread_label_id:
-            unread_detail = gmail.users().labels().get(userId="me", id=unread_label_id).execute()
-            # Some accounts expose messagesUnread; messagesTotal on UNREAD also reflects unread total
-            all_messages_total = unread_detail.get("messagesUnread", unread_detail.get("messagesTotal", 0))
-        else:
-            all_messages_total = 0
-    except Exception:
-        all_messages_total = 0
-
-    # Fetch only unread messages
-    page_token = request.GET.get("pageToken")
-    append_mode = request.GET.get("append") == "1"
-    query = (request.GET.get("q") or "").strip()
-    list_kwargs = {"userId": "me", "maxResults": 25, "labelIds": ["UNREAD"]}
-    if page_token:
-        list_kwargs["pageToken"] = page_token
-    if query:
-        list_kwargs["q"] = query
-    msgs_resp = gmail.users().messages().list(**list_kwargs).execute()
-    ids = [m["id"] for m in (msgs_resp.get("messages") or [])]
-    messages = _batch_fetch_metadata(gmail, ids)
-    next_token = msgs_resp.get("nextPageToken")
-
-    # Accumulate messages in session when append is requested
-    cache_key = "search__" + query if query else "inbox__all"
-    cache = request.session.get("inbox_cache", {})
-    if append_mode:
-        existing = (cache.get(cache_key, {}).get("messages") or [])
-        combined = existing + messages
-        # prevent unbounded growth (keep latest 500)
-        combined = combined[-500:]
-        cache[cache_key] = {"messages": combined, "next": next_token}
-        messages = combined
-    else:
-        cache[cache_key] = {"messages": messages, "next": next_token}
-    request.session["inbox_cache"] = cache
-
-    return render(
-        request,
-        "mailops/dashboard.html",
-        {
-            "connected": True,
-            "current_account": current_account,
-            "accounts": accounts,
-            "labels_user": user_labels,
-            "labels_system": system_labels,
-            "messages": messages,
-            "nextPageToken": next_token,
-            "all_messages_total": all_messages_total,
-            "query": query,
-        },
-    )
+        
+        # If Primary label exists, redirect to it
+        if primary_label_id:
+            return redirect(reverse("mailops:dashboard_by_label", args=[primary_label_id]))
+        
+        user_labels, system_labels = _enrich_labels_with_counts(gmail, labels, current_account_id)
+        # Overall unread count comes from the UNREAD system label fetched in the same batch
+        all_messages_total = _unread_total(labels)
+
+        # Fetch only unread messages
+        page_token = request.GET.get("pageToken")
+        append_mode = request.GET.get("append") == "1"
+        query = (request.GET.get("q") or "").strip()
+        page = _local_page(gmail, current_account_id, current_account, labels, "UNREAD", query, page_token)
+        if page is None:
+            page = _gmail_page(gmail, "UNREAD", query, page_token, current_account_id)
+        messages, next_token = page
+        prefetcher.schedule(current_account_id, creds, "UNREAD", query, messages, next_token)
+
+        # Accumulate messages in session when append is requested
+        cache_key = "search__" + query if query else "inbox__all"
+        messages = _remember_page(request, cache_key, messages, next_token, append_mode)
+
+        return render(
+            request,
+            "mailops/dashboard.html",
+            {
+                "connected": True,
+                "current_account": current_account,
+                "accounts": accounts,
+                "labels_user": user_labels,
+                "labels_system": system_labels,
+                "messages": messages,
+                "nextPageToken": next_token,
+                "all_messages_total": all_messages_total,
+                "query": query,
+                "row_placeholder": ROW_PLACEHOLDER,
+            },
+        )
 
 
 def logout_view(request: HttpRequest) -> HttpResponse:
+    for account_id in request.session.get("accounts", {}):
+        gmail_pool.discard(account_id)
+        prefetcher.cancel(account_id)
+        cache.delete(inbox_pages_cache_key(account_id))
     request.session.pop("accounts", None)
     request.session.pop("current_account", None)
     request.session.pop("oauth_state", None)
     request.session.pop("google_credentials", None)
+    request.session.pop("inbox_cache", None)
     return redirect(reverse("mailops:dashboard"))
 
 
@@ -307,6 +466,10 @@ def switch_account(request: HttpRequest, account_id: str) -> HttpResponse:
     accounts = request.session.get("accounts", {})
     if account_id in accounts:
         request.session["current_account"] = account_id
+    # The unified inbox opens messages of other accounts through here
+    next_url = request.GET.get("next")
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
     return redirect(reverse("mailops:dashboard"))
 
 
@@ -318,6 +481,9 @@ def remove_account(request: HttpRequest, account_id: str) -> HttpResponse:
     if account_id in accounts:
         del accounts[account_id]
         request.session["accounts"] = accounts
+        gmail_pool.discard(account_id)
+        prefetcher.cancel(account_id)
+        cache.delete(inbox_pages_cache_key(account_id))
         
         # If we removed the current account, switch to another one
         current_account_id = request.session.get("current_account")
@@ -334,66 +500,78 @@ def dashboard_by_label(request: HttpRequest, label_id: str) -> HttpResponse:
     creds = _get_session_creds(request)
     if not creds:
         return redirect(reverse("mailops:dashboard"))
-    gmail = build("gmail", "v1", credentials=creds)
-    
-    # Get current account info
+    with _gmail_service(request, creds) as gmail:
+        # Get current account info
+        accounts = request.session.get("accounts", {})
+        current_account_id = request.session.get("current_account")
+        current_account = accounts.get(current_account_id, {})
+        
+        labels = _list_labels(gmail, current_account_id)
+        user_labels, system_labels = _enrich_labels_with_counts(gmail, labels, current_account_id)
+        all_messages_total = _unread_total(labels)
+        page_token = request.GET.get("pageToken")
+        append_mode = request.GET.get("append") == "1"
+        query = (request.GET.get("q") or "").strip()
+        cache_key = f"unread_label__{label_id}__{query}" if query else f"unread_label__{label_id}"
+
+        if settings.MAILOPS_STREAM_LIST:
+            context = {
+                "connected": True,
+                "current_account": current_account,
+                "accounts": accounts,
+                "labels_user": user_labels,
+                "labels_system": system_labels,
+                "all_messages_total": all_messages_total,
+                "query": query,
+                **_label_page_context(current_account_id, label_id, user_labels + system_labels),
+            }
+            return StreamingHttpResponse(
+                _stream_label_page(request, creds, context, label_id, query, page_token, append_mode, cache_key)
+            )
+
+        page = _local_page(gmail, current_account_id, current_account, labels, label_id, query, page_token)
+        if page is None:
+            page = _gmail_page(gmail, label_id, query, page_token, current_account_id)
+        messages, next_token = page
+        prefetcher.schedule(current_account_id, creds, label_id, query, messages, next_token)
+
+        # Accumulate per-label in session when append is requested
+        messages = _remember_page(request, cache_key, messages, next_token, append_mode)
+        context = _label_page_context(current_account_id, label_id, user_labels + system_labels)
+        return render(
+            request,
+            "mailops/dashboard.html",
+            {
+                "connected": True,
+                "current_account": current_account,
+                "accounts": accounts,
+                "labels_user": user_labels,
+                "labels_system": system_labels,
+                "messages": messages,
+                "nextPageToken": next_token,
+                "all_messages_total": all_messages_total,
+                "query": query,
+                **context,
+            },
+        )
+
+
+def label_threads(request: HttpRequest, label_id: str) -> HttpResponse:
+    """Conversation view of a label: one row per thread with unread mail."""
+    creds = _get_session_creds(request)
+    if not creds:
+        return redirect(reverse("mailops:dashboard"))
     accounts = request.session.get("accounts", {})
     current_account_id = request.session.get("current_account")
     current_account = accounts.get(current_account_id, {})
-    
-    labels_resp = gmail.users().labels().list(userId="me").execute()
-    labels = labels_resp.get("labels", [])
-    user_labels, system_labels = _enrich_labels_with_counts(gmail, labels)
-    try:
-        # Compute overall unread count from UNREAD system label metadata
-        unread_label_id = None
-        for lb in labels:
-            if lb.get("id") == "UNREAD" or (lb.get("name") or "").upper() == "UNREAD":
-                unread_label_id = lb.get("id")
-                break
-        if unread_label_id:
-            unread_detail = gmail.users().labels().get(userId="me", id=unread_label_id).execute()
-            all_messages_total = unread_detail.get("messagesUnread", unread_detail.get("messagesTotal", 0))
-        else:
-            all_messages_total = 0
-    except Exception:
-        all_messages_total = 0
     page_token = request.GET.get("pageToken")
-    append_mode = request.GET.get("append") == "1"
     query = (request.GET.get("q") or "").strip()
-    
-    # Fetch only unread messages for this label
-    list_kwargs = {"userId": "me", "labelIds": [label_id, "UNREAD"], "maxResults": 25}
-    
-    if page_token:
-        list_kwargs["pageToken"] = page_token
-    if query:
-        list_kwargs["q"] = f"is:unread {query}"
-    else:
-        list_kwargs["q"] = "is:unread"
-    
-    msgs_resp = gmail.users().messages().list(**list_kwargs).execute()
-    ids = [m["id"] for m in (msgs_resp.get("messages") or [])]
-    messages = _batch_fetch_metadata(gmail, ids)
-    next_token = msgs_resp.get("nextPageToken")
-
-    # Accumulate per-label in session when append is requested
-    cache_key = f"unread_label__{label_id}__{query}" if query else f"unread_label__{label_id}"
-    cache = request.session.get("inbox_cache", {})
-    if append_mode:
-        existing = (cache.get(cache_key, {}).get("messages") or [])
-        combined = existing + messages
-        combined = combined[-500:]
-        cache[cache_key] = {"messages": combined, "next": next_token}
-        messages = combined
-    else:
-        cache[cache_key] = {"messages": messages, "next": next_token}
-    request.session["inbox_cache"] = cache
-    is_scrape = False
-    for lb in (user_labels + system_labels):
-        if lb.get("id") == label_id and (lb.get("name") or "").lower() == "scrape":
-            is_scrape = True
-            break
+
+    with _gmail_service(request, creds) as gmail:
+        labels = _list_labels(gmail, current_account_id)
+        user_labels, system_labels = _enrich_labels_with_counts(gmail, labels, current_account_id)
+        account = get_account(current_account_id, current_account.get("email", ""))
+        threads, next_token = thread_page(gmail, account, label_id, query, page_token)
     return render(
         request,
         "mailops/dashboard.html",
@@ -403,132 +581,267 @@ def dashboard_by_label(request: HttpRequest, label_id: str) -> HttpResponse:
             "accounts": accounts,
             "labels_user": user_labels,
             "labels_system": system_labels,
-            "messages": messages,
-            "active_label": label_id,
+            "threads_view": True,
+            "threads": threads,
             "nextPageToken": next_token,
-            "all_messages_total": all_messages_total,
-            "is_scrape_label": is_scrape,
+            "all_messages_total": _unread_total(labels),
             "query": query,
+            **_label_page_context(current_account_id, label_id, user_labels + system_labels),
         },
     )
 
 
+def unified_inbox(request: HttpRequest) -> HttpResponse:
+    """Unread Inbox mail of every connected account on one page, newest first."""
+    creds = _get_session_creds(request)
+    if not creds:
+        return redirect(reverse("mailops:dashboard"))
+    accounts = request.session.get("accounts", {})
+    current_account_id = request.session.get("current_account")
+    current_account = accounts.get(current_account_id, {})
+
+    connected = []
+    for account_id, account in accounts.items():
+        account_creds = _account_creds(request, account_id)
+        if account_creds:
+            connected.append((account_id, account.get("email", ""), account_creds))
+    synced = sync_accounts(connected)
+    unavailable = [accounts[aid].get("email") or aid for aid, account in synced.items() if account is None]
+
+    page_token = request.GET.get("pageToken")
+    append_mode = request.GET.get("append") == "1"
+    messages, next_token = merged_page([account for account in synced.values() if account], page_token)
+    messages = _remember_page(request, "unified", messages, next_token, append_mode)
+
+    # The sidebar still shows the current account's labels
+    with _gmail_service(request, creds) as gmail:
+        labels = _list_labels(gmail, current_account_id)
+        user_labels, system_labels = _enrich_labels_with_counts(gmail, labels, current_account_id)
+    return render(
+        request,
+        "mailops/dashboard.html",
+        {
+            "connected": True,
+            "unified": True,
+            "current_account": current_account,
+            "accounts": accounts,
+            "labels_user": user_labels,
+            "labels_system": system_labels,
+            "messages": messages,
+            "nextPageToken": next_token,
+            "all_messages_total": _unread_total(labels),
+            "unavailable_accounts": unavailable,
+            "row_placeholder": ROW_PLACEHOLDER,
+        },
+    )
+
+
+# Fields of the rows the infinite-scroll endpoints return (plus the account on unified rows)
+ROW_FIELDS = ("id", "subject", "from", "date", "snippet")
+UNIFIED_ROW_FIELDS = ROW_FIELDS + ("account_id", "account_email")
+
+
+def _more_response(messages: list[dict], next_token: str | None, more_url: str, query: str = "", fields=ROW_FIELDS) -> JsonResponse:
+    """One scroll step: compact rows plus the URL of the step after it (None at the end)."""
+    next_url = None
+    if next_token:
+        params = {"cursor": next_token, **({"q": query} if query else {})}
+        next_url = f"{more_url}?{urlencode(params)}"
+    return JsonResponse({
+        "messages": [{field: m.get(field) for field in fields} for m in messages],
+        "next_cursor": next_token,
+        "next_url": next_url,
+    })
+
+
+def label_more(request: HttpRequest, label_id: str) -> HttpResponse:
+    """Next page of a label listing as JSON, for "Load more" and infinite scroll.
+
+    Unlike ``?append=1`` this skips the sidebar and label counts: a Gmail cursor
+    costs one messages.list plus one metadata batch (nothing if prefetched), a
+    local cursor only a query on the synced store.
+    """
+    creds = _get_session_creds(request)
+    if not creds:
+        return JsonResponse({"error": "Not connected"}, status=401)
+    cursor = request.GET.get("cursor")
+    if not cursor:
+        return JsonResponse({"error": "cursor is required"}, status=400)
+    current_account_id = request.session.get("current_account")
+    current_account = request.session.get("accounts", {}).get(current_account_id, {})
+    query = (request.GET.get("q") or "").strip()
+
+    if cursor.startswith(LOCAL_PAGE_PREFIX):
+        # The first page synced the store already; later pages are read as they are
+        account = get_account(current_account_id, current_account.get("email", ""))
+        fts_query = to_fts_query(query) if query and fts_enabled() else None
+        if query and fts_query is None:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        page = search_messages(account, label_id, fts_query, cursor) if fts_query else local_messages(account, label_id, cursor)
+        if page is None:
+            return JsonResponse({"error": "Search index unavailable"}, status=503)
+    elif cursor.startswith(OLDER_PAGE_PREFIX):
+        account = get_account(current_account_id, current_account.get("email", ""))
+        with _gmail_service(request, creds) as gmail:
+            page = older_messages(gmail, account, label_id, cursor)
+    else:
+        with _gmail_service(request, creds) as gmail:
+            page = _gmail_page(gmail, label_id, query, cursor, current_account_id)
+    messages, next_token = page
+    prefetcher.schedule(current_account_id, creds, label_id, query, messages, next_token)
+    return _more_response(messages, next_token, reverse("mailops:label_more", args=[label_id]), query)
+
+
+def unified_more(request: HttpRequest) -> HttpResponse:
+    """Next page of the unified inbox as JSON, read from the local stores the first page synced."""
+    if not _get_session_creds(request):
+        return JsonResponse({"error": "Not connected"}, status=401)
+    cursor = request.GET.get("cursor")
+    if not cursor:
+        return JsonResponse({"error": "cursor is required"}, status=400)
+    accounts = request.session.get("accounts", {})
+    stores = [
+        get_account(account_id, account.get("email", ""))
+        for account_id, account in accounts.items() if _account_creds(request, account_id)
+    ]
+    messages, next_token = merged_page(stores, cursor)
+    return _more_response(messages, next_token, reverse("mailops:unified_more"), fields=UNIFIED_ROW_FIELDS)
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Gmail API call metrics in the Prometheus text format.
+
+    When ``MAILOPS_METRICS_TOKEN`` is set, scrapers must send it as
+    ``Authorization: Bearer <token>``.
+    """
+    if settings.MAILOPS_METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not constant_time_compare(token.strip(), settings.MAILOPS_METRICS_TOKEN):
+            return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+def gmail_push(request: HttpRequest) -> HttpResponse:
+    """Pub/Sub push endpoint for Gmail users.watch notifications.
+
+    The subscription's push URL must carry ``?token=<MAILOPS_PUSH_TOKEN>``.
+    Any 2xx acknowledges the message; Pub/Sub redelivers on other statuses.
+    """
+    if request.method != "POST" or not settings.MAILOPS_PUSH_TOKEN:
+        return HttpResponse(status=404)
+    if not constant_time_compare(request.GET.get("token", ""), settings.MAILOPS_PUSH_TOKEN):
+        return HttpResponse(status=403)
+    try:
+        email, history_id = parse_push(json.loads(request.body))
+    except ValueError:
+        # Malformed messages would be redelivered forever; acknowledge and drop them
+        return HttpResponse(status=204)
+    for account in record_notification(email, history_id):
+        refresh_in_background(account)
+    return HttpResponse(status=204)
+
+
 def label_delete_all(request: HttpRequest, label_id: str) -> HttpResponse:
     if request.method != 'POST':
         return redirect(reverse('mailops:dashboard_by_label', args=[label_id]))
     creds = _get_session_creds(request)
     if not creds:
         return redirect(reverse("mailops:dashboard"))
-    gmail = build("gmail", "v1", credentials=creds)
-    # List messages for this label in pages and delete
-    next_token = None
-    try:
-        while True:
-            kwargs = {"userId": "me", "labelIds": [label_id], "maxResults": 500}
-            if next_token:
-                kwargs["pageToken"] = next_token
-            resp = gmail.users().messages().list(**kwargs).execute()
-            ids = [m["id"] for m in (resp.get("messages") or [])]
-            for mid in ids:
-                try:
-                    gmail.users().messages().trash(userId='me', id=mid).execute()
-                except Exception:
-                    continue
-            next_token = resp.get("nextPageToken")
-            if not next_token:
-                break
-    except Exception:
-        pass
+    accounts = request.session.get("accounts", {})
+    current_account_id = request.session.get("current_account")
+    current_account = accounts.get(current_account_id, {})
+    # Trashing can take minutes for large labels, so it runs as a background job
+    job = start_trash_label(current_account_id, current_account.get("email", ""), creds, label_id)
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        data = job.to_dict()
+        data["status_url"] = reverse('mailops:job_status', args=[job.pk])
+        return JsonResponse(data, status=202)
     return redirect(reverse('mailops:dashboard_by_label', args=[label_id]))
 
 
-def _extract_bodies(payload: dict) -> tuple[str, str]:
-    import base64
+def job_status(request: HttpRequest, job_id: int) -> HttpResponse:
+    accounts = request.session.get("accounts", {})
+    jobs = MailJob.objects.filter(pk=job_id, account__account_id__in=list(accounts))
+    fail_stale_jobs(jobs)
+    job = jobs.first()
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job.to_dict())
 
-    def _decode(data: str) -> str:
-        try:
-            return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-        except Exception:
-            return ''
-
-    plain_text = ''
-    html_text = ''
-
-    def walk(part: dict):
-        nonlocal plain_text, html_text
-        if not part:
-            return
-        body = part.get('body', {})
-        data = body.get('data')
-        mime = part.get('mimeType', '')
-        if data:
-            decoded = _decode(data)
-            if mime == 'text/html' and not html_text:
-                html_text = decoded
-            elif mime == 'text/plain' and not plain_text:
-                plain_text = decoded
-        for child in part.get('parts', []) or []:
-            walk(child)
-
-    walk(payload)
-    # Fallbacks: if only one exists, copy into the other to avoid empty render
-    if html_text and not plain_text:
-        plain_text = ''
-    if plain_text and not html_text:
-        html_text = ''
-    return plain_text, html_text
+
+def _fetch_message(gmail, message_id: str) -> dict:
+    msg = gmail.users().messages().get(userId="me", id=message_id, format="full").execute()
+    return parse_message(msg)
 
 
 def message_detail(request: HttpRequest, message_id: str) -> HttpResponse:
     creds = _get_session_creds(request)
     if not creds:
         return redirect(reverse("mailops:dashboard"))
-    gmail = build("gmail", "v1", credentials=creds)
-    
-    # Get current account info
-    accounts = request.session.get("accounts", {})
+    with _gmail_service(request, creds) as gmail:
+        # Get current account info
+        accounts = request.session.get("accounts", {})
+        current_account_id = request.session.get("current_account")
+        current_account = accounts.get(current_account_id, {})
+        
+        # Bodies are cached until a history sync reports a change to the message
+        cache_key = (current_account_id, message_id)
+        message = message_bodies.get(cache_key)
+        if message is None:
+            message = _fetch_message(gmail, message_id)
+            message_bodies.set(cache_key, message, message_size(message))
+        
+        # Mark message as read by removing UNREAD label
+        if "UNREAD" in message["labelIds"]:
+            try:
+                gmail.users().messages().modify(
+                    userId="me",
+                    id=message_id,
+                    body={"removeLabelIds": ["UNREAD"]}
+                ).execute()
+                message["labelIds"] = [lid for lid in message["labelIds"] if lid != "UNREAD"]
+                invalidate_label_counts(current_account_id)
+            except Exception:
+                pass  # Continue even if marking as read fails
+        
+        # Get all labels for label management
+        all_labels = _list_labels(gmail, current_account_id)
+        user_labels = [l for l in all_labels if l.get("type") == "user"]
+        
+        return render(
+            request,
+            "mailops/message_detail.html",
+            {
+                "current_account": current_account,
+                "accounts": accounts,
+                "message": message,
+                "user_labels": user_labels,
+            },
+        )
+
+
+def message_attachment(request: HttpRequest, message_id: str, part_id: str) -> HttpResponse:
+    """Download an attachment; Gmail is only asked the first time, later requests come from the disk cache."""
+    creds = _get_session_creds(request)
+    if not creds:
+        return redirect(reverse("mailops:dashboard"))
     current_account_id = request.session.get("current_account")
-    current_account = accounts.get(current_account_id, {})
-    
-    msg = gmail.users().messages().get(userId="me", id=message_id, format="full").execute()
-    headers = {h["name"]: h["value"] for h in msg.get("payload", {}).get("headers", [])}
-    body_plain, body_html = _extract_bodies(msg.get('payload'))
-    
-    # Mark message as read by removing UNREAD label
+    key = attachment_key(current_account_id, message_id, part_id)
+
+    def fetch():
+        with _gmail_service(request, creds) as gmail:
+            return fetch_attachment(
+                gmail, current_account_id, message_id, part_id, message_bodies.get((current_account_id, message_id))
+            )
+
+    path, meta = attachment_cache.get(key) or fetch()
     try:
-        gmail.users().messages().modify(
-            userId="me",
-            id=message_id,
-            body={"removeLabelIds": ["UNREAD"]}
-        ).execute()
-    except Exception:
-        pass  # Continue even if marking as read fails
-    
-    # Get all labels for label management
-    labels_resp = gmail.users().labels().list(userId="me").execute()
-    all_labels = labels_resp.get("labels", [])
-    user_labels = [l for l in all_labels if l.get("type") == "user"]
-    
-    return render(
-        request,
-        "mailops/message_detail.html",
-        {
-            "current_account": current_account,
-            "accounts": accounts,
-            "message": {
-                "id": message_id,
-                "subject": headers.get("Subject"),
-                "from": headers.get("From"),
-                "to": headers.get("To"),
-                "date": headers.get("Date"),
-                "snippet": msg.get("snippet"),
-                "labelIds": msg.get("labelIds", []),
-                "body_text": body_plain,
-                "body_html": body_html,
-            },
-            "user_labels": user_labels,
-        },
-    )
+        return attachment_response(request, path, meta, key[:32])
+    except FileNotFoundError:
+        # Evicted by another request between the lookup and the open
+        path, meta = fetch()
+        return attachment_response(request, path, meta, key[:32])
 
 
 def message_delete(request: HttpRequest, message_id: str) -> HttpResponse:
@@ -537,9 +850,11 @@ def message_delete(request: HttpRequest, message_id: str) -> HttpResponse:
     creds = _get_session_creds(request)
     if not creds:
         return redirect(reverse("mailops:dashboard"))
-    gmail = build("gmail", "v1", credentials=creds)
-    gmail.users().messages().trash(userId='me', id=message_id).execute()
-    return redirect(reverse('mailops:dashboard'))
+    with _gmail_service(request, creds) as gmail:
+        gmail.users().messages().trash(userId='me', id=message_id).execute()
+        invalidate_label_counts(_current_account_id(request))
+        message_bodies.delete((_current_account_id(request), message_id))
+        return redirect(reverse('mailops:dashboard'))
 
 
 def add_labels_to_message(request: HttpRequest, message_id: str) -> HttpResponse:
@@ -550,45 +865,33 @@ def add_labels_to_message(request: HttpRequest, message_id: str) -> HttpResponse
     if not creds:
         return redirect(reverse("mailops:dashboard"))
     
-    gmail = build("gmail", "v1", credentials=creds)
-    
-    # Get current message labels
-    try:
-        msg = gmail.users().messages().get(userId="me", id=message_id, format="metadata").execute()
-        current_label_ids = set(msg.get("labelIds", []))
-    except Exception:
-        current_label_ids = set()
-    
-    # Get selected labels from form
-    selected_label_ids = set(request.POST.getlist('label_ids'))
-    
-    # Calculate labels to add and remove
-    labels_to_add = selected_label_ids - current_label_ids
-    labels_to_remove = current_label_ids - selected_label_ids
-    
-    # Add new labels
-    if labels_to_add:
-        try:
-            gmail.users().messages().modify(
-                userId="me",
-                id=message_id,
-                body={"addLabelIds": list(labels_to_add)}
-            ).execute()
-        except Exception:
-            pass  # Continue even if adding labels fails
-    
-    # Remove unselected labels
-    if labels_to_remove:
+    with _gmail_service(request, creds) as gmail:
+        current_account_id = _current_account_id(request)
+        # Get current message labels (message_detail has usually cached them)
+        cached = message_bodies.get((current_account_id, message_id))
+        if cached is not None:
+            current_label_ids = set(cached["labelIds"])
+        else:
+            try:
+                msg = gmail.users().messages().get(userId="me", id=message_id, format="minimal").execute()
+                current_label_ids = set(msg.get("labelIds", []))
+            except Exception:
+                current_label_ids = set()
+        
+        # Get selected labels from form
+        selected_label_ids = set(request.POST.getlist('label_ids'))
+        
+        # Calculate labels to add and remove, applied in one modify call. The form
+        # only lists user labels, so system labels (INBOX, UNREAD, ...) are left alone
+        user_label_ids = {lb["id"] for lb in _list_labels(gmail, current_account_id) if lb.get("type") == "user"}
+        labels_to_add = selected_label_ids - current_label_ids
+        labels_to_remove = (current_label_ids - selected_label_ids) & user_label_ids
         try:
-            gmail.users().messages().modify(
-                userId="me",
-                id=message_id,
-                body={"removeLabelIds": list(labels_to_remove)}
-            ).execute()
+            apply_label_change(gmail, current_account_id, [message_id], labels_to_add, labels_to_remove)
         except Exception:
-            pass  # Continue even if removing labels fails
-    
-    return redirect(reverse('mailops:message_detail', args=[message_id]))
+            invalidate_label_counts(current_account_id)
+            message_bodies.delete((current_account_id, message_id))
+        return redirect(reverse('mailops:message_detail', args=[message_id]))
 
 
 def remove_labels_from_message(request: HttpRequest, message_id: str) -> HttpResponse:
@@ -599,20 +902,38 @@ def remove_labels_from_message(request: HttpRequest, message_id: str) -> HttpRes
     if not creds:
         return redirect(reverse("mailops:dashboard"))
     
-    gmail = build("gmail", "v1", credentials=creds)
-    label_ids = request.POST.getlist('label_ids')
-    
-    if label_ids:
+    with _gmail_service(request, creds) as gmail:
+        current_account_id = _current_account_id(request)
+        label_ids = request.POST.getlist('label_ids')
+        
         try:
-            gmail.users().messages().modify(
-                userId="me",
-                id=message_id,
-                body={"removeLabelIds": label_ids}
-            ).execute()
+            apply_label_change(gmail, current_account_id, [message_id], set(), set(label_ids))
         except Exception:
-            pass  # Continue even if removing labels fails
+            invalidate_label_counts(current_account_id)
+            message_bodies.delete((current_account_id, message_id))
+        return redirect(reverse('mailops:message_detail', args=[message_id]))
+
+
+def bulk_label_messages(request: HttpRequest) -> HttpResponse:
+    """Add and remove labels on many selected messages with batchModify."""
+    next_url = request.POST.get("next")
+    if not next_url or not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = reverse("mailops:dashboard")
+    if request.method != 'POST':
+        return redirect(next_url)
     
-    return redirect(reverse('mailops:message_detail', args=[message_id]))
+    creds = _get_session_creds(request)
+    if not creds:
+        return redirect(reverse("mailops:dashboard"))
+    
+    message_ids = list(dict.fromkeys(request.POST.getlist('message_ids')))
+    labels_to_add = set(request.POST.getlist('add_label_ids')) - {""}
+    labels_to_remove = set(request.POST.getlist('remove_label_ids')) - {""}
+    with _gmail_service(request, creds) as gmail:
+        apply_label_change(gmail, _current_account_id(request), message_ids, labels_to_add, labels_to_remove)
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return JsonResponse({"updated": len(message_ids)})
+    return redirect(next_url)
 
 
 def create_label(request: HttpRequest) -> HttpResponse:
@@ -623,17 +944,18 @@ def create_label(request: HttpRequest) -> HttpResponse:
     if not creds:
         return redirect(reverse("mailops:dashboard"))
     
-    gmail = build("gmail", "v1", credentials=creds)
-    label_name = request.POST.get('label_name', '').strip()
-    
-    if label_name:
-        try:
-            gmail.users().labels().create(
-                userId="me",
-                body={"name": label_name}
-            ).execute()
-        except Exception:
-            pass  # Continue even if creating label fails
-    
-    return redirect(reverse('mailops:dashboard'))
+    with _gmail_service(request, creds) as gmail:
+        label_name = request.POST.get('label_name', '').strip()
+        
+        if label_name:
+            try:
+                gmail.users().labels().create(
+                    userId="me",
+                    body={"name": label_name}
+                ).execute()
+            except Exception:
+                pass  # Continue even if creating label fails
+        
+        invalidate_label_counts(_current_account_id(request))
+        return redirect(reverse('mailops:dashboard'))
 
@@ -0,0 +1,167 @@
+"""
+Memory benchmark: concurrent webhook uploads of large files, streamed or buffered.
+
+A local sink server stands in for the webhook and discards request bodies,
+taking --sink-delay seconds per 64 KB read to keep every upload in flight at
+once. One --size-mb file is posted --uploads times concurrently in each mode
+while a sampler thread records the process RSS:
+
+- buffered: the file is read() into bytes and sent with requests' multipart
+  encoding, as uploads used to be.
+- streamed: the file is sent with MultipartFileStream.
+
+    python manage.py bench_webhook_memory --uploads 50 --size-mb 10 --output bench.json
+"""
+
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+from requests.adapters import HTTPAdapter
+
+from manager.webhooks import MultipartFileStream
+
+MODES = ('streamed', 'buffered')
+SINK_CHUNK = 64 * 1024
+SAMPLE_INTERVAL = 0.005
+
+
+def current_rss():
+    """Resident set size of this process in bytes (peak so far where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    def __init__(self):
+        self.peak = self.baseline = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def start_sink(delay):
+    class Sink(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            remaining = int(self.headers.get('Content-Length') or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(SINK_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                time.sleep(delay)
+            body = b'{}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class Server(ThreadingHTTPServer):
+        # Every upload connects at once
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Sink)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/webhook'
+
+
+class Command(BaseCommand):
+    help = 'Compare process memory of concurrent webhook uploads sent streamed or read into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=50, help='Concurrent uploads per mode')
+        parser.add_argument('--size-mb', type=float, default=10, help='Size of the uploaded file in MB')
+        parser.add_argument('--sink-delay', type=float, default=0.002, help='Seconds the sink waits per 64 KB read')
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Modes to run, in order')
+        parser.add_argument('--output', help='Write the JSON results to this file')
+
+    def _post(self, session, url, path, mode):
+        data = {'resume_id': 0, 'file_name': 'bench.pdf'}
+        if mode == 'streamed':
+            body = MultipartFileStream(data, 'file', 'bench.pdf', path, 'application/pdf')
+            return session.post(url, data=body, headers={'Content-Type': body.content_type})
+        with open(path, 'rb') as file_on_disk:
+            file_content = file_on_disk.read()
+        return session.post(url, files={'file': ('bench.pdf', file_content, 'application/pdf')}, data=data)
+
+    def _run_mode(self, mode, url, path, uploads):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=uploads)
+        session.mount('http://', adapter)
+        start = threading.Barrier(uploads)
+        statuses = []
+
+        def upload():
+            start.wait()
+            try:
+                statuses.append(self._post(session, url, path, mode).status_code)
+            except requests.exceptions.RequestException:
+                statuses.append(None)
+
+        threads = [threading.Thread(target=upload) for _ in range(uploads)]
+        with RSSSampler() as rss:
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        session.close()
+        mb = 1024 * 1024
+        return {
+            'uploads': uploads,
+            'errors': sum(1 for status in statuses if status != 200),
+            'seconds': round(elapsed, 2),
+            'baseline_rss_mb': round(rss.baseline / mb, 1),
+            'peak_rss_mb': round(rss.peak / mb, 1),
+            'peak_growth_mb': round((rss.peak - rss.baseline) / mb, 1),
+        }
+
+    def handle(self, *args, **options):
+        server, url = start_sink(options['sink_delay'])
+        fd, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                size = int(options['size_mb'] * 1024 * 1024)
+                for _ in range(0, size, 1024 * 1024):
+                    f.write(os.urandom(min(1024 * 1024, size - f.tell())))
+            results = {
+                'config': {key: options[key] for key in ('uploads', 'size_mb', 'sink_delay')},
+                'modes': {mode: self._run_mode(mode, url, path, options['uploads']) for mode in options['modes']},
+            }
+        finally:
+            os.unlink(path)
+            server.shutdown()
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,24 @@
+"""
+Run resume analysis workers in the foreground.
+
+Use this with RESUME_ANALYSIS_WORKERS=0 to keep webhook calls out of the web
+processes. It can also run alongside in-process workers, since resumes are
+claimed atomically from the database.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from manager.tasks import AnalysisQueue
+
+
+class Command(BaseCommand):
+    help = 'Analyze pending resumes with a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.RESUME_ANALYSIS_WORKERS or settings.RESUME_WEBHOOK_CONCURRENCY, help='Worker threads')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds between checks for new resumes')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Analyzing resumes with {options['workers']} workers")
+        AnalysisQueue(options['workers']).run_forever(options['poll'])
@@ -0,0 +1,18 @@
+"""
+Queue analyzed resumes whose score predates the current job descriptions.
+
+The queued resumes are analyzed by `manage.py process_resumes` (or the web
+process workers); PDFs already scored against the current job descriptions
+are served from the score cache without calling the webhook.
+"""
+
+from django.core.management.base import BaseCommand
+
+from manager.tasks import queue_stale_resumes
+
+
+class Command(BaseCommand):
+    help = 'Queue resumes scored against an older set of job descriptions for re-scoring'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{queue_stale_resumes()} resumes queued for re-scoring')
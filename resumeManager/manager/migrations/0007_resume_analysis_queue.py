@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0006_googleoauthappconfig'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resume',
+            name='error_message',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='resume',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='resume',
+            index=models.Index(fields=['status', 'created_at'], name='resume_status_created_idx'),
+        ),
+    ]
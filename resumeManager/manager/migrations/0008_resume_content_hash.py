@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:20
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_resumes(apps, schema_editor):
+    Resume = apps.get_model('manager', 'Resume')
+    for resume in Resume.objects.exclude(file='').iterator():
+        sha = hashlib.sha256()
+        try:
+            with resume.file.open('rb') as f:
+                for chunk in f.chunks():
+                    sha.update(chunk)
+        except (OSError, ValueError):
+            # Missing file: nothing to match later uploads against
+            continue
+        Resume.objects.filter(pk=resume.pk).update(content_hash=sha.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0007_resume_analysis_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resume',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(hash_existing_resumes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0008_resume_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobDescriptionCorpus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('fingerprint', models.CharField(blank=True, max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Job Description Corpus',
+                'verbose_name_plural': 'Job Description Corpus',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumeScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('jd_fingerprint', models.CharField(max_length=64)),
+                ('analysis_data', models.JSONField(blank=True, default=dict, null=True)),
+                ('overall_score', models.IntegerField(blank=True, default=0, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Resume Score',
+                'verbose_name_plural': 'Resume Scores',
+            },
+        ),
+        migrations.AddField(
+            model_name='resume',
+            name='jd_fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='resumescore',
+            constraint=models.UniqueConstraint(fields=('content_hash', 'jd_fingerprint'), name='unique_resume_score'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+import hashlib
+
+from django.db import migrations
+
+
+def backfill_scores(apps, schema_editor):
+    """Treat analyses made before 0009 as scored against the job descriptions stored now.
+
+    Without this they keep jd_fingerprint='' and no ResumeScore row, so identical uploads
+    are analyzed again and a later job description change never marks them stale.
+    """
+    JobDescription = apps.get_model('manager', 'JobDescription')
+    JobDescriptionCorpus = apps.get_model('manager', 'JobDescriptionCorpus')
+    Resume = apps.get_model('manager', 'Resume')
+    ResumeScore = apps.get_model('manager', 'ResumeScore')
+
+    # Same hash as tasks._corpus_fingerprint()
+    sha = hashlib.sha256()
+    for jd_id, file_name in JobDescription.objects.order_by('id').values_list('id', 'file_name'):
+        sha.update(f'{jd_id}\0{file_name}\n'.encode())
+    corpus, _ = JobDescriptionCorpus.objects.get_or_create(pk=1, defaults={'fingerprint': sha.hexdigest()})
+    fingerprint = corpus.fingerprint
+
+    completed = Resume.objects.filter(status='completed', jd_fingerprint='')
+    scores = {}
+    for content_hash, analysis_data, overall_score in (
+        completed.exclude(content_hash='').order_by('upload_date').values_list('content_hash', 'analysis_data', 'overall_score')
+    ):
+        # The newest analysis of a PDF wins
+        scores[content_hash] = ResumeScore(
+            content_hash=content_hash, jd_fingerprint=fingerprint,
+            analysis_data=analysis_data, overall_score=overall_score,
+        )
+    ResumeScore.objects.bulk_create(scores.values(), batch_size=500, ignore_conflicts=True)
+    completed.update(jd_fingerprint=fingerprint)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manager', '0009_resume_score_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
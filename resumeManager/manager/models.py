@@ -25,11 +25,15 @@ class Resume(models.Model):
     """Model for storing resume metadata and analysis results"""
     file = models.FileField(upload_to='resumes/')
     file_name = models.CharField(max_length=255)
+    # SHA-256 of the PDF; identical uploads share the stored file and its analysis
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
     upload_date = models.DateTimeField(default=timezone.now)
     
     # Analysis results from webhook (stored as JSON)
     analysis_data = models.JSONField(default=dict, blank=True, null=True)
     overall_score = models.IntegerField(default=0, blank=True, null=True)
+    # JobDescriptionCorpus.fingerprint the analysis was computed against ('' if unknown)
+    jd_fingerprint = models.CharField(max_length=64, blank=True, default='', db_index=True)
     
     # Status tracking
     status = models.CharField(
@@ -42,6 +46,11 @@ class Resume(models.Model):
         ],
         default='pending'
     )
+    error_message = models.TextField(blank=True, default='')
+    
+    # Background analysis queue (see tasks.py)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    processing_started_at = models.DateTimeField(null=True, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -50,11 +59,52 @@ class Resume(models.Model):
         ordering = ['-upload_date']
         verbose_name = 'Resume'
         verbose_name_plural = 'Resumes'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='resume_status_created_idx'),
+        ]
 
     def __str__(self):
         return self.file_name
 
 
+class JobDescriptionCorpus(models.Model):
+    """Single row identifying the set of job descriptions indexed in Pinecone.
+
+    Resume scores depend on that set. The fingerprint is a hash of the job
+    descriptions and version counts its changes; both are updated by
+    upload_job_description and delete_job_description (see tasks.py).
+    """
+    version = models.PositiveIntegerField(default=0)
+    fingerprint = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Job Description Corpus'
+        verbose_name_plural = 'Job Description Corpus'
+
+    def __str__(self):
+        return f"Job description corpus v{self.version}"
+
+
+class ResumeScore(models.Model):
+    """Webhook analysis of a resume PDF (by content hash) against one job description corpus"""
+    content_hash = models.CharField(max_length=64)
+    jd_fingerprint = models.CharField(max_length=64)
+    analysis_data = models.JSONField(default=dict, blank=True, null=True)
+    overall_score = models.IntegerField(default=0, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Resume Score'
+        verbose_name_plural = 'Resume Scores'
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'jd_fingerprint'], name='unique_resume_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} @ {self.jd_fingerprint[:12]}"
+
+
 class EmailTemplate(models.Model):
     """Model for storing default email templates"""
     subject = models.CharField(max_length=255, default='Interview Invitation')
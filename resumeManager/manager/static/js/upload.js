@@ -116,6 +116,9 @@ document.addEventListener('DOMContentLoaded', function() {
         // Prepare form data (multiple)
         const formData = new FormData();
         files.forEach(f => formData.append('resume_file', f));
+        if (document.getElementById('force-reanalyze')?.checked) {
+            formData.append('force_reanalyze', '1');
+        }
 
         // Upload to backend
         fetch('/api/upload-resume/', {
@@ -125,18 +128,14 @@ document.addEventListener('DOMContentLoaded', function() {
             },
             body: formData
         })
-        .then(response => response.json())
-        .then(data => {
-            // Handle both single and batch responses
-            if (data.results) {
-                const successCount = data.results.filter(r => r.success).length;
-                if (successCount > 0) {
-                    handleUploadSuccess({ message: `Uploaded ${successCount}/${data.results.length} resumes successfully` });
-                } else {
-                    handleUploadError(data.results[0]?.error || 'Upload failed');
-                }
-            } else if (data.success) {
-                handleUploadSuccess(data);
+        .then(response => response.json().then(data => ({ status: response.status, data })))
+        .then(({ status, data }) => {
+            // 202: the resumes are queued, follow their analysis
+            if (status === 202) {
+                updateProgress(0, `Analyzing 0/${data.resume_ids.length} resumes...`);
+                pollAnalysis(data.status_urls || [data.status_url], data.results.length);
+            } else if (data.results) {
+                handleUploadError(data.results[0]?.error || 'Upload failed');
             } else {
                 handleUploadError(data.error || 'Upload failed');
             }
@@ -147,6 +146,48 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    function fetchStatus(statusUrl) {
+        return fetch(statusUrl, { credentials: 'same-origin' })
+            .then(response => response.json().catch(() => ({})).then(data => {
+                if (!response.ok || data.error) {
+                    const error = new Error(data.error || `Status check failed (${response.status})`);
+                    // Asking again would get the same answer
+                    error.fatal = response.status >= 400 && response.status < 500;
+                    throw error;
+                }
+                return data;
+            }));
+    }
+
+    function pollAnalysis(statusUrls, uploadedCount, retryDelay = 5000) {
+        Promise.all(statusUrls.map(fetchStatus))
+            .then(pages => {
+                const resumes = pages.flatMap(page => page.resumes || []);
+                const finished = resumes.filter(r => r.status === 'completed' || r.status === 'failed');
+                const percent = resumes.length ? Math.round(finished.length / resumes.length * 100) : 100;
+                updateProgress(percent, `Analyzing ${finished.length}/${resumes.length} resumes...`);
+                if (!pages.every(page => page.done)) {
+                    setTimeout(() => pollAnalysis(statusUrls, uploadedCount), 2000);
+                    return;
+                }
+                const completed = resumes.filter(r => r.status === 'completed').length;
+                if (completed > 0) {
+                    handleUploadSuccess({ message: `Analyzed ${completed}/${uploadedCount} resumes successfully` });
+                } else {
+                    const failed = resumes.find(r => r.status === 'failed');
+                    handleUploadError((failed && failed.error) || 'Analysis failed');
+                }
+            })
+            .catch(error => {
+                if (error.fatal || retryDelay > 60000) {
+                    handleUploadError(error.message || 'Could not check the analysis status');
+                    return;
+                }
+                // Server or network trouble: back off before asking again
+                setTimeout(() => pollAnalysis(statusUrls, uploadedCount, retryDelay * 2), retryDelay);
+            });
+    }
+
     function validateForm() {
         let isValid = true;
 
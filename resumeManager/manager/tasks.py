@@ -0,0 +1,464 @@
+"""
+Background analysis of uploaded resumes.
+
+The Resume table is the job queue: upload_resume_file saves each PDF as
+'pending' and returns straight away. Worker threads claim pending resumes
+one at a time ('processing'), post them to RESUME_WEBHOOK_URL and store the
+result ('completed' or 'failed', with error_message set). Claiming is a
+conditional UPDATE, so several threads or processes can share the queue.
+There are as many workers as the webhook takes concurrent requests, so a
+batch takes about as long as its slowest analyses rather than their sum.
+
+Scores depend on the job descriptions indexed in Pinecone, identified by the
+JobDescriptionCorpus fingerprint. Analyses are cached as ResumeScore rows
+keyed by (resume content hash, fingerprint). A resume whose jd_fingerprint
+differs from the current one is stale, and queue_stale_resumes() re-scores
+those.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import JobDescription, JobDescriptionCorpus, Resume, ResumeScore
+from .webhooks import post_webhook_file
+
+logger = logging.getLogger(__name__)
+
+
+def webhook_configured(url):
+    return bool(url) and 'your-webhook-url.com' not in url
+
+
+def _corpus_fingerprint():
+    """Hash of the job descriptions currently stored"""
+    sha = hashlib.sha256()
+    for jd_id, file_name in JobDescription.objects.order_by('id').values_list('id', 'file_name'):
+        sha.update(f'{jd_id}\0{file_name}\n'.encode())
+    return sha.hexdigest()
+
+
+def current_jd_fingerprint():
+    """Fingerprint of the job description set resumes are scored against now"""
+    corpus = JobDescriptionCorpus.objects.first()
+    if corpus is None:
+        corpus, _ = JobDescriptionCorpus.objects.get_or_create(pk=1, defaults={'fingerprint': _corpus_fingerprint()})
+    return corpus.fingerprint
+
+
+def bump_jd_fingerprint():
+    """Record a change to the indexed job descriptions; scores computed before it become stale."""
+    fingerprint = _corpus_fingerprint()
+    # One UPDATE statement rather than a read-modify-write transaction, which SQLite fails with "database is locked"
+    bumped = JobDescriptionCorpus.objects.filter(pk=1).update(
+        version=F('version') + 1, fingerprint=fingerprint, updated_at=timezone.now()
+    )
+    if not bumped:
+        JobDescriptionCorpus.objects.get_or_create(pk=1, defaults={'version': 1, 'fingerprint': fingerprint})
+    return fingerprint
+
+
+def cached_score(content_hash, fingerprint):
+    if not content_hash:
+        return None
+    return ResumeScore.objects.filter(content_hash=content_hash, jd_fingerprint=fingerprint).first()
+
+
+def store_score(content_hash, fingerprint, analysis_data, overall_score):
+    """
+    Cache an analysis for later copies of the PDF. A single upsert statement,
+    so SQLite never has to upgrade a read transaction while other workers
+    write; a failure only costs the cache entry, never the analysis itself.
+    """
+    if not content_hash:
+        return
+    try:
+        ResumeScore.objects.bulk_create(
+            [ResumeScore(
+                content_hash=content_hash,
+                jd_fingerprint=fingerprint,
+                analysis_data=analysis_data,
+                overall_score=overall_score,
+            )],
+            update_conflicts=True,
+            unique_fields=['content_hash', 'jd_fingerprint'],
+            update_fields=['analysis_data', 'overall_score'],
+        )
+    except DatabaseError:
+        logger.exception('Could not cache the score of resume content %s', content_hash)
+
+
+def forget_score(content_hash, fingerprint):
+    """Drop a cached analysis so the next analysis of that PDF goes to the webhook (force re-analyze)."""
+    ResumeScore.objects.filter(content_hash=content_hash, jd_fingerprint=fingerprint).delete()
+
+
+def is_score_stale(resume, fingerprint):
+    """Scored by the webhook against job descriptions that have changed since"""
+    return resume.status == 'completed' and resume.jd_fingerprint not in ('', fingerprint)
+
+
+def queue_stale_resumes():
+    """
+    Queue analyzed resumes whose score predates the current job descriptions; returns how many.
+    Resumes never scored by the webhook (no jd_fingerprint) are left alone, and
+    nothing is queued while the webhook is not configured.
+    """
+    if not webhook_configured(getattr(settings, 'RESUME_WEBHOOK_URL', '')):
+        return 0
+    fingerprint = current_jd_fingerprint()
+    return (
+        Resume.objects.filter(status='completed')
+        .exclude(jd_fingerprint__in=('', fingerprint))
+        .update(status='pending', error_message='', attempts=0, updated_at=timezone.now())
+    )
+
+
+def claim_next_resume():
+    """
+    Move the oldest pending resume to 'processing' and return it, or None if none is left.
+    Copies of a PDF that is being analyzed wait for it, so they are served from the score cache.
+    """
+    in_flight = Resume.objects.filter(status='processing').exclude(content_hash='').values('content_hash')
+    while True:
+        resume_id = (
+            Resume.objects.filter(status='pending')
+            .exclude(content_hash__in=in_flight)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if resume_id is None:
+            return None
+        now = timezone.now()
+        claimed = Resume.objects.filter(id=resume_id, status='pending').update(
+            status='processing',
+            processing_started_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        # Another worker got there first: try the next one
+        if claimed:
+            return Resume.objects.get(id=resume_id)
+
+
+def requeue_stale_resumes():
+    """
+    Put resumes whose worker died mid-analysis back in the queue.
+    Resumes that already used RESUME_ANALYSIS_MAX_ATTEMPTS are failed instead.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.RESUME_ANALYSIS_STALE_SECONDS)
+    stale = Resume.objects.filter(status='processing', processing_started_at__lt=cutoff)
+    stale.filter(attempts__gte=settings.RESUME_ANALYSIS_MAX_ATTEMPTS).update(
+        status='failed', error_message='Analysis did not finish', updated_at=timezone.now()
+    )
+    return stale.update(status='pending', updated_at=timezone.now())
+
+
+def _finish(resume, status, error='', **fields):
+    resume.status = status
+    resume.error_message = error
+    for name, value in fields.items():
+        setattr(resume, name, value)
+    resume.save()
+
+
+def process_resume(resume):
+    """Send one claimed resume to the webhook and record the outcome on it."""
+    webhook_url = getattr(settings, 'RESUME_WEBHOOK_URL', '')
+
+    # If webhook not configured, just keep it locally as completed with zero score
+    if not webhook_configured(webhook_url):
+        _finish(resume, 'completed', overall_score=0)
+        return
+
+    # Taken before the call: job descriptions changing meanwhile leave this score stale
+    fingerprint = current_jd_fingerprint()
+    cached = cached_score(resume.content_hash, fingerprint)
+    if cached is not None:
+        _finish(
+            resume, 'completed',
+            analysis_data=cached.analysis_data,
+            overall_score=cached.overall_score,
+            jd_fingerprint=fingerprint,
+        )
+        return
+
+    # Ensure file exists and is accessible
+    if not resume.file or not os.path.exists(resume.file.path):
+        _finish(resume, 'failed', 'File was not saved correctly')
+        return
+
+    try:
+        response = post_webhook_file(
+            webhook_url,
+            resume.file.path,
+            resume.file_name,
+            'application/pdf',
+            {'resume_id': resume.id, 'file_name': resume.file_name},
+            timeout=settings.RESUME_WEBHOOK_TIMEOUT,
+        )
+    except requests.exceptions.RequestException as e:
+        _finish(resume, 'failed', f'Failed to connect to webhook: {str(e)}')
+        return
+
+    if response.status_code != 200:
+        _finish(resume, 'failed', f'Webhook returned error: {response.status_code}')
+        return
+    try:
+        analysis_data = response.json()
+    except json.JSONDecodeError:
+        _finish(resume, 'failed', 'Invalid response from webhook')
+        return
+
+    # Sanitize and normalize webhook data before storing
+    normalized = sanitize_webhook_analysis(analysis_data)
+    store_score(resume.content_hash, fingerprint, normalized['analysis_data'], normalized['overall_score'])
+    _finish(
+        resume, 'completed',
+        analysis_data=normalized['analysis_data'],
+        overall_score=normalized['overall_score'],
+        jd_fingerprint=fingerprint,
+    )
+
+
+class AnalysisQueue:
+    """
+    Worker threads of this process that drain the pending resumes.
+    kick() after queueing resumes starts up to `workers` threads; each one
+    exits once the queue is empty.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._running = 0
+        self._kicked = False
+        self._executor = None
+
+    def kick(self):
+        if self.workers <= 0:
+            # Analysis runs in `manage.py process_resumes` instead
+            return
+        requeue_stale_resumes()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='resume-analysis')
+            self._kicked = True
+            start = self.workers - self._running
+            self._running += start
+        for _ in range(start):
+            self._executor.submit(self._drain)
+
+    def _drain(self):
+        exited = False
+        try:
+            while True:
+                resume = claim_next_resume()
+                if resume is None:
+                    with self._lock:
+                        # Resumes queued after our last look would otherwise wait for the next upload
+                        if not self._kicked:
+                            # Leave the pool in the same critical section, so a kick() from now on starts a worker
+                            self._running -= 1
+                            exited = True
+                            return
+                        self._kicked = False
+                    continue
+                analyze(resume)
+        finally:
+            if not exited:
+                with self._lock:
+                    self._running -= 1
+            close_old_connections()
+
+    def run_forever(self, poll_interval):
+        """Process the queue in the foreground, polling for new resumes (used by process_resumes)."""
+        def work():
+            while True:
+                resume = claim_next_resume()
+                if resume is None:
+                    close_old_connections()
+                    time.sleep(poll_interval)
+                    continue
+                analyze(resume)
+
+        for i in range(self.workers):
+            threading.Thread(target=work, name=f'resume-analysis-{i}', daemon=True).start()
+        while True:
+            requeue_stale_resumes()
+            close_old_connections()
+            time.sleep(poll_interval)
+
+
+def analyze(resume):
+    """process_resume() that records unexpected errors on the resume instead of raising."""
+    try:
+        process_resume(resume)
+    except Exception as e:
+        _finish(resume, 'failed', f'Analysis failed: {str(e)}')
+    finally:
+        close_old_connections()
+
+
+analysis_queue = AnalysisQueue(settings.RESUME_ANALYSIS_WORKERS)
+
+
+def sanitize_webhook_analysis(raw):
+    """
+    Normalize various webhook payload shapes into a consistent structure:
+    {
+      analysis_data: { candidate_info, skills, experience, education, summary, recommendations, ... },
+      overall_score: int
+    }
+    """
+    def safe_int(s, default=0):
+        try:
+            if isinstance(s, (int, float)):
+                return int(s)
+            if isinstance(s, str):
+                # handle formats like "40/100" or "40"
+                if '/' in s:
+                    num, denom = s.split('/', 1)
+                    num = int(''.join(ch for ch in num if ch.isdigit()))
+                    denom = int(''.join(ch for ch in denom if ch.isdigit())) or 100
+                    return max(0, min(100, int(round((num / denom) * 100))))
+                return int(''.join(ch for ch in s if ch.isdigit()))
+        except Exception:
+            return default
+        return default
+
+    def parse_skill_score(skill_str):
+        """Parse skill string like 'React JS (80/100)' to extract name and score"""
+        if isinstance(skill_str, dict):
+            name = skill_str.get('name', '')
+            match = skill_str.get('match')
+            if match is not None:
+                return {'name': name, 'match': safe_int(match)}
+            return {'name': name, 'match': None}
+        
+        skill_str = str(skill_str)
+        # Try to extract score from formats like "React JS (80/100)" or "React JS (80)"
+        match = re.search(r'\((\d+)(?:/\d+)?\)', skill_str)
+        if match:
+            score = safe_int(match.group(1))
+            name = re.sub(r'\s*\(\d+(?:/\d+)?\)\s*', '', skill_str).strip()
+            return {'name': name, 'match': score}
+        return {'name': skill_str, 'match': None}
+
+    # If webhook returns array with one item, unwrap
+    if isinstance(raw, list) and len(raw) == 1:
+        raw = raw[0]
+
+    # If wrapped with { "output": {...} }
+    payload = raw.get('output', raw) if isinstance(raw, dict) else {}
+
+    # Extract fields safely
+    candidate_info = payload.get('candidate_info') or {}
+    experience = payload.get('candidate_experience') or payload.get('experience') or []
+    education = payload.get('candidate_education') or payload.get('education') or []
+    skills = payload.get('candidate_skills') or payload.get('skills') or []
+    summary = payload.get('candidate_summary') or payload.get('summary') or ''
+    recommendations = payload.get('recommendations') or ''
+    final_decision = payload.get('final_decision') or {}
+    score = safe_int(final_decision.get('final_score') or payload.get('final_score') or payload.get('skill_match_score') or 0)
+    
+    # Extract additional fields
+    languages = payload.get('candidate_languages_known') or payload.get('languages') or []
+    projects = payload.get('projects_worked_on') or payload.get('projects') or []
+    total_experience = payload.get('cadidate_total_past_experience') or payload.get('candidate_total_past_experience') or payload.get('total_experience') or ''
+    why_hire = payload.get('why_hire_candidate') or ''
+    why_not_hire = payload.get('why_not_hire_candidate') or ''
+    explanation = payload.get('explanation_of_decision') or ''
+
+    # Normalize skills - handle both string format "Skill (80/100)" and object format
+    if isinstance(skills, list):
+        skills_norm = [parse_skill_score(s) for s in skills]
+    else:
+        skills_norm = []
+
+    # Normalize experience
+    if isinstance(experience, list):
+        experience_norm = []
+        for item in experience:
+            if not isinstance(item, dict):
+                continue
+            experience_norm.append({
+                'title': item.get('role') or item.get('title') or '',
+                'company': item.get('place') or item.get('company') or '',
+                'duration': item.get('time_period') or item.get('duration') or '',
+                'description': item.get('description') or ''
+            })
+    else:
+        experience_norm = []
+
+    # Normalize education - handle both array and single object
+    education_norm = []
+    if isinstance(education, list):
+        for edu in education:
+            if isinstance(edu, dict):
+                education_norm.append({
+                    'degree': edu.get('degree') or '',
+                    'university': edu.get('institution') or edu.get('university') or '',
+                    'year': edu.get('year_of_graduation') or edu.get('year') or '',
+                    'description': ', '.join(edu.get('certifications_and_awards', [])) if isinstance(edu.get('certifications_and_awards'), list) else ''
+                })
+    elif isinstance(education, dict) and (education.get('degree') or education.get('institution') or education.get('year_of_graduation')):
+        education_norm.append({
+            'degree': education.get('degree') or '',
+            'university': education.get('institution') or education.get('university') or '',
+            'year': education.get('year_of_graduation') or education.get('year') or '',
+            'description': ''
+        })
+
+    # Normalize languages
+    languages_norm = []
+    if isinstance(languages, list):
+        languages_norm = [str(lang) for lang in languages]
+    
+    # Normalize projects
+    projects_norm = []
+    if isinstance(projects, list):
+        projects_norm = [str(proj) for proj in projects]
+
+    sanitized = {
+        'analysis_data': {
+            'candidate_info': {
+                'name': candidate_info.get('name') or '',
+                'email': candidate_info.get('email') or '',
+                'phone_number': candidate_info.get('phone_number') or '',
+                'linkedin_url': candidate_info.get('linkedin_url') or '',
+                'address': candidate_info.get('address') or '',
+                'candidate_applied_for': payload.get('candidate_applied_for') or ''
+            },
+            'summary': summary,
+            'skills': skills_norm,
+            'experience': experience_norm,
+            'education': education_norm,
+            'languages': languages_norm,
+            'projects': projects_norm,
+            'total_experience': total_experience,
+            'recommendations': recommendations,
+            'why_hire': why_hire,
+            'why_not_hire': why_not_hire,
+            'explanation': explanation,
+            'final_decision': final_decision,
+            'needs_human_review': (payload.get('needs_human_review') or '').lower() == 'yes'
+        },
+        'overall_score': score
+    }
+    return sanitized
+
+
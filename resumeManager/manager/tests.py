@@ -0,0 +1,131 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .models import JobDescription, Resume, ResumeScore
+from .tasks import (
+    bump_jd_fingerprint,
+    claim_next_resume,
+    current_jd_fingerprint,
+    is_score_stale,
+    process_resume,
+    queue_stale_resumes,
+)
+from .webhooks import MultipartFileStream
+
+
+def pending_resume(content_hash, **fields):
+    return Resume.objects.create(
+        file=f'resumes/{content_hash}.pdf', file_name=f'{content_hash}.pdf', content_hash=content_hash, **fields
+    )
+
+
+class ClaimNextResumeTests(TestCase):
+    """The Resume table as a job queue shared by several workers"""
+
+    def test_pending_resumes_are_claimed_once_oldest_first(self):
+        resumes = [pending_resume(h) for h in ('a', 'b', 'c')]
+        claimed = []
+        while (resume := claim_next_resume()) is not None:
+            claimed.append(resume)
+        self.assertEqual([r.id for r in claimed], [r.id for r in resumes])
+        self.assertEqual({(r.status, r.attempts) for r in claimed}, {('processing', 1)})
+
+    def test_copies_of_a_resume_in_flight_wait_for_it(self):
+        first, copy, other = pending_resume('same'), pending_resume('same'), pending_resume('other')
+        self.assertEqual(claim_next_resume().id, first.id)
+        self.assertEqual(claim_next_resume().id, other.id)
+        self.assertIsNone(claim_next_resume())
+        Resume.objects.filter(id=first.id).update(status='completed')
+        self.assertEqual(claim_next_resume().id, copy.id)
+
+    def test_resume_taken_by_another_worker_is_skipped(self):
+        first, second = pending_resume('a'), pending_resume('b')
+        update = QuerySet.update
+
+        def racing_update(queryset, **kwargs):
+            # Another worker claims the selected resume just before our conditional UPDATE
+            if queryset.model is Resume and kwargs.get('status') == 'processing' and not racing_update.raced:
+                racing_update.raced = True
+                update(Resume.objects.filter(id=first.id), status='processing')
+            return update(queryset, **kwargs)
+
+        racing_update.raced = False
+        with mock.patch.object(QuerySet, 'update', racing_update):
+            claimed = claim_next_resume()
+        self.assertEqual(claimed.id, second.id)
+        first.refresh_from_db()
+        self.assertEqual(first.attempts, 0)
+
+
+class MultipartFileStreamTests(SimpleTestCase):
+    def test_length_matches_the_bytes_sent(self):
+        data = os.urandom(MultipartFileStream.CHUNK_SIZE * 2 + 123)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.unlink, f.name)
+        stream = MultipartFileStream(
+            {'resume_id': 7, 'file_name': 'Zoë "CV".pdf'}, 'file', 'Zoë "CV".pdf', f.name, 'application/pdf'
+        )
+        body = b''.join(stream)
+        self.assertEqual(len(stream), len(body))
+        self.assertIn(data, body)
+        self.assertTrue(body.endswith(f'--{stream.boundary}--\r\n'.encode()))
+
+
+@override_settings(RESUME_WEBHOOK_URL='https://hooks.example.com/resume')
+class ScoreCacheTests(TestCase):
+    """Analyses are reused for identical PDFs until the job descriptions change"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'final_decision': {'final_score': 80}}
+        webhook = mock.patch('manager.tasks.post_webhook_file', return_value=response)
+        self.webhook = webhook.start()
+        self.addCleanup(webhook.stop)
+        self.add_job_description('backend.pdf')
+
+    def add_job_description(self, file_name):
+        JobDescription.objects.create(title=file_name, file=f'job_descriptions/{file_name}', file_name=file_name)
+        bump_jd_fingerprint()
+
+    def upload(self, data, file_name):
+        resume = Resume(file_name=file_name, content_hash=hashlib.sha256(data).hexdigest())
+        resume.file.save(file_name, ContentFile(data))
+        return resume
+
+    def test_identical_resume_reuses_the_cached_score(self):
+        first = self.upload(b'%PDF-1.4 resume', 'first.pdf')
+        copy = self.upload(b'%PDF-1.4 resume', 'copy.pdf')
+        process_resume(first)
+        process_resume(copy)
+        self.assertEqual(self.webhook.call_count, 1)
+        copy.refresh_from_db()
+        self.assertEqual((copy.status, copy.overall_score), ('completed', 80))
+        self.assertEqual(copy.jd_fingerprint, current_jd_fingerprint())
+        self.assertEqual(ResumeScore.objects.count(), 1)
+
+    def test_job_description_change_makes_scores_stale(self):
+        resume = self.upload(b'%PDF-1.4 resume', 'resume.pdf')
+        process_resume(resume)
+        self.assertFalse(is_score_stale(resume, current_jd_fingerprint()))
+
+        self.add_job_description('frontend.pdf')
+        self.assertTrue(is_score_stale(resume, current_jd_fingerprint()))
+        self.assertEqual(queue_stale_resumes(), 1)
+        self.assertEqual(queue_stale_resumes(), 0)
+        process_resume(claim_next_resume())
+        self.assertEqual(self.webhook.call_count, 2)
+        resume.refresh_from_db()
+        self.assertFalse(is_score_stale(resume, current_jd_fingerprint()))
@@ -0,0 +1,58 @@
+"""
+Upload handlers that hash files while they stream in.
+
+Django's default handlers, extended to feed every chunk they keep into a
+SHA-256 digest. The finished UploadedFile carries it as `sha256`, so resume
+uploads can be matched against earlier ones without reading the file again.
+"""
+
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingMemoryFileUploadHandler(MemoryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        # Set first: the parent raises StopFutureHandlers when it takes the file
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # Chunks returned here are not kept in memory; the next handler hashes them
+        chunk = super().receive_data_chunk(raw_data, start)
+        if chunk is None:
+            self.digest.update(raw_data)
+        return chunk
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+def file_sha256(uploaded_file):
+    """SHA-256 of an uploaded file: the one computed during the upload, or read from it now."""
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        sha.update(chunk)
+    uploaded_file.seek(0)
+    return sha.hexdigest()
@@ -21,8 +21,11 @@ urlpatterns = [
     path('api/job-descriptions/<int:job_description_id>/delete/', views.delete_job_description, name='delete_job_description'),
     path('api/job-descriptions/', views.get_job_descriptions, name='get_job_descriptions'),
     path('api/resumes/', views.get_resumes, name='get_resumes'),
+    path('api/resumes/status/', views.get_resume_statuses, name='get_resume_statuses'),
+    path('api/resumes/rescore-stale/', views.rescore_stale_resumes, name='rescore_stale_resumes'),
     path('api/resumes/<int:resume_id>/', views.get_resume, name='get_resume'),
     path('api/resumes/<int:resume_id>/delete/', views.delete_resume, name='delete_resume'),
+    path('api/resumes/<int:resume_id>/reanalyze/', views.reanalyze_resume, name='reanalyze_resume'),
     path('api/resumes/<int:resume_id>/download/', views.download_resume, name='download_resume'),
     path('api/send-email-calendar/', views.send_email_calendar, name='send_email_calendar'),
     path('api/email-templates/', views.save_email_template, name='save_email_template'),
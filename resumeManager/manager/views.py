@@ -4,6 +4,9 @@ import re
 import requests
 import numpy as np
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
+from django.db import transaction
+from django.utils import timezone
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
@@ -13,14 +16,27 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from .models import Resume, JobDescription
+from .tasks import (
+    analysis_queue,
+    bump_jd_fingerprint,
+    cached_score,
+    current_jd_fingerprint,
+    forget_score,
+    is_score_stale,
+    queue_stale_resumes,
+)
+from .uploads import file_sha256
+from .webhooks import post_webhook_file
 from pinecone import Pinecone
 
 # Get webhook URLs from settings
 JOB_DESCRIPTION_WEBHOOK_URL = getattr(settings, 'JOB_DESCRIPTION_WEBHOOK_URL', 'https://your-webhook-url.com/job-description')
-RESUME_WEBHOOK_URL = getattr(settings, 'RESUME_WEBHOOK_URL', 'https://your-webhook-url.com/resume')
 PINECONE_API_KEY = getattr(settings, 'PINECONE_API_KEY', 'your-pinecone-api-key')
 PINECONE_INDEX_NAME = getattr(settings, 'PINECONE_INDEX_NAME', 'your-index-name')
 
+# Resume ids one status request may ask about
+STATUS_IDS_LIMIT = 100
+
 
 @login_required(login_url='login')
 @ensure_csrf_cookie
@@ -44,12 +60,16 @@ def upload_resume(request):
 def upload_resume_file(request):
     """
     Handle one or more resume file uploads.
-    For each PDF, send to webhook for processing and store metadata.
+    Each PDF is saved as a pending resume and analyzed in the background
+    (see tasks.py); the response is 202 with the resume ids and the
+    status_urls to poll (status_url is the first one). A PDF identical to an analyzed one reuses the stored file and its
+    analysis right away, unless force_reanalyze is set.
     """
     if 'resume_file' not in request.FILES and not request.FILES.getlist('resume_file'):
         return JsonResponse({'error': 'No file uploaded'}, status=400)
 
     files = request.FILES.getlist('resume_file') or [request.FILES['resume_file']]
+    force_reanalyze = request.POST.get('force_reanalyze') in ('1', 'true', 'on')
     results = []
     
     for resume_file in files:
@@ -63,237 +83,135 @@ def upload_resume_file(request):
             continue
 
         try:
-            # Step 1: Save resume to database first (this saves file to disk)
             safe_name = resume_file.name
+            content_hash = file_sha256(resume_file)
+            stored = find_stored_duplicate(content_hash)
+            fingerprint = current_jd_fingerprint()
+            if force_reanalyze:
+                forget_score(content_hash, fingerprint)
+            cached = None if force_reanalyze else cached_score(content_hash, fingerprint)
+
+            if cached and stored:
+                # Same PDF already scored against the current job descriptions
+                resume = Resume.objects.create(
+                    file=stored.file.name,
+                    file_name=safe_name,
+                    content_hash=content_hash,
+                    status='completed',
+                    analysis_data=cached.analysis_data,
+                    overall_score=cached.overall_score,
+                    jd_fingerprint=fingerprint,
+                )
+                results.append({
+                    'file_name': safe_name, 'success': True, 'resume_id': resume.id, 'cached': True,
+                    'message': 'Identical resume already analyzed; reused its analysis',
+                })
+                continue
+
+            # Save resume to database (a new file only if this PDF is not stored yet); a worker picks it up from there
             resume = Resume.objects.create(
-                file=resume_file,
+                file=stored.file.name if stored else resume_file,
                 file_name=safe_name,
+                content_hash=content_hash,
                 status='pending'
             )
+            results.append({'file_name': safe_name, 'success': True, 'resume_id': resume.id, 'message': 'Resume queued for analysis'})
+        except Exception as e:
+            results.append({'file_name': resume_file.name, 'success': False, 'error': f'Failed to save resume: {str(e)}'})
 
-            # Step 2: Read file from disk as binary to send to webhook
-            webhook_url = RESUME_WEBHOOK_URL
+    resume_ids = [r['resume_id'] for r in results if r.get('success')]
+    if not resume_ids:
+        # If only one file, keep original shape for backward compatibility
+        if len(results) == 1:
+            return JsonResponse({'error': results[0].get('error')}, status=400)
+        return JsonResponse({'results': results}, status=400)
+
+    # Start workers once the rows are visible to them
+    transaction.on_commit(analysis_queue.kick)
+    status_urls = resume_status_urls(resume_ids)
+    return JsonResponse({
+        'success': True,
+        'resume_ids': resume_ids,
+        'resume_id': resume_ids[0],
+        'results': results,
+        'status_url': status_urls[0],
+        'status_urls': status_urls,
+        'message': f'{len(resume_ids)} of {len(results)} resumes queued for analysis',
+    }, status=202)
+
+
+def resume_status_urls(resume_ids):
+    """get_resume_statuses URLs covering resume_ids, STATUS_IDS_LIMIT ids each"""
+    return [
+        f"{reverse('get_resume_statuses')}?ids={','.join(str(i) for i in resume_ids[start:start + STATUS_IDS_LIMIT])}"
+        for start in range(0, len(resume_ids), STATUS_IDS_LIMIT)
+    ]
 
-            # If webhook not configured, just save locally as completed with zero score
-            if not webhook_url or 'your-webhook-url.com' in webhook_url:
-                resume.status = 'completed'
-                resume.overall_score = 0
-                resume.save()
-                results.append({'file_name': safe_name, 'success': True, 'resume_id': resume.id, 'message': 'Saved locally. Configure RESUME_WEBHOOK_URL to enable analysis.'})
-                continue
-            
-            try:
-                # Ensure file exists and is accessible
-                if not resume.file or not os.path.exists(resume.file.path):
-                    resume.status = 'failed'
-                    resume.save()
-                    results.append({'file_name': safe_name, 'success': False, 'error': 'File was not saved correctly'})
-                    continue
-                
-                # Read the saved file from disk as binary
-                with open(resume.file.path, 'rb') as file_on_disk:
-                    file_content = file_on_disk.read()
-                
-                # Prepare file for webhook (send as binary)
-                files_payload = {
-                    'file': (resume.file_name, file_content, 'application/pdf')
-                }
-                data_payload = {
-                    'resume_id': resume.id,
-                    'file_name': resume.file_name
-                }
-                
-                # Send to webhook
-                response = requests.post(
-                    webhook_url,
-                    files=files_payload,
-                    data=data_payload,
-                    timeout=300  # 5 minute timeout for processing
-                )
-                
-                if response.status_code == 200:
-                    # Update resume with analysis results
-                    try:
-                        analysis_data = response.json()
-
-                        # Sanitize and normalize webhook data before storing
-                        normalized = sanitize_webhook_analysis(analysis_data)
-                        resume.analysis_data = normalized['analysis_data']
-                        resume.overall_score = normalized['overall_score']
-                        resume.status = 'completed'
-                        resume.save()
-                        
-                        results.append({'file_name': safe_name, 'success': True, 'resume_id': resume.id, 'message': 'Resume uploaded and analyzed successfully'})
-                    except json.JSONDecodeError:
-                        resume.status = 'failed'
-                        resume.save()
-                        results.append({'file_name': safe_name, 'success': False, 'error': 'Invalid response from webhook'})
-                else:
-                    resume.status = 'failed'
-                    resume.save()
-                    results.append({'file_name': safe_name, 'success': False, 'error': f'Webhook returned error: {response.status_code}'})
-                    
-            except requests.exceptions.RequestException as e:
-                resume.status = 'failed'
-                resume.save()
-                results.append({'file_name': safe_name, 'success': False, 'error': f'Failed to connect to webhook: {str(e)}'})
 
-        except Exception as e:
-            results.append({'file_name': resume_file.name, 'success': False, 'error': f'Failed to save resume: {str(e)}'})
+def find_stored_duplicate(content_hash):
+    """Any resume whose stored file has this content"""
+    candidates = Resume.objects.filter(content_hash=content_hash).exclude(file='').order_by('-upload_date')
+    return next((r for r in candidates[:5] if r.file.storage.exists(r.file.name)), None)
 
-    # If only one file, keep original shape for backward compatibility
-    if len(results) == 1:
-        single = results[0]
-        if single.get('success'):
-            return JsonResponse({'success': True, 'resume_id': single.get('resume_id'), 'message': single.get('message')})
-        return JsonResponse({'error': single.get('error')}, status=400)
-    return JsonResponse({'results': results})
 
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def reanalyze_resume(request, resume_id):
+    """Queue a resume for a fresh webhook analysis, even if an identical file was analyzed before"""
+    resume = get_object_or_404(Resume, id=resume_id)
+    if resume.status in ('pending', 'processing'):
+        return JsonResponse({'error': 'Resume is already being analyzed'}, status=409)
+    forget_score(resume.content_hash, current_jd_fingerprint())
+    Resume.objects.filter(id=resume.id).update(status='pending', error_message='', attempts=0, updated_at=timezone.now())
+    transaction.on_commit(analysis_queue.kick)
+    return JsonResponse({
+        'success': True,
+        'resume_id': resume.id,
+        'status_url': resume_status_urls([resume.id])[0],
+        'message': 'Resume queued for analysis',
+    }, status=202)
 
-def sanitize_webhook_analysis(raw):
-    """
-    Normalize various webhook payload shapes into a consistent structure:
-    {
-      analysis_data: { candidate_info, skills, experience, education, summary, recommendations, ... },
-      overall_score: int
-    }
-    """
-    def safe_int(s, default=0):
-        try:
-            if isinstance(s, (int, float)):
-                return int(s)
-            if isinstance(s, str):
-                # handle formats like "40/100" or "40"
-                if '/' in s:
-                    num, denom = s.split('/', 1)
-                    num = int(''.join(ch for ch in num if ch.isdigit()))
-                    denom = int(''.join(ch for ch in denom if ch.isdigit())) or 100
-                    return max(0, min(100, int(round((num / denom) * 100))))
-                return int(''.join(ch for ch in s if ch.isdigit()))
-        except Exception:
-            return default
-        return default
-
-    def parse_skill_score(skill_str):
-        """Parse skill string like 'React JS (80/100)' to extract name and score"""
-        if isinstance(skill_str, dict):
-            name = skill_str.get('name', '')
-            match = skill_str.get('match')
-            if match is not None:
-                return {'name': name, 'match': safe_int(match)}
-            return {'name': name, 'match': None}
-        
-        skill_str = str(skill_str)
-        # Try to extract score from formats like "React JS (80/100)" or "React JS (80)"
-        match = re.search(r'\((\d+)(?:/\d+)?\)', skill_str)
-        if match:
-            score = safe_int(match.group(1))
-            name = re.sub(r'\s*\(\d+(?:/\d+)?\)\s*', '', skill_str).strip()
-            return {'name': name, 'match': score}
-        return {'name': skill_str, 'match': None}
-
-    # If webhook returns array with one item, unwrap
-    if isinstance(raw, list) and len(raw) == 1:
-        raw = raw[0]
-
-    # If wrapped with { "output": {...} }
-    payload = raw.get('output', raw) if isinstance(raw, dict) else {}
-
-    # Extract fields safely
-    candidate_info = payload.get('candidate_info') or {}
-    experience = payload.get('candidate_experience') or payload.get('experience') or []
-    education = payload.get('candidate_education') or payload.get('education') or []
-    skills = payload.get('candidate_skills') or payload.get('skills') or []
-    summary = payload.get('candidate_summary') or payload.get('summary') or ''
-    recommendations = payload.get('recommendations') or ''
-    final_decision = payload.get('final_decision') or {}
-    score = safe_int(final_decision.get('final_score') or payload.get('final_score') or payload.get('skill_match_score') or 0)
-    
-    # Extract additional fields
-    languages = payload.get('candidate_languages_known') or payload.get('languages') or []
-    projects = payload.get('projects_worked_on') or payload.get('projects') or []
-    total_experience = payload.get('cadidate_total_past_experience') or payload.get('candidate_total_past_experience') or payload.get('total_experience') or ''
-    why_hire = payload.get('why_hire_candidate') or ''
-    why_not_hire = payload.get('why_not_hire_candidate') or ''
-    explanation = payload.get('explanation_of_decision') or ''
-
-    # Normalize skills - handle both string format "Skill (80/100)" and object format
-    if isinstance(skills, list):
-        skills_norm = [parse_skill_score(s) for s in skills]
-    else:
-        skills_norm = []
 
-    # Normalize experience
-    if isinstance(experience, list):
-        experience_norm = []
-        for item in experience:
-            if not isinstance(item, dict):
-                continue
-            experience_norm.append({
-                'title': item.get('role') or item.get('title') or '',
-                'company': item.get('place') or item.get('company') or '',
-                'duration': item.get('time_period') or item.get('duration') or '',
-                'description': item.get('description') or ''
-            })
-    else:
-        experience_norm = []
-
-    # Normalize education - handle both array and single object
-    education_norm = []
-    if isinstance(education, list):
-        for edu in education:
-            if isinstance(edu, dict):
-                education_norm.append({
-                    'degree': edu.get('degree') or '',
-                    'university': edu.get('institution') or edu.get('university') or '',
-                    'year': edu.get('year_of_graduation') or edu.get('year') or '',
-                    'description': ', '.join(edu.get('certifications_and_awards', [])) if isinstance(edu.get('certifications_and_awards'), list) else ''
-                })
-    elif isinstance(education, dict) and (education.get('degree') or education.get('institution') or education.get('year_of_graduation')):
-        education_norm.append({
-            'degree': education.get('degree') or '',
-            'university': education.get('institution') or education.get('university') or '',
-            'year': education.get('year_of_graduation') or education.get('year') or '',
-            'description': ''
-        })
+@login_required(login_url='login')
+@require_http_methods(["POST"])
+def rescore_stale_resumes(request):
+    """Queue every analyzed resume scored against an older set of job descriptions"""
+    queued = queue_stale_resumes()
+    if queued:
+        transaction.on_commit(analysis_queue.kick)
+    return JsonResponse({
+        'success': True,
+        'queued': queued,
+        'message': f'{queued} resumes queued for re-scoring',
+    }, status=202)
 
-    # Normalize languages
-    languages_norm = []
-    if isinstance(languages, list):
-        languages_norm = [str(lang) for lang in languages]
-    
-    # Normalize projects
-    projects_norm = []
-    if isinstance(projects, list):
-        projects_norm = [str(proj) for proj in projects]
-
-    sanitized = {
-        'analysis_data': {
-            'candidate_info': {
-                'name': candidate_info.get('name') or '',
-                'email': candidate_info.get('email') or '',
-                'phone_number': candidate_info.get('phone_number') or '',
-                'linkedin_url': candidate_info.get('linkedin_url') or '',
-                'address': candidate_info.get('address') or '',
-                'candidate_applied_for': payload.get('candidate_applied_for') or ''
-            },
-            'summary': summary,
-            'skills': skills_norm,
-            'experience': experience_norm,
-            'education': education_norm,
-            'languages': languages_norm,
-            'projects': projects_norm,
-            'total_experience': total_experience,
-            'recommendations': recommendations,
-            'why_hire': why_hire,
-            'why_not_hire': why_not_hire,
-            'explanation': explanation,
-            'final_decision': final_decision,
-            'needs_human_review': (payload.get('needs_human_review') or '').lower() == 'yes'
-        },
-        'overall_score': score
-    }
-    return sanitized
+
+@login_required(login_url='login')
+@require_http_methods(["GET"])
+def get_resume_statuses(request):
+    """API endpoint to poll the analysis status of uploaded resumes (?ids=1,2,3)"""
+    try:
+        ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of resume ids'}, status=400)
+    if not ids or len(ids) > STATUS_IDS_LIMIT:
+        return JsonResponse({'error': f'Pass between 1 and {STATUS_IDS_LIMIT} resume ids'}, status=400)
+
+    resumes = Resume.objects.filter(id__in=ids).only('id', 'file_name', 'status', 'overall_score', 'error_message')
+    data = [
+        {
+            'id': resume.id,
+            'file_name': resume.file_name,
+            'status': resume.status,
+            'overall_score': resume.overall_score,
+            'error': resume.error_message,
+        }
+        for resume in resumes
+    ]
+    return JsonResponse({
+        'resumes': data,
+        'done': all(r['status'] in ('completed', 'failed') for r in data),
+    })
 
 
 @login_required(login_url='login')
@@ -372,32 +290,28 @@ def upload_job_description(request):
                     'error': 'File was not saved correctly'
                 }, status=500)
             
-            # Read the saved file from disk as binary
-            with open(job_description.file.path, 'rb') as file_on_disk:
-                file_content = file_on_disk.read()
-            
             # Determine content type
             content_type = job_file.content_type or 'application/octet-stream'
             
-            # Prepare file for webhook (send as binary)
-            files = {
-                'file': (job_description.file_name, file_content, content_type)
-            }
             data = {
                 'title': title,
                 'file_name': job_description.file_name,
                 'job_description_id': job_description.id
             }
             
-            # Send to webhook
-            response = requests.post(
+            # Send to webhook, streaming the saved file from disk
+            response = post_webhook_file(
                 webhook_url,
-                files=files,
-                data=data,
+                job_description.file.path,
+                job_description.file_name,
+                content_type,
+                data,
                 timeout=300  # 5 minute timeout for processing
             )
             
             if response.status_code == 200:
+                # Resume scores computed before this job description was indexed are now stale
+                bump_jd_fingerprint()
                 return JsonResponse({
                     'success': True,
                     'job_description_id': job_description.id,
@@ -442,6 +356,7 @@ def delete_job_description(request, job_description_id):
                 os.remove(job_description.file.path)
         # Delete database record
         job_description.delete()
+        bump_jd_fingerprint()
         return JsonResponse({
             'success': True,
             'message': 'Job description deleted successfully'
@@ -559,6 +474,8 @@ def get_resume(request, resume_id):
         'file_name': resume.file_name,
         'upload_date': resume.upload_date.isoformat(),
         'status': resume.status,
+        'error': resume.error_message,
+        'score_stale': is_score_stale(resume, current_jd_fingerprint()),
         'overall_score': resume.overall_score,
         'analysis_data': analysis_data,
         'file_url': file_url,
@@ -572,8 +489,8 @@ def delete_resume(request, resume_id):
     resume = get_object_or_404(Resume, id=resume_id)
     
     try:
-        # Delete file from filesystem
-        if resume.file:
+        # Delete file from filesystem, unless re-uploads of the same PDF still use it
+        if resume.file and not Resume.objects.filter(file=resume.file.name).exclude(id=resume.id).exists():
             if os.path.isfile(resume.file.path):
                 os.remove(resume.file.path)
         
@@ -0,0 +1,110 @@
+"""
+Shared HTTP session for the n8n webhooks.
+
+Every webhook request goes through one keep-alive requests.Session, so
+uploads reuse TCP/TLS connections instead of opening one per file. Each
+webhook URL also has its own limit on simultaneous requests from this
+process (WEBHOOK_CONCURRENCY, falling back to WEBHOOK_DEFAULT_CONCURRENCY).
+Stored files are sent as a streamed multipart body (MultipartFileStream),
+read from disk a chunk at a time while the request goes out.
+"""
+
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_lock = threading.Lock()
+_session = None
+_slots = {}
+
+
+def webhook_concurrency(url):
+    return max(1, getattr(settings, 'WEBHOOK_CONCURRENCY', {}).get(url, settings.WEBHOOK_DEFAULT_CONCURRENCY))
+
+
+def webhook_session():
+    """The process-wide session, with a connection pool as large as the largest webhook concurrency."""
+    global _session
+    with _lock:
+        if _session is None:
+            pool_size = max([settings.WEBHOOK_DEFAULT_CONCURRENCY, *getattr(settings, 'WEBHOOK_CONCURRENCY', {}).values()])
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+@contextmanager
+def webhook_slot(url):
+    """Wait until fewer than webhook_concurrency(url) requests to `url` are in flight."""
+    with _lock:
+        slot = _slots.get(url)
+        if slot is None:
+            slot = _slots[url] = threading.BoundedSemaphore(webhook_concurrency(url))
+    with slot:
+        yield
+
+
+def post_webhook(url, **kwargs):
+    """requests.post() to a webhook through the shared session, within its concurrency limit."""
+    with webhook_slot(url):
+        return webhook_session().post(url, **kwargs)
+
+
+def _quote_param(value):
+    # HTML5 form encoding of Content-Disposition parameters
+    return str(value).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartFileStream:
+    """
+    multipart/form-data body made of plain fields plus one file read from
+    `path` in CHUNK_SIZE pieces as it is sent. It has a length, so requests
+    sends a Content-Length header rather than a chunked body.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, fields, file_field, file_name, path, content_type):
+        self.boundary = uuid.uuid4().hex
+        self.path = path
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        head = []
+        for name, value in fields.items():
+            head.append(
+                f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{_quote_param(name)}"\r\n\r\n'
+                f'{value}\r\n'
+            )
+        head.append(
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{_quote_param(file_field)}"; filename="{_quote_param(file_name)}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        )
+        self._head = ''.join(head).encode()
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self._file_size = os.path.getsize(path)
+
+    def __len__(self):
+        return len(self._head) + self._file_size + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self.path, 'rb') as f:
+            while chunk := f.read(self.CHUNK_SIZE):
+                yield chunk
+        yield self._tail
+
+
+def post_webhook_file(url, path, file_name, content_type, data, **kwargs):
+    """post_webhook() of a stored file as the `file` form field next to the `data` fields, streamed from disk."""
+    body = MultipartFileStream(data, 'file', file_name, path, content_type)
+    headers = {**kwargs.pop('headers', {}), 'Content-Type': body.content_type}
+    return post_webhook(url, data=body, headers=headers, **kwargs)
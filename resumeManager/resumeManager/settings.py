@@ -129,12 +129,37 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Django's default upload handlers, plus a SHA-256 of each file used to spot re-uploaded resumes
+FILE_UPLOAD_HANDLERS = [
+    'manager.uploads.HashingMemoryFileUploadHandler',
+    'manager.uploads.HashingTemporaryFileUploadHandler',
+]
+
 # Webhook and Pinecone Configuration
 JOB_DESCRIPTION_WEBHOOK_URL = os.getenv('JOB_DESCRIPTION_WEBHOOK_URL', 'https://your-webhook-url.com/job-description')
 RESUME_WEBHOOK_URL = os.getenv('RESUME_WEBHOOK_URL', 'https://your-webhook-url.com/resume')
 PINECONE_API_KEY = os.getenv('PINECONE_API_KEY', 'your-pinecone-api-key')
 PINECONE_INDEX_NAME = os.getenv('PINECONE_INDEX_NAME', 'your-index-name')
 
+# Simultaneous requests each process sends to a webhook (connections are kept alive and shared)
+RESUME_WEBHOOK_CONCURRENCY = int(os.getenv('RESUME_WEBHOOK_CONCURRENCY', '4'))
+JOB_DESCRIPTION_WEBHOOK_CONCURRENCY = int(os.getenv('JOB_DESCRIPTION_WEBHOOK_CONCURRENCY', '2'))
+WEBHOOK_DEFAULT_CONCURRENCY = 4
+WEBHOOK_CONCURRENCY = {
+    JOB_DESCRIPTION_WEBHOOK_URL: JOB_DESCRIPTION_WEBHOOK_CONCURRENCY,
+    RESUME_WEBHOOK_URL: RESUME_WEBHOOK_CONCURRENCY,
+}
+
+# Background resume analysis
+# Worker threads per web process (one per concurrent resume webhook call by default);
+# 0 leaves analysis to `manage.py process_resumes`
+RESUME_ANALYSIS_WORKERS = int(os.getenv('RESUME_ANALYSIS_WORKERS', str(RESUME_WEBHOOK_CONCURRENCY)))
+# Seconds the resume webhook may take for one file
+RESUME_WEBHOOK_TIMEOUT = int(os.getenv('RESUME_WEBHOOK_TIMEOUT', '300'))
+# Resumes 'processing' for longer than this (their worker died) are queued again
+RESUME_ANALYSIS_STALE_SECONDS = int(os.getenv('RESUME_ANALYSIS_STALE_SECONDS', '900'))
+RESUME_ANALYSIS_MAX_ATTEMPTS = int(os.getenv('RESUME_ANALYSIS_MAX_ATTEMPTS', '3'))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field